@@ -1,26 +1,153 @@
 __author__ = "Duncan Seibert"
 
+import datetime
+import json
+import os
+import threading
 from collections import Counter
-from typing import NewType
+from typing import Callable, NewType, TypeVar
 
-import mtgsdk
 from mtgsdk import Set
+from mtgsdk.restclient import MtgException
+
+import metrics
 
 Set_code = NewType('Set_code', str)
 Set_name = NewType('Set_Name', str)
 Block = NewType('Block', str)
 Cardname = NewType('Cardname', str)
 Decklist = Counter[Cardname]
+T = TypeVar('T')
 
 
 USEFUL_SUPPLEMENTAL_SET_TYPES = ("reprint", "un", "commander", "planechase", "archenemy", "vanguard", "masters")
 
-ALL_SETS: list[Set] = Set.all()
-CORE_SETS: list[Set] = [set_ for set_ in ALL_SETS if set_.type == 'core']
-EXPERT_SETS: list[Set] = [set_ for set_ in ALL_SETS if set_.type == 'expansion']
-ALL_TRUE_SETS: list[Set] = CORE_SETS + EXPERT_SETS
+DEFAULT_SET_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'set_cache.json')
+SET_CACHE_TTL = datetime.timedelta(days=7)
+SET_RETRY_INTERVAL = datetime.timedelta(minutes=15)  # after a failed refresh, the stale sets are used this long before trying again
+SET_FETCH_TIMEOUT = 60  # seconds. mtgsdk's urlopen has no timeout of its own, so a stalled connection would otherwise hold the lock forever
+
+
+class SetRegistry:
+    """Lazily fetched, disk cached list of every mtgsdk Set.
+    Nothing is fetched until the sets are first asked for. A cache file younger than ttl is used without touching the
+    network, and if the network is unreachable a stale cache file is used rather than failing, without trying again
+    until retry_interval has passed. All callers share a single fetch, even from different threads."""
+
+    def __init__(self, path: str = DEFAULT_SET_CACHE_PATH, ttl: datetime.timedelta = SET_CACHE_TTL,
+                 retry_interval: datetime.timedelta = SET_RETRY_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._sets: list[Set] | None = None
+        self._fetched: datetime.datetime | None = None
+        self._retry_after: datetime.datetime | None = None
+        self._lock = threading.Lock()
+
+    def sets(self) -> list[Set]:
+        if self._sets is not None and not self._expired():
+            return self._sets
+        with self._lock:
+            if self._sets is None:
+                self._load()
+            if self._sets is None or self._expired():
+                try:
+                    self._fetch()
+                except (OSError, MtgException):
+                    if self._sets is None:
+                        raise
+                    self._retry_after = datetime.datetime.now(datetime.timezone.utc) + self.retry_interval
+                    print(f"Couldn't refresh the set list, using the cached copy from {self._fetched:%x} until {self._retry_after:%X} UTC")
+            return self._sets
+
+    def refresh(self) -> list[Set]:
+        """Fetches the set list from mtgsdk, regardless of how fresh the cached copy is"""
+        with self._lock:
+            self._fetch()
+            return self._sets
+
+    def _expired(self) -> bool:
+        # read outside the lock by sets(), so _fetched is always assigned before _sets
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if self._retry_after is not None and now < self._retry_after:
+            return False
+        return now - self._fetched > self.ttl
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        sets = [Set(set_) for set_ in cache['sets']]
+        self._fetched = datetime.datetime.fromisoformat(cache['fetched'])
+        self._sets = sets
+
+    def _fetch(self):
+        with metrics.timed('randard_mtgsdk_seconds', call='Set.all'):
+            sets = _call_with_timeout(Set.all, SET_FETCH_TIMEOUT, 'Set.all')
+        fetched = datetime.datetime.now(datetime.timezone.utc)
+        cache = {'fetched': fetched.isoformat(),
+                 'sets': [{'code': set_.code, 'name': set_.name, 'type': set_.type, 'block': set_.block,
+                           'releaseDate': set_.release_date, 'onlineOnly': set_.online_only} for set_ in sets]}
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(temp_path, self.path)
+        self._fetched, self._retry_after = fetched, None
+        self._sets = sets
+
+
+def _call_with_timeout(func: Callable[[], T], timeout: float, name: str) -> T:
+    """Runs func on a daemon thread, raising TimeoutError if it hasn't returned within timeout seconds.
+    The thread can't be stopped, so it's left to finish or fail on its own"""
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = func()
+        except BaseException as err:
+            outcome['error'] = err
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"{name} didn't return within {timeout} seconds")
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+SET_REGISTRY = SetRegistry()
+
+
+def all_sets() -> list[Set]:
+    return SET_REGISTRY.sets()
+
+
+def core_sets() -> list[Set]:
+    return [set_ for set_ in all_sets() if set_.type == 'core']
+
+
+def expert_sets() -> list[Set]:
+    return [set_ for set_ in all_sets() if set_.type == 'expansion']
+
+
+def all_true_sets() -> list[Set]:
+    return core_sets() + expert_sets()
+
+
+_LAZY_SET_LISTS = {'ALL_SETS': all_sets, 'CORE_SETS': core_sets, 'EXPERT_SETS': expert_sets, 'ALL_TRUE_SETS': all_true_sets}
+
+
+def __getattr__(name):
+    # keeps the old module level set lists working, without fetching anything at import time
+    if name in _LAZY_SET_LISTS:
+        return _LAZY_SET_LISTS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-def sets_in(card_name: str):
-    card = mtgsdk.Card.where(name=card_name).all()
-    return card[0].printings.copy()
+def sets_in(card_name: str) -> list[Set_code]:
+    from card_catalog import get_catalog  # imported here since card_catalog depends on the types defined in this module
+    return sorted(get_catalog().printings(card_name))
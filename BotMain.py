@@ -1,13 +1,19 @@
 import dataclasses
 import datetime
+import sqlite3
 
 import disnake
 from disnake.ext import commands
 
 import quarterly_update
 from RandardBot import RandardBot, UserNotRegisteredError
+from blocking_executor import SLOW_TIMEOUT
 from private_info import TOKEN
+import card_catalog
 import decklist_verification
+import metrics
+import rating_engine
+from standings import LEADERBOARD_PAGE_SIZE, ordinal
 
 
 bot = RandardBot()
@@ -16,13 +22,13 @@ bot.add_cog(quarterly_update.RandardMaintenanceCog(bot))
 
 @bot.slash_command(name='format', description="Displays the current legal sets")
 async def format_command(inter: disnake.AppCommandInteraction):
-    legal_set_names = bot.get_legal_set_names(inter.guild)
+    legal_set_names = await bot.run_blocking(bot.get_legal_set_names, inter.guild)
     await inter.response.send_message("The current Randard sets are:\n" + '\n'.join(set_ for set_ in legal_set_names))
 
 
 @bot.slash_command(description="Gives you a search url for scryfall.com that only shows currently legal cards")
 async def scryfall(inter: disnake.AppCommandInteraction):
-    raw_search_string = bot.scryfall_search(inter.guild)
+    raw_search_string = await bot.run_blocking(bot.scryfall_search, inter.guild)
     url = f'https://scryfall.com/search?q={raw_search_string.replace(" ", "+")}'
     await inter.response.send_message(url)
 
@@ -33,137 +39,182 @@ async def decklist_command(inter: disnake.AppCommandInteraction):
                      "Each line of the file should be one of three things:\n"
                      "    1. A header that reads either 'Deck', 'Maindeck', 'Side', or 'Sideboard', case insensitive.\n"
                      "    2. A blank line\n"
-                     "    3. A number followed by the name of a card (e.g. '4 Llanowar Elves')\n"
+                     "    3. A number followed by the name of a card (e.g. '4 Llanowar Elves'). Arena's set and collector number, like '4 Llanowar Elves (DOM) 168', are fine too.\n"
+                     "I can also read .dek files exported from MTGO and .cod files from Cockatrice.\n"
                      "If your decklist follows that format, but the /verify command still isn't working, double check your spelling.\n"
-                     "All card names must be spelled exactly as they appear on Gatherer, with correct punctuation.\n"
+                     "Card names should be spelled as they appear on Gatherer, but capitalization, accents and punctuation don't matter, and I'll suggest the closest names to any I don't recognize.\n"
                      "For DFCs, only name the front side.\n"
                      "For Split cards, name both sides separated by // (e.g. '3 Alive // Well')")
 
 
-@bot.slash_command(description="Send me a .txt file of your decklist, and I'll verify that it's currently legal for Randard.")
+@bot.slash_command(description="Send me your decklist file, and I'll verify that it's currently legal for Randard.")
 async def verify(inter: disnake.AppCommandInteraction,
-                 decklist_file: disnake.Attachment = commands.Param(description="A .txt file containing the decklist. Use /decklist for more info on the format to use.")):
+                 decklist_file: disnake.Attachment = commands.Param(description="A .txt, MTGO .dek or Cockatrice .cod decklist. Use /decklist for more info on the format to use.")):
     await inter.response.defer(with_message=True)
     f = await decklist_file.read()
     try:
-        f = f.decode()
-    except UnicodeError:
-        await inter.send("Oops, I can't read that. Please send me a .txt file, with utf-8 encoding. Try copying your decklist into Notepad and saving it from there.")
+        catalog = await bot.run_blocking(card_catalog.get_catalog, timeout=SLOW_TIMEOUT)
+    except (FileNotFoundError, card_catalog.CatalogVersionError):
+        await inter.send("Sorry, my card database isn't set up yet, so I can't verify decklists right now.")
         return
-    set_codes = bot.get_legal_set_codes(inter.guild)
+    legal_cards = await bot.run_blocking(bot.get_legal_cards, inter.guild, catalog, timeout=SLOW_TIMEOUT)
     try:
-        decklist = decklist_verification.decklist_parser(f, string=True)
+        decklist = await bot.run_blocking(decklist_verification.decklist_parser, f, string=True, timeout=SLOW_TIMEOUT,
+                                          decklist_format=decklist_verification.decklist_format_for(decklist_file.filename))
     except decklist_verification.DecklistError as err:
-        await inter.send(err.args)
+        await inter.send("There were some problems reading your list:\n" + '\n'.join(err.errors))
         return
 
-    verification = decklist_verification.verify_decklist(*decklist, legal_sets=set_codes)
+    verification = await bot.run_blocking(decklist_verification.verify_decklist, *decklist, legal_cards=legal_cards, catalog=catalog, timeout=SLOW_TIMEOUT)
     if verification is True:
         await inter.send("Verified!")
     else:
         await inter.send("There were some problems with your list:\n" + '\n'.join(verification))
 
 
+@bot.slash_command(name="rebuild_index", description="Reloads the card database and rebuilds this season's list of legal cards")
+@commands.has_permissions(manage_guild=True)
+async def rebuild_index_command(inter: disnake.AppCommandInteraction):
+    await inter.response.defer(with_message=True, ephemeral=True)
+    try:
+        catalog = await bot.run_blocking(card_catalog.reload_catalog, timeout=SLOW_TIMEOUT)
+    except (FileNotFoundError, card_catalog.CatalogVersionError):
+        await inter.send("Sorry, my card database isn't set up yet, so there's nothing to build the index from.")
+        return
+    legal_cards = await bot.run_blocking(bot.build_legality_index, inter.guild, catalog, timeout=SLOW_TIMEOUT)
+    await inter.send(f"Rebuilt the index from {catalog!r}. There are {len(legal_cards)} legal cards this season.")
+
+
+@bot.slash_command(name="recompute_ratings", description="Recalculates this season's ratings from the record of every game played")
+@commands.has_permissions(manage_guild=True)
+async def recompute_ratings_command(inter: disnake.AppCommandInteraction,
+                                    k_factor: float = commands.Param(None, description="Switch this server to a new ELO k factor, 40 by default. Higher k means ratings change faster.")):
+    await inter.response.defer(with_message=True, ephemeral=True)
+    rating_system = rating_engine.Elo(k=k_factor) if k_factor is not None else None
+    games = await bot.run_blocking(bot.recompute_ratings, inter.guild, rating_system, timeout=SLOW_TIMEOUT)
+    switched = f" with a k factor of {k_factor:g}, which this server's games are rated with from now on" if k_factor is not None else ""
+    await inter.send(f"Recomputed everyone's rating from the {games} games played this season{switched}.")
+
+
+GAME_BUTTON_PREFIX = 'randard:game'
+
+
 @dataclasses.dataclass
 class PendingGame:
-    submitter: disnake.Member
-    opponent: disnake.Member
+    """A submitted game waiting on its opponent, as stored in the pending_games table.
+    Only ids are kept, since the buttons that close it can be clicked long after the bot has restarted"""
+    guild_id: int
+    id: int
+    submitter_id: int
+    opponent_id: int
     submitter_games_won: int
     opponent_games_won: int
     ties: int = 0
-    id: int = 0
-    closed: bool = False
+    opponent_channel_id: int | None = None
+    opponent_message_id: int | None = None
+    submitter_token: str | None = dataclasses.field(default=None, repr=False)
+    submitter_message_id: int | None = None
 
-    def __post_init__(self):
-        self.submitter_interaction: disnake.AppCommandInteraction | None = None
-        self.opponent_message: disnake.Message | None = None
+    @classmethod
+    def from_row(cls, guild_id: int, row: sqlite3.Row) -> 'PendingGame':
+        return cls(guild_id, row['game_id'], int(row['submitter_id']), int(row['opponent_id']), row['submitter_games_won'], row['opponent_games_won'],
+                   row['ties'], row['opponent_channel_id'], row['opponent_message_id'], row['submitter_token'], row['submitter_message_id'])
+
+    @property
+    def record(self) -> rating_engine.GameRecord:
+        return rating_engine.GameRecord(str(self.submitter_id), str(self.opponent_id), self.submitter_games_won, self.opponent_games_won, self.ties)
 
     @property
     def summary_string(self):
         ties_substring = f', {self.ties} tie{"s" * (self.ties > 1)}' if self.ties else ''
-        return f"Results: {self.submitter.mention} {self.submitter_games_won}, {self.opponent.mention} {self.opponent_games_won}{ties_substring}"
+        return f"Results: <@{self.submitter_id}> {self.submitter_games_won}, <@{self.opponent_id}> {self.opponent_games_won}{ties_substring}"
+
+    @property
+    def opponent_prompt(self):
+        return f"A game has been submitted listing you as the opponent. {self.summary_string}"
 
     @property
     def total_games(self):
         return self.submitter_games_won + self.opponent_games_won + self.ties
 
-    def __repr__(self):
-        return f"{self.__class__.__name__}(id={self.id}, submitter='{self.submitter.name}', opponent='{self.opponent.name}', submitter_games_won={self.submitter_games_won}, " \
-               f"opponent_games_won={self.opponent_games_won}, ties={self.ties}, closed={self.closed})"
-
-    async def cancel(self):
-        self.closed = True
-        await self.opponent_message.edit(content=f"{self.opponent_message.content}\nThis game has been canceled.", view=None)
-        await self.submitter_interaction.edit_original_message(content=f"{self.opponent_message.content}\nThis game has been canceled.", view=None)
-
-    async def submit(self):
-        if self.closed:
-            raise GameClosedError("That game is closed")
-
-        k = 40  # ELO constant. Higher k means scores change faster, 40 is rather high
-
-        total_games = self.total_games
-        games_won = self.submitter_games_won + (self.ties / 2)
-        games_lost = self.opponent_games_won + (self.ties / 2)
-
-        submitter_rating = bot.get_player_rating(self.submitter)
-        opponent_rating = bot.get_player_rating(self.opponent)
+    def button(self, action: str, label: str, style: disnake.ButtonStyle) -> disnake.ui.Button:
+        return disnake.ui.Button(label=label, style=style, custom_id=f"{GAME_BUTTON_PREFIX}:{action}:{self.guild_id}:{self.id}")
 
-        submitter_expected_score = total_games/(1+10**((opponent_rating-submitter_rating)/400))
-        opponent_expected_score = total_games-submitter_expected_score
-
-        submitter_rating_change = k*(games_won - submitter_expected_score)
-        opponent_rating_change = k*(games_lost - opponent_expected_score)
-
-        submitter_rating += submitter_rating_change
-        opponent_rating += opponent_rating_change
-
-        bot.update_player_rating(self.submitter, submitter_rating)
-        bot.update_player_rating(self.opponent, opponent_rating)
-
-        self.closed = True
-        await self.opponent_message.edit(content=f"{self.opponent_message.content}\nThis game has been tallied.", view=None)
-        await self.submitter_interaction.edit_original_message(content=f"{self.opponent_message.content}\nThis game has been tallied.", view=None)
-
-
-class GameClosedError(ValueError):
-    pass
+    async def edit_opponent_message(self, note: str):
+        if self.opponent_message_id is None:
+            return
+        message = bot.get_partial_messageable(self.opponent_channel_id).get_partial_message(self.opponent_message_id)
+        try:
+            await message.edit(content=f"{self.opponent_prompt}\n{note}", components=[])
+        except disnake.HTTPException:
+            pass  # the opponent deleted the DM
 
+    async def edit_submitter_message(self, note: str):
+        if self.submitter_token is None:
+            return
+        try:
+            await bot.edit_interaction_message(self.submitter_token, self.submitter_message_id, content=f"{self.opponent_prompt}\n{note}", components=[])
+        except disnake.HTTPException:
+            pass  # the token has expired, so the submitter's cancel button stays up and just reports that the game is closed
 
-class GameCommandViewOpponent(disnake.ui.View):
-    def __init__(self, game_submission: PendingGame):
-        super().__init__()
-        self.game = game_submission
 
-    @disnake.ui.button(label="Confirm", style=disnake.ButtonStyle.green)
-    async def confirm(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        print(f"game {self.game.id} confirmed by opponent")
-        try:
-            await self.game.submit()
-        except GameClosedError:
-            await inter.send("That game is closed, either because you already accepted it or canceled it, or it was canceled by the submitter.")
-            return
-        except UserNotRegisteredError as err:
-            await inter.send(err.args[0])
-        await self.game.submitter_interaction.edit_original_message(content=f"{inter.message.content}\nThis game has been submitted.", view=None)
-        results_channel = await bot.get_match_results_channel(self.game.submitter.guild)
-        await results_channel.send(f'A game has been completed!\n {self.game.summary_string}')
+@bot.listen('on_button_click')
+@metrics.instrument('randard_button_seconds', button='game')
+async def game_button(inter: disnake.MessageInteraction):
+    """Handles the buttons on every pending game's messages. They're routed by custom_id instead of a View per game,
+    so they keep working after a restart and nothing is held in memory while a game waits on its opponent"""
+    if not inter.component.custom_id.startswith(f'{GAME_BUTTON_PREFIX}:'):
+        return
+    action, guild_id, game_id = inter.component.custom_id[len(GAME_BUTTON_PREFIX) + 1:].split(':')
+    await inter.response.defer()
+    guild = bot.get_guild(int(guild_id))
+    row = await bot.run_blocking(bot.get_pending_game, guild, int(game_id)) if guild is not None else None
+    if row is None:
+        await inter.edit_original_message(components=[])
+        await inter.send("That game is closed, either because it was already confirmed or canceled, or because it expired.", ephemeral=True)
+        return
+    game = PendingGame.from_row(guild.id, row)
+    if action == 'confirm':
+        await confirm_game(inter, guild, game)
+    else:
+        await cancel_game(inter, guild, game, by_submitter=action == 'withdraw')
 
-    @disnake.ui.button(label="Cancel", style=disnake.ButtonStyle.red)
-    async def cancel(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        print(f"game {self.game.id} canceled by opponent")
-        await self.game.cancel()
 
+async def confirm_game(inter: disnake.MessageInteraction, guild: disnake.Guild, game: PendingGame):
+    print(f"game {game.id} confirmed by opponent")
+    try:
+        submitter = await guild.getch_member(game.submitter_id)
+        opponent = await guild.getch_member(game.opponent_id)
+    except disnake.NotFound:
+        await inter.send("One of you has left the server, so this game can't be recorded.")
+        return
+    try:
+        async with bot.player_locks.hold(submitter, opponent):
+            confirmed = await bot.run_write(bot.confirm_pending_game, submitter, opponent, game.id)
+    except UserNotRegisteredError as err:
+        await inter.send(err.args[0])
+        return
+    if confirmed is None:
+        await inter.send("That game is closed, either because you already accepted it or canceled it, or it was canceled by the submitter.")
+        return
+    metrics.increment('randard_pending_games_total', outcome='confirmed')
+    await inter.edit_original_message(content=f"{game.opponent_prompt}\nThis game has been tallied.", components=[])
+    await game.edit_submitter_message("This game has been submitted.")
+    results_channel = await bot.get_match_results_channel(guild)
+    await results_channel.send(f'A game has been completed!\n {game.summary_string}')
 
-class GameCommandViewSubmitter(disnake.ui.View):
-    def __init__(self, game_submission: PendingGame):
-        super().__init__()
-        self.game = game_submission
 
-    @disnake.ui.button(label="Cancel", style=disnake.ButtonStyle.red)
-    async def cancel(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        print(f"game {self.game.id} canceled by submitter")
-        await self.game.cancel()
+async def cancel_game(inter: disnake.MessageInteraction, guild: disnake.Guild, game: PendingGame, by_submitter: bool):
+    print(f"game {game.id} canceled by {'submitter' if by_submitter else 'opponent'}")
+    if await bot.run_write(bot.cancel_pending_game, guild, game.id) is None:
+        await inter.send("That game is already closed.", ephemeral=True)
+        return
+    metrics.increment('randard_pending_games_total', outcome='withdrawn' if by_submitter else 'canceled')
+    await inter.edit_original_message(content=f"{game.opponent_prompt}\nThis game has been canceled.", components=[])
+    if by_submitter:
+        await game.edit_opponent_message("This game has been canceled.")
+    else:
+        await game.edit_submitter_message("This game has been canceled.")
 
 
 @bot.slash_command(name='game', description="Record a game!")
@@ -173,6 +224,8 @@ async def game_command(inter: disnake.AppCommandInteraction,
                        opponent_score: int = commands.Param(description="How many games your opponent won."),
                        ties: int = commands.Param(0, description="How many games ended in a tie.")):
     print(f"New game created with id: {inter.id}")
+    # deferred, so the pending game's writes can be waited on until they finish rather than timed out halfway
+    await inter.response.defer(ephemeral=True)
     # check roles as a quick catch for unregistered players
     player_role = await bot.get_player_role(inter.guild)
     if player_role not in inter.user.roles:
@@ -185,21 +238,22 @@ async def game_command(inter: disnake.AppCommandInteraction,
         await inter.send("Despite the meme, you can't play yourself", ephemeral=True)
         return
 
-    game_submission = PendingGame(inter.user, opponent, submitter_score, opponent_score, ties, inter.id)
+    game_submission = PendingGame(inter.guild.id, inter.id, inter.user.id, opponent.id, submitter_score, opponent_score, ties)
     print(f"the game looks like {game_submission}")
-    submitter_view = GameCommandViewSubmitter(game_submission)
-    opponent_view = GameCommandViewOpponent(game_submission)
+    await bot.run_write(bot.add_pending_game, inter.guild, game_submission.id, game_submission.record)
 
-    opponent_message = await opponent.send(f"A game has been submitted listing you as the opponent. {game_submission.summary_string}", view=opponent_view)
-    await inter.send("Your opponent has been messaged to verify this game. If you would like to cancel, click this button.", view=submitter_view, ephemeral=True)
-
-    game_submission.submitter_interaction = inter
-    game_submission.opponent_message = opponent_message
+    opponent_message = await opponent.send(game_submission.opponent_prompt,
+                                           components=[game_submission.button('confirm', "Confirm", disnake.ButtonStyle.green),
+                                                       game_submission.button('cancel', "Cancel", disnake.ButtonStyle.red)])
+    await inter.send("Your opponent has been messaged to verify this game. If you would like to cancel, click this button.",
+                     components=[game_submission.button('withdraw', "Cancel", disnake.ButtonStyle.red)], ephemeral=True)
+    submitter_message = await inter.original_message()
+    await bot.run_write(bot.set_pending_game_messages, inter.guild, game_submission.id, opponent_message, inter.token, submitter_message.id)
 
 
 @bot.slash_command(description="Registers you to the Randard league")
 async def register(inter: disnake.AppCommandInteraction):
-    registration = bot.register_player(inter.user)
+    registration = await bot.run_blocking(bot.register_player, inter.user)
     player_role = await bot.get_player_role(inter.guild)
     await inter.user.add_roles(player_role)
     if registration is True:
@@ -212,13 +266,124 @@ async def register(inter: disnake.AppCommandInteraction):
 @bot.slash_command(description="Lets you check your current rating. A rating of 1000 is average")
 async def rating(inter: disnake.AppCommandInteraction):
     try:
-        rating = bot.get_player_rating(inter.user)
+        rating = await bot.run_blocking(bot.get_player_rating, inter.user)
     except UserNotRegisteredError:
         await inter.send("Looks like you haven't registered yet. Use the /register command to register")
         return
     await inter.send(f"{inter.user.mention}, your current rating is {rating}")
 
 
+@bot.slash_command(name='rank', description="Shows where you, or another player, stand on this season's leaderboard")
+async def rank_command(inter: disnake.AppCommandInteraction,
+                       player: disnake.Member = commands.Param(None, description="The player to look up. Defaults to you.")):
+    player = player or inter.user
+    try:
+        rank, total, percentile, rating = await bot.run_blocking(bot.get_rank, player)
+    except UserNotRegisteredError:
+        await inter.send(f"{player.mention} hasn't registered yet.", ephemeral=True)
+        return
+    await inter.send(f"{player.mention} is {ordinal(rank)} of {total} with a rating of {round(rating)}, "
+                     f"ahead of {percentile:.0f}% of the league.", ephemeral=True)
+
+
+LEADERBOARD_BUTTON_PREFIX = 'randard:leaderboard'
+
+
+def leaderboard_message(guild: disnake.Guild, page: list[tuple[str, float]], first_rank: int) -> dict:
+    """The content and buttons for one page of the leaderboard. The Next button carries the rank of the next page's first
+    player and the rating and id of this page's last player, which is all get_leaderboard_page needs to find the next page"""
+    components = []
+    if len(page) == LEADERBOARD_PAGE_SIZE:
+        last_id, last_rating = page[-1]
+        components.append(disnake.ui.Button(label="Next", style=disnake.ButtonStyle.blurple,
+                                            custom_id=f"{LEADERBOARD_BUTTON_PREFIX}:{guild.id}:{first_rank + len(page)}:{last_rating!r}:{last_id}"))
+    if first_rank != 1:
+        components.append(disnake.ui.Button(label="Top", style=disnake.ButtonStyle.gray, custom_id=f"{LEADERBOARD_BUTTON_PREFIX}:{guild.id}:1"))
+    if not page:
+        return {'content': "Nobody has registered yet." if first_rank == 1 else "That's everyone!", 'components': components}
+    lines = [f"{ordinal(first_rank + i)}: <@{discord_id}> ({round(rating)})" for i, (discord_id, rating) in enumerate(page)]
+    return {'content': '\n'.join(lines), 'components': components, 'allowed_mentions': disnake.AllowedMentions.none()}
+
+
+@bot.slash_command(name='leaderboard', description="Shows this season's leaderboard")
+async def leaderboard_command(inter: disnake.AppCommandInteraction):
+    page = await bot.run_blocking(bot.get_leaderboard_page, inter.guild)
+    await inter.send(**leaderboard_message(inter.guild, page, 1))
+
+
+@bot.listen('on_button_click')
+@metrics.instrument('randard_button_seconds', button='leaderboard')
+async def leaderboard_button(inter: disnake.MessageInteraction):
+    """Turns the page of a leaderboard message. Nothing about the message is kept between clicks, see leaderboard_message"""
+    if not inter.component.custom_id.startswith(f'{LEADERBOARD_BUTTON_PREFIX}:'):
+        return
+    guild_id, first_rank, *after = inter.component.custom_id[len(LEADERBOARD_BUTTON_PREFIX) + 1:].split(':')
+    guild = bot.get_guild(int(guild_id))
+    if guild is None:
+        await inter.response.edit_message(components=[])
+        return
+    after = (float(after[0]), after[1]) if after else None
+    page = await bot.run_blocking(bot.get_leaderboard_page, guild, after)
+    await inter.response.edit_message(**leaderboard_message(guild, page, int(first_rank)))
+
+
+def match_record(row) -> str:
+    return f"{row['match_wins']}-{row['match_losses']}-{row['match_draws']}"
+
+
+@bot.slash_command(name='history', description="Shows who won each past season, or the final standings and format of one of them")
+async def history_command(inter: disnake.AppCommandInteraction,
+                          season: int = commands.Param(None, ge=0, description="The number of a past season to look at. Leave it out for a list of past seasons.")):
+    if season is None:
+        seasons = await bot.run_blocking(bot.get_season_history, inter.guild)
+        if not seasons:
+            await inter.send("This is the league's first season, so there's no history yet.")
+            return
+        lines = [f"Season {row['season_number']} ({row['month']} {row['year']}): " +
+                 (f"won by <@{row['winner']}> with a rating of {round(row['rating'])}" if row['winner'] is not None else "no games were played")
+                 for row in seasons]
+        await inter.send("Past seasons:\n" + '\n'.join(lines), allowed_mentions=disnake.AllowedMentions.none())
+        return
+    archived = await bot.run_blocking(bot.get_archived_season, inter.guild, season)
+    if archived is None:
+        await inter.send(f"Season {season} hasn't finished yet, or hasn't happened.", ephemeral=True)
+        return
+    season_row, set_names, standings, players = archived
+    lines = [f"Season {season} ({season_row['month']} {season_row['year']})", f"Format: {', '.join(set_names)}"]
+    if season_row['winner'] is not None:
+        lines.append(f"Winner: <@{season_row['winner']}>")
+    lines += [f"{ordinal(row['place'])}: <@{row['discord_id']}> ({round(row['rating'])}, {match_record(row)})" for row in standings]
+    if players > len(standings):
+        lines.append(f"and {players - len(standings)} more players")
+    await inter.send('\n'.join(lines), allowed_mentions=disnake.AllowedMentions.none())
+
+
+@bot.slash_command(name='stats', description="Shows a player's record over every past season, or the league's records")
+async def stats_command(inter: disnake.AppCommandInteraction,
+                        player: disnake.Member = commands.Param(None, description="The player to look up. Leave it out for the league's records.")):
+    if player is not None:
+        totals = await bot.run_blocking(bot.get_player_totals, player)
+        if totals is None:
+            await inter.send(f"{player.mention} hasn't finished a season yet.", allowed_mentions=disnake.AllowedMentions.none())
+            return
+        await inter.send(f"{player.mention} has finished {totals['seasons']} season{'s' * (totals['seasons'] != 1)}, won {totals['titles']} "
+                         f"and finished in the top 3 {totals['podiums']} time{'s' * (totals['podiums'] != 1)}. Their best finish was "
+                         f"{ordinal(totals['best_place'])} and their best rating {round(totals['best_rating'])}. "
+                         f"Over every past season they've played {totals['matches']} matches, with a record of {match_record(totals)}.",
+                         allowed_mentions=disnake.AllowedMentions.none())
+        return
+    players, sets = await bot.run_blocking(bot.get_league_records, inter.guild)
+    if not players:
+        await inter.send("No season has finished yet, so there are no records.")
+        return
+    lines = ["Most titles:"]
+    lines += [f"<@{row['discord_id']}>: {row['titles']} title{'s' * (row['titles'] != 1)}, {row['podiums']} top 3 finish{'es' * (row['podiums'] != 1)} in {row['seasons']} season{'s' * (row['seasons'] != 1)}"
+              for row in players]
+    lines.append("\nMost played sets:")
+    lines += [f"{row['set_name']}: {row['matches']} matches over {row['seasons']} season{'s' * (row['seasons'] != 1)}" for row in sets]
+    await inter.send('\n'.join(lines), allowed_mentions=disnake.AllowedMentions.none())
+
+
 # @bot.slash_command()
 # async def test_update(inter: disnake.AppCommandInteraction):
 #     if inter.user != bot.owner:
@@ -229,4 +394,5 @@ async def rating(inter: disnake.AppCommandInteraction):
 #     cog: quarterly_update.RandardMaintenanceCog = bot.get_cog("RandardMaintenanceCog")
 #     await cog.quarterly_update(guild)
 
-bot.run(TOKEN)
+if __name__ == '__main__':
+    bot.run(TOKEN)
@@ -1,25 +1,203 @@
+import asyncio
+import contextlib
+import dataclasses
 import datetime
 import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import AsyncIterator, Awaitable, Callable, Iterable, TypeVar
 
 import disnake
 import mtgsdk
 from disnake.ext import commands
 
-from APIutils import Set_name, Set_code
-from private_info import DB_PATH
+from APIutils import Cardname, Set_name, Set_code
+from blocking_executor import BlockingExecutor, DB_TIMEOUT, SLOW_TIMEOUT
+from card_catalog import CardCatalog, CatalogVersionError, get_catalog
+from connection_pool import ConnectionPool
+import metrics
+import private_info
+import season_archive
+import storage
 from format_chooser import generate_format
+from rating_engine import DEFAULT_RATING_SYSTEM, Elo, GameRecord, RatingSystem
+from standings import LEADERBOARD_PAGE_SIZE, Standings
+
+T = TypeVar('T')
+
+LAUNCHED_AT = time.monotonic()  # roughly when the process started, since BotMain imports this module first
+SETUP_CONCURRENCY = 10  # guilds set up at once when the bot starts
+PENDING_GAME_LIFETIME = datetime.timedelta(days=3)  # how long an opponent has to confirm or cancel a submitted game
+
+# Set METRICS_PORT in private_info.py to serve the bot's metrics at http://localhost:<port>/metrics, and METRICS_DUMP_PATH
+# to write them to a json file every minute. PROFILE_COMMANDS is a list of slash command names to run cProfile over,
+# for PROFILE_SAMPLE_RATE of their invocations, saving the profiles in PROFILE_DIR
+METRICS_PORT: int | None = getattr(private_info, 'METRICS_PORT', None)
+METRICS_DUMP_PATH: str | None = getattr(private_info, 'METRICS_DUMP_PATH', None)
+PROFILE_COMMANDS: list[str] = getattr(private_info, 'PROFILE_COMMANDS', [])
+PROFILE_SAMPLE_RATE: float = getattr(private_info, 'PROFILE_SAMPLE_RATE', 0.1)
+PROFILE_DIR: str = getattr(private_info, 'PROFILE_DIR', 'profiles')
 
 
 class UserNotRegisteredError(sqlite3.DatabaseError):
     pass
 
 
+class PlayerLocks:
+    """An asyncio lock per player, so that rating updates for the same player happen one at a time while games between
+    different players go ahead concurrently. Locks are always taken in the same order, so two games can't deadlock
+    each other, and a player's lock is dropped once nobody is holding or waiting on it."""
+
+    def __init__(self):
+        self._locks: dict[tuple[int, int], asyncio.Lock] = {}
+        self._users: Counter[tuple[int, int]] = Counter()
+
+    def __len__(self):
+        return len(self._locks)
+
+    @contextlib.asynccontextmanager
+    async def hold(self, *players: disnake.Member) -> AsyncIterator[None]:
+        keys = sorted({(player.guild.id, player.id) for player in players})
+        acquired = []
+        for key in keys:
+            self._users[key] += 1
+        try:
+            for key in keys:
+                lock = self._locks.setdefault(key, asyncio.Lock())
+                await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+            for key in keys:
+                self._users[key] -= 1
+                if not self._users[key]:
+                    del self._users[key]
+                    del self._locks[key]
+
+
+def scryfall_query(set_codes: Iterable[Set_code]) -> str:
+    """A scryfall.com search string that only matches cards printed in the given sets"""
+    return f'(s:{ " or s:".join(set_ for set_ in set_codes)})'
+
+
+@dataclasses.dataclass(frozen=True)
+class SeasonInfo:
+    """A guild's season as stored in the seasons and season_sets tables, parsed once and cached by RandardBot.get_season"""
+    season_number: int
+    month: str
+    year: int
+    set_codes: tuple[Set_code, ...]
+    set_names: tuple[Set_name, ...]
+    legal_sets: frozenset[Set_code] = dataclasses.field(init=False, repr=False)
+    scryfall_query: str = dataclasses.field(init=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'legal_sets', frozenset(code.upper() for code in self.set_codes))
+        object.__setattr__(self, 'scryfall_query', scryfall_query(self.set_codes))
+
+
+@metrics.instrument_methods('randard_db_seconds')
 class RandardBot(commands.Bot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.db_pool = ConnectionPool()
+        self.db_path: str = storage.DB_PATH  # the directory prefix the databases are stored under
+        self.blocking = BlockingExecutor()
+        # guild id -> (season number, catalog build time, legal card names) for each guild's current season
+        self._legality_indexes: dict[int, tuple[int, str, frozenset[Cardname]]] = {}
+        self.rating_system: RatingSystem = DEFAULT_RATING_SYSTEM  # for every guild that hasn't switched to its own, see get_rating_system
+        self.player_locks = PlayerLocks()
+        self._checked_schemas: set[str] = set()  # database files whose schema is known to be up to date
+        # database file -> lock held while guilds are migrated into it and its schema is created, see _setup_database
+        self._schema_locks: dict[str, threading.Lock] = {}
+        self._set_up_guilds: set[int] = set()  # so that on_ready, which runs again whenever the gateway reconnects, only sets up new guilds
+        # guild id -> role or channel name -> its id, see _guild_resource
+        self._guild_resources: dict[int, dict[str, int]] = {}
+        self._resource_locks: dict[int, asyncio.Lock] = {}
+        self.startup_seconds: float | None = None
+        self._seasons: dict[int, SeasonInfo] = {}  # guild id -> current season, see get_season
+        self._seasons_lock = threading.Lock()
+        self._standings: dict[int, Standings] = {}  # guild id -> every player's rating, see get_standings
+        self._standings_lock = threading.Lock()
+        self._command_starts: dict[int, float] = {}  # interaction id -> when its slash command was invoked
+        self.profiler = metrics.CommandProfiler(PROFILE_COMMANDS, PROFILE_SAMPLE_RATE, PROFILE_DIR)
+        self._metrics_tasks: list[asyncio.Task] = []
+        self.before_slash_command_invoke(self._before_slash_command)
+        self.after_slash_command_invoke(self._after_slash_command)
+
+    async def close(self):
+        for task in self._metrics_tasks:
+            task.cancel()
+        await super().close()
+        self.blocking.shutdown()
+        self.db_pool.close_all()
+
+    async def run_blocking(self, func: Callable[..., T], *args, timeout: float | None = DB_TIMEOUT, **kwargs) -> T:
+        """Awaits a blocking call, like any of the database methods below, on the bot's worker threads instead of the event loop.
+        Raises asyncio.TimeoutError if it takes longer than timeout seconds"""
+        return await self.blocking.run(func, *args, timeout=timeout, **kwargs)
+
+    async def run_write(self, func: Callable[..., T], *args, timeout: float | None = SLOW_TIMEOUT, **kwargs) -> T:
+        """Awaits a blocking database write that must not be abandoned halfway, see BlockingExecutor.run_write.
+        Only for interactions that have already been deferred, since it can take longer than discord waits for a response"""
+        return await self.blocking.run_write(func, *args, timeout=timeout, **kwargs)
+
+    async def on_slash_command_error(self, interaction: disnake.ApplicationCommandInteraction, exception: commands.CommandError):
+        if isinstance(getattr(exception, 'original', exception), asyncio.TimeoutError):
+            await interaction.send("Sorry, that took too long. Please try again in a moment.", ephemeral=True)
+            return
+        await super().on_slash_command_error(interaction, exception)
+
+    async def _before_slash_command(self, inter: disnake.ApplicationCommandInteraction):
+        self._command_starts[inter.id] = time.perf_counter()
+        self.profiler.start(inter.id, inter.application_command.qualified_name)
+
+    async def _after_slash_command(self, inter: disnake.ApplicationCommandInteraction):
+        """Records how long every slash command took, whether or not it succeeded"""
+        self.profiler.stop(inter.id)
+        start = self._command_starts.pop(inter.id, None)
+        if start is not None:
+            metrics.observe('randard_command_seconds', time.perf_counter() - start, command=inter.application_command.qualified_name,
+                            outcome='error' if inter.command_failed else 'ok')
+
+    async def _start_metrics(self):
+        self._metrics_tasks.append(asyncio.create_task(metrics.monitor_event_loop()))
+        if METRICS_DUMP_PATH:
+            self._metrics_tasks.append(asyncio.create_task(metrics.dump_periodically(METRICS_DUMP_PATH)))
+        if METRICS_PORT:
+            try:
+                await metrics.serve(METRICS_PORT)
+            except OSError as err:
+                print(f"Couldn't serve metrics on port {METRICS_PORT}: {err}")
+
     async def on_ready(self):
         today = datetime.date.today()
-        for guild in self.guilds:
-            await self._setup(guild, date=today)
-        print("All guilds set up and good to go!")
+        if self.startup_seconds is None:
+            await self._start_metrics()
+            try:
+                print(f"Loaded {await self.run_blocking(get_catalog, timeout=SLOW_TIMEOUT)!r}")
+            except (FileNotFoundError, CatalogVersionError) as err:
+                print(f"Card catalog unavailable, /verify will not work until it is built with card_catalog.py: {err}")
+        semaphore = asyncio.Semaphore(SETUP_CONCURRENCY)
+
+        async def setup(guild: disnake.Guild):
+            async with semaphore:
+                await self._setup(guild, date=today)
+
+        guilds = [guild for guild in self.guilds if guild.id not in self._set_up_guilds]
+        results = await asyncio.gather(*(setup(guild) for guild in guilds), return_exceptions=True)
+        for guild, result in zip(guilds, results):
+            if isinstance(result, Exception):
+                print(f"Setting up {guild.name} with id {guild.id} failed, it will be retried when the bot next reconnects: {result!r}")
+        if self.startup_seconds is None:
+            self.startup_seconds = time.monotonic() - LAUNCHED_AT
+            metrics.observe('randard_startup_seconds', self.startup_seconds)
+            print(f"All guilds set up and good to go! {len(guilds)} guilds set up {self.startup_seconds:.2f}s after launch")
+        elif guilds:
+            print(f"Reconnected and set up {len(guilds)} new guilds")
 
     async def on_guild_join(self, guild: disnake.Guild):
         print(f"joined {guild.name} with id {guild.id}")
@@ -30,98 +208,327 @@ class RandardBot(commands.Bot):
         Also populates seasons with an initial, 0th season if necessary, and posts that to the announcements channel.
         Also ensures that the Players role and announcements channel exist, bot will create the match-results channel when the first game is completed.
         """
-        db_path = self._database_for(guild)
+        new_format = await self.run_blocking(self._setup_database, guild, date, timeout=SLOW_TIMEOUT)
         player_role = await self.get_player_role(guild)
         announcements_channel = await self.get_announcements_channel(guild)
-        with sqlite3.connect(db_path) as con:
-            con.row_factory = sqlite3.Row
-            cur = con.execute("SELECT * FROM sqlite_schema WHERE type='table'")
-            tables: list[sqlite3.Row] = cur.fetchall()
-            table_names: list[str] = [table['name'] for table in tables]
-            if 'players' not in table_names:
-                # only creates the table, it must be populated by players using the /register command
-                con.execute("CREATE TABLE players(discord_id TEXT UNIQUE, name TEXT, discriminator TEXT, registration_date TEXT, rating INT DEFAULT 1000, last_game TEXT DEFAULT null)")
-            if 'seasons' not in table_names:
-                # creates the table, and populates it with an initial season
-                con.execute("CREATE TABLE seasons(season_number INTEGER PRIMARY KEY, month TEXT, year INT, set_names TEXT, set_codes TEXT, winner TEXT DEFAULT null)")
-                new_format = generate_format()
-                set_codes = self.codes_string(new_format)
-                set_names = self.names_string(new_format)
-                # this INSERT INTO can't just defer to self.store_format because it sets the season_number to 0
-                con.execute("INSERT INTO seasons(season_number, month, year, set_names, set_codes) VALUES (0, ?, ?, ?, ?)", [f'{date:%B}', date.year, set_names, set_codes])
-
-                announcement_header = f"Attention {player_role.mention}s! Welcome to the preliminary season of Randard! Your legal sets for this season are:\n"
-                format_message = '\n'.join(f'    {set_.name}' for set_ in new_format)
-                signoff = '\nHappy Deckbuilding!'
-                await announcements_channel.send(announcement_header + format_message + signoff)
 
-    @staticmethod
-    def _database_for(guild: disnake.Guild) -> str:
-        """Returns the filepath to the server-specific database for the given server.
+        # the announcement is sent after the transaction is committed, so the connection isn't held across an await
+        if new_format is not None:
+            announcement_header = f"Attention {player_role.mention}s! Welcome to the preliminary season of Randard! Your legal sets for this season are:\n"
+            format_message = '\n'.join(f'    {set_.name}' for set_ in new_format)
+            signoff = '\nHappy Deckbuilding!'
+            await announcements_channel.send(announcement_header + format_message + signoff)
+        self._set_up_guilds.add(guild.id)
+
+    def _setup_database(self, guild: disnake.Guild, date: datetime.date) -> list[mtgsdk.Set] | None:
+        """The blocking part of _setup. Migrates the guild's database from before guild_id keyed tables if it has one, and makes
+        sure the schema exists, which for a consolidated database only has to be checked once.
+        Returns the format of the newly created 0th season, or None if the guild already had a season"""
+        path = self._database_for(guild)
+        legacy_path = storage.legacy_database_path(guild.id, self.db_path)
+        # guilds are set up several at a time, and with a consolidated database they'd all be migrated into the same file,
+        # so migrations and schema creation for a file run one at a time
+        with self._schema_locks.setdefault(path, threading.Lock()):
+            if legacy_path not in self._checked_schemas:
+                if storage.is_legacy_database(legacy_path):
+                    self.db_pool.close(legacy_path)  # it's about to be moved
+                migrated_players = storage.upgrade_legacy_database(guild.id, self.db_path)
+                if migrated_players:
+                    print(f"migrated {migrated_players} players from {guild.name}'s old database")
+            if path not in self._checked_schemas:
+                with self._connect(guild) as con:
+                    storage.ensure_schema(con)
+                self._checked_schemas.add(path)
+        new_format = None
+        with self._connect(guild) as con:
+            has_season = con.execute("SELECT 1 FROM seasons WHERE guild_id=?", [guild.id]).fetchone() is not None
+            resources = con.execute("SELECT name, resource_id FROM guild_resources WHERE guild_id=?", [guild.id]).fetchall()
+        self._guild_resources[guild.id] = {row['name']: row['resource_id'] for row in resources}
+        if not has_season:
+            # picked before the transaction, since it can fetch the set list and takes a while, and with a consolidated
+            # database the connection is shared by every guild
+            new_format = generate_format()
+            with self._connect(guild) as con:
+                if con.execute("SELECT 1 FROM seasons WHERE guild_id=?", [guild.id]).fetchone() is not None:
+                    return None
+                # populates the guild's initial season
+                self._insert_season(con, guild.id, date, new_format)
+                # the current season is taken to be this quarter's, so a guild never rolls over the day it's set up
+                con.execute("INSERT INTO rollovers(guild_id, quarter, new_season_number, announced) VALUES (?, ?, 0, 1)", [guild.id, self.quarter_of(date)])
+        if new_format is not None:
+            self._forget_season(guild)
+            self._try_build_legality_index(guild)
+        return new_format
+
+    def _database_for(self, guild: disnake.Guild) -> str:
+        """Returns the filepath to the database holding the given server's rows, which is either its own or the one shared
+        by every server, depending on storage.CONSOLIDATED_DB
         """
-        return f"{DB_PATH}Randard_{guild.id}.db"
+        return storage.database_path(guild.id, self.db_path)
 
-    @staticmethod
-    async def get_player_role(guild: disnake.Guild) -> disnake.Role:
-        for role in guild.roles:
-            if role.name.lower() == 'player':
-                return role
-        return await guild.create_role(name="Player", colour=disnake.Colour.random(), hoist=True, mentionable=True)
+    def _connect(self, guild: disnake.Guild):
+        """Returns a context manager for a transaction on the pooled connection to the given guild's database"""
+        return self.db_pool.connection(self._database_for(guild))
+
+    def _cached_resource(self, guild: disnake.Guild, name: str, get: Callable[[int], T | None]) -> T | None:
+        resource_id = self._guild_resources.get(guild.id, {}).get(name)
+        if resource_id is None:
+            return None
+        return get(resource_id)  # None if it's been deleted without the bot seeing the event
+
+    async def _guild_resource(self, guild: disnake.Guild, name: str, candidates: list[T], get: Callable[[int], T | None],
+                              create: Callable[[], Awaitable[T]]) -> T:
+        """Returns the guild's role or channel called name. Its id is kept in memory and in the guild_resources table, so
+        after the first lookup finding it is a dict lookup. Otherwise candidates are searched for it by name, and if it isn't
+        there it's made with create. Only one search or creation runs per guild at a time, so concurrent commands can't
+        create duplicates"""
+        resource = self._cached_resource(guild, name, get)
+        if resource is not None:
+            return resource
+        async with self._resource_locks.setdefault(guild.id, asyncio.Lock()):
+            # whoever held the lock may have just found or created it
+            resource = self._cached_resource(guild, name, get)
+            if resource is not None:
+                return resource
+            for candidate in candidates:
+                if candidate.name.lower() == name:
+                    resource = candidate
+                    break
+            else:
+                resource = await create()
+            self._guild_resources.setdefault(guild.id, {})[name] = resource.id
+            await self.run_blocking(self.store_guild_resource, guild, name, resource.id)
+        return resource
+
+    def store_guild_resource(self, guild: disnake.Guild, name: str, resource_id: int):
+        with self._connect(guild) as con:
+            con.execute("INSERT OR REPLACE INTO guild_resources(guild_id, name, resource_id) VALUES (?, ?, ?)", [guild.id, name, resource_id])
+
+    def forget_guild_resource(self, guild: disnake.Guild, name: str):
+        with self._connect(guild) as con:
+            con.execute("DELETE FROM guild_resources WHERE guild_id=? AND name=?", [guild.id, name])
+
+    async def _forget_deleted_resource(self, guild: disnake.Guild, resource_id: int):
+        resources = self._guild_resources.get(guild.id, {})
+        for name, cached_id in list(resources.items()):
+            if cached_id == resource_id:
+                del resources[name]
+                await self.run_blocking(self.forget_guild_resource, guild, name)
+
+    async def on_guild_role_delete(self, role: disnake.Role):
+        await self._forget_deleted_resource(role.guild, role.id)
+
+    async def on_guild_channel_delete(self, channel: disnake.abc.GuildChannel):
+        await self._forget_deleted_resource(channel.guild, channel.id)
+
+    async def get_player_role(self, guild: disnake.Guild) -> disnake.Role:
+        return await self._guild_resource(guild, 'player', guild.roles, guild.get_role,
+                                          lambda: guild.create_role(name="Player", colour=disnake.Colour.random(), hoist=True, mentionable=True))
 
     async def get_match_results_channel(self, guild: disnake.Guild) -> disnake.TextChannel:
-        for channel in guild.channels:
-            if channel.name.lower() == 'match-results':
-                return channel
-        permissions = {role: disnake.PermissionOverwrite(send_messages=False) for role in guild.roles}
-        permissions[self.user] = disnake.PermissionOverwrite(send_messages=True)
-        return await guild.create_text_channel('match-results', topic='The bot posts verified game results here',
-                                               overwrites=permissions)
+        def create():
+            permissions = {role: disnake.PermissionOverwrite(send_messages=False) for role in guild.roles}
+            permissions[self.user] = disnake.PermissionOverwrite(send_messages=True)
+            return guild.create_text_channel('match-results', topic='The bot posts verified game results here',
+                                             overwrites=permissions)
+        return await self._guild_resource(guild, 'match-results', guild.channels, guild.get_channel, create)
 
     async def get_announcements_channel(self, guild: disnake.Guild) -> disnake.TextChannel:
-        for channel in guild.channels:
-            if channel.name.lower() == 'announcements':
-                return channel
-        permissions = {role: disnake.PermissionOverwrite(send_messages=False) for role in guild.roles}
-        permissions[self.user] = disnake.PermissionOverwrite(send_messages=True)
-        return await guild.create_text_channel('Announcements',
-                                               topic='Season standings and new season announcements are posted here by the bot.',
-                                               overwrites=permissions)
+        def create():
+            permissions = {role: disnake.PermissionOverwrite(send_messages=False) for role in guild.roles}
+            permissions[self.user] = disnake.PermissionOverwrite(send_messages=True)
+            return guild.create_text_channel('Announcements',
+                                             topic='Season standings and new season announcements are posted here by the bot.',
+                                             overwrites=permissions)
+        return await self._guild_resource(guild, 'announcements', guild.channels, guild.get_channel, create)
 
     def register_player(self, member: disnake.Member) -> bool | sqlite3.Row:
         datetime_date: datetime.date | None = None
-        with sqlite3.connect(self._database_for(member.guild)) as con:
-            con.row_factory = sqlite3.Row
+        with self._connect(member.guild) as con:
             try:
-                con.execute(
-                    "INSERT INTO players(discord_id, name, discriminator, registration_date) VALUES (?, ?, ?, ?)",
-                    [member.id, member.name, member.discriminator, str(datetime.date.today())])
+                rating = con.execute(
+                    "INSERT INTO players(guild_id, discord_id, name, discriminator, registration_date, rating) VALUES (?, ?, ?, ?, ?, ?) RETURNING rating",
+                    [member.guild.id, member.id, member.name, member.discriminator, str(datetime.date.today()),
+                     self._rating_system(con, member.guild.id).starting_rating]).fetchone()['rating']
             except sqlite3.IntegrityError:
-                cur = con.execute("SELECT * FROM players WHERE discord_id = ?", [member.id])
+                cur = con.execute("SELECT * FROM players WHERE guild_id=? AND discord_id=?", [member.guild.id, member.id])
                 return cur.fetchone()
+        self._update_standings(member.guild, {member.id: rating})
         return True
 
-
-
     def store_format(self, mtg_format: list[mtgsdk.Set], guild: disnake.Guild):
         """Stores the given format as the new season of the given guild's database"""
         today = datetime.date.today()
-        names = self.names_string(mtg_format)
-        codes = self.codes_string(mtg_format)
-        with sqlite3.connect(self._database_for(guild)) as con:
-            con.execute("INSERT INTO seasons(month, year, set_names, set_codes) VALUES (?, ?, ?, ?)", [f"{today:%B}", today.year, names, codes])
-
-    def update_player_rating(self, player: disnake.Member, new_rating: int):
-        """Update's a player's entry in the database with a new rating"""
-        with sqlite3.connect(self._database_for(player.guild)) as con:
-            cur = con.execute("UPDATE players SET rating=? WHERE discord_id=?", [player.id])
-            if cur.rowcount == 0:
+        with self._connect(guild) as con:
+            self._insert_season(con, guild.id, today, mtg_format)
+        self._forget_season(guild)
+        self._try_build_legality_index(guild)
+
+    @staticmethod
+    def _insert_season(con: sqlite3.Connection, guild_id: int, date: datetime.date, mtg_format: list[mtgsdk.Set]) -> int:
+        """Adds the guild's next season, numbered from 0, and returns its number"""
+        season_number = con.execute("INSERT INTO seasons(guild_id, season_number, month, year) "
+                                    "VALUES (?, (SELECT COALESCE(MAX(season_number) + 1, 0) FROM seasons WHERE guild_id=?), ?, ?) RETURNING season_number",
+                                    [guild_id, guild_id, f"{date:%B}", date.year]).fetchone()[0]
+        con.executemany("INSERT INTO season_sets(guild_id, season_number, position, set_code, set_name) VALUES (?, ?, ?, ?, ?)",
+                        [(guild_id, season_number, position, set_.code, set_.name) for position, set_ in enumerate(mtg_format)])
+        return season_number
+
+    def build_legality_index(self, guild: disnake.Guild, catalog: CardCatalog | None = None) -> frozenset[Cardname]:
+        """Computes the names of every card legal in the guild's current season from the card catalog, and stores them
+        in the legal_cards table, so that /verify only has to check each card's membership in that set.
+        Needs to be rebuilt whenever the card catalog changes; get_legal_cards does that automatically."""
+        if catalog is None:
+            catalog = get_catalog()
+        season = self.get_season(guild)
+        legal_cards = catalog.legal_cards(season.legal_sets)
+        with self._connect(guild) as con:
+            con.execute("DELETE FROM legal_cards WHERE guild_id=? AND season_number=?", [guild.id, season.season_number])
+            con.executemany("INSERT INTO legal_cards(guild_id, season_number, card_name) VALUES (?, ?, ?)",
+                            [(guild.id, season.season_number, card_name) for card_name in legal_cards])
+            con.execute("INSERT OR REPLACE INTO legality_indexes(guild_id, season_number, catalog_built) VALUES (?, ?, ?)",
+                        [guild.id, season.season_number, catalog.built])
+        self._legality_indexes[guild.id] = (season.season_number, catalog.built, legal_cards)
+        return legal_cards
+
+    def _try_build_legality_index(self, guild: disnake.Guild):
+        try:
+            self.build_legality_index(guild)
+        except (FileNotFoundError, CatalogVersionError):
+            pass  # no catalog to build it from yet, get_legal_cards will build it once there is one
+
+    def get_legal_cards(self, guild: disnake.Guild, catalog: CardCatalog | None = None) -> frozenset[Cardname]:
+        """Returns the names of every card legal in the guild's current season, from memory if possible, otherwise from
+        the legal_cards table. The index is rebuilt if it is missing or was built from a different card catalog"""
+        if catalog is None:
+            catalog = get_catalog()
+        season_number = self.get_season_number(guild)
+        cached = self._legality_indexes.get(guild.id)
+        if cached is not None and cached[:2] == (season_number, catalog.built):
+            return cached[2]
+        with self._connect(guild) as con:
+            index = con.execute("SELECT catalog_built FROM legality_indexes WHERE guild_id=? AND season_number=?", [guild.id, season_number]).fetchone()
+            if index is None or index['catalog_built'] != catalog.built:
+                legal_cards = None
+            else:
+                cur = con.execute("SELECT card_name FROM legal_cards WHERE guild_id=? AND season_number=?", [guild.id, season_number])
+                legal_cards = frozenset(row['card_name'] for row in cur)
+        if legal_cards is None:
+            return self.build_legality_index(guild, catalog)
+        self._legality_indexes[guild.id] = (season_number, catalog.built, legal_cards)
+        return legal_cards
+
+    def _record_game(self, con: sqlite3.Connection, submitter: disnake.Member, opponent: disnake.Member, game: GameRecord) -> tuple[float, float]:
+        """Adds a game to the games table and applies it to both players' ratings, as part of con's transaction.
+        The ratings each player had going into the game are stored with it. Returns the submitter's and opponent's new ratings"""
+        ratings = {}
+        for player in (submitter, opponent):
+            row = con.execute("SELECT rating FROM players WHERE guild_id=? AND discord_id=?", [player.guild.id, player.id]).fetchone()
+            if row is None:
                 raise UserNotRegisteredError(f"The player {player.name} with id {player.id} is not registered in the database.")
+            ratings[player.id] = row['rating']
+        new_ratings = self._rating_system(con, submitter.guild.id).rate(ratings[submitter.id], ratings[opponent.id], game)
+        today = str(datetime.date.today())
+        guild_id = submitter.guild.id
+        con.execute("INSERT INTO games(guild_id, season_number, date, submitter_id, opponent_id, submitter_games_won, opponent_games_won, ties, submitter_rating, opponent_rating) "
+                    "VALUES (?, (SELECT MAX(season_number) FROM seasons WHERE guild_id=?), ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [guild_id, guild_id, today, game.submitter_id, game.opponent_id, game.submitter_games_won, game.opponent_games_won, game.ties,
+                     ratings[submitter.id], ratings[opponent.id]])
+        con.executemany("UPDATE players SET rating=?, last_game=? WHERE guild_id=? AND discord_id=?",
+                        [(new_ratings[0], today, guild_id, submitter.id), (new_ratings[1], today, guild_id, opponent.id)])
+        return new_ratings
+
+    def add_pending_game(self, guild: disnake.Guild, game_id: int, game: GameRecord, expires: datetime.datetime | None = None):
+        """Stores a submitted game until its opponent confirms or cancels it, or until it expires"""
+        if expires is None:
+            expires = datetime.datetime.now(datetime.timezone.utc) + PENDING_GAME_LIFETIME
+        with self._connect(guild) as con:
+            con.execute("INSERT INTO pending_games(game_id, guild_id, submitter_id, opponent_id, submitter_games_won, opponent_games_won, ties, expires) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [game_id, guild.id, game.submitter_id, game.opponent_id, game.submitter_games_won, game.opponent_games_won, game.ties, expires.isoformat()])
+
+    def set_pending_game_messages(self, guild: disnake.Guild, game_id: int, opponent_message: disnake.Message, submitter_token: str, submitter_message_id: int):
+        """Records where a pending game's messages were sent, so they can be edited once the game is closed, even after a restart.
+        The submitter's message is ephemeral, so it can only be edited with the interaction token, which discord honors for 15 minutes"""
+        with self._connect(guild) as con:
+            con.execute("UPDATE pending_games SET opponent_channel_id=?, opponent_message_id=?, submitter_token=?, submitter_message_id=? WHERE game_id=? AND guild_id=?",
+                        [opponent_message.channel.id, opponent_message.id, submitter_token, submitter_message_id, game_id, guild.id])
+
+    def get_pending_game(self, guild: disnake.Guild, game_id: int) -> sqlite3.Row | None:
+        with self._connect(guild) as con:
+            return con.execute("SELECT * FROM pending_games WHERE game_id=? AND guild_id=?", [game_id, guild.id]).fetchone()
+
+    def confirm_pending_game(self, submitter: disnake.Member, opponent: disnake.Member, game_id: int) -> sqlite3.Row | None:
+        """Removes a pending game and records it, in one transaction, so a game can only ever be confirmed once and stays
+        pending if recording it fails. Returns the pending game, or None if it was already confirmed, canceled or expired"""
+        with self._connect(submitter.guild) as con:
+            pending = con.execute("DELETE FROM pending_games WHERE game_id=? AND guild_id=? RETURNING *", [game_id, submitter.guild.id]).fetchone()
+            if pending is None:
+                return None
+            game = GameRecord(pending['submitter_id'], pending['opponent_id'], pending['submitter_games_won'], pending['opponent_games_won'], pending['ties'])
+            new_ratings = self._record_game(con, submitter, opponent, game)
+        self._update_standings(submitter.guild, dict(zip((submitter.id, opponent.id), new_ratings)))
+        return pending
+
+    def cancel_pending_game(self, guild: disnake.Guild, game_id: int) -> sqlite3.Row | None:
+        """Removes a pending game without recording it. Returns the pending game, or None if it was already closed"""
+        with self._connect(guild) as con:
+            return con.execute("DELETE FROM pending_games WHERE game_id=? AND guild_id=? RETURNING *", [game_id, guild.id]).fetchone()
+
+    def expire_pending_games(self, guild: disnake.Guild, now: datetime.datetime | None = None) -> list[sqlite3.Row]:
+        """Removes every pending game in the guild that has expired, in one statement, and returns them"""
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+        with self._connect(guild) as con:
+            return con.execute("DELETE FROM pending_games WHERE guild_id=? AND expires <= ? RETURNING *", [guild.id, now.isoformat()]).fetchall()
+
+    async def edit_interaction_message(self, token: str, message_id: int, **fields):
+        """Edits a message sent in response to an interaction, given only the interaction's token, e.g. an ephemeral message
+        sent before a restart. Raises disnake.HTTPException once the token has expired"""
+        webhook = disnake.Webhook.from_state({'id': self.application_id, 'type': disnake.WebhookType.application.value, 'token': token}, self._connection)
+        await webhook.edit_message(message_id, **fields)
+
+    def get_rating_system(self, guild: disnake.Guild) -> RatingSystem:
+        """Returns the rating system the guild's games are rated with"""
+        with self._connect(guild) as con:
+            return self._rating_system(con, guild.id)
+
+    def _rating_system(self, con: sqlite3.Connection, guild_id: int) -> RatingSystem:
+        """The rating system the guild's games are rated with: the bot's own, unless the guild switched to a different k factor
+        with recompute_ratings. Read as part of con's transaction, so it can't change partway through rating a game"""
+        row = con.execute("SELECT k FROM rating_systems WHERE guild_id=?", [guild_id]).fetchone()
+        return self.rating_system if row is None else Elo(k=row['k'])
+
+    def recompute_ratings(self, guild: disnake.Guild, rating_system: Elo | None = None) -> int:
+        """Recalculates every player's rating for the current season from scratch, by replaying the season's games from the
+        games table in order. Use after fixing a bad game, or with a new rating_system (e.g. a different k) to switch the guild over to it.
+        The guild's later games are rated with it too, and it's stored in the rating_systems table so it outlasts a restart. Other guilds are unaffected.
+        Returns the number of games replayed"""
+        with self._connect(guild) as con:
+            if rating_system is None:
+                rating_system = self._rating_system(con, guild.id)
+            else:
+                con.execute("INSERT OR REPLACE INTO rating_systems(guild_id, k) VALUES (?, ?)", [guild.id, rating_system.k])
+            cur = con.execute("SELECT game_id, submitter_id, opponent_id, submitter_games_won, opponent_games_won, ties FROM games "
+                              "WHERE guild_id=? AND season_number=(SELECT MAX(season_number) FROM seasons WHERE guild_id=?) ORDER BY game_id", [guild.id, guild.id])
+            game_ids = []
+            games = []
+            for row in cur:
+                game_ids.append(row['game_id'])
+                games.append(GameRecord(row['submitter_id'], row['opponent_id'], row['submitter_games_won'], row['opponent_games_won'], row['ties']))
+            # the ratings each pair went into each game with are rewritten too, so the stored history matches the new ratings
+            ratings, starting_ratings = rating_system.replay(games)
+            con.executemany("UPDATE games SET submitter_rating=?, opponent_rating=? WHERE game_id=?",
+                            [(*starting, game_id) for starting, game_id in zip(starting_ratings, game_ids)])
+            con.execute("UPDATE players SET rating=? WHERE guild_id=?", [rating_system.starting_rating, guild.id])
+            con.executemany("UPDATE players SET rating=? WHERE guild_id=? AND discord_id=?", [(rating, guild.id, discord_id) for discord_id, rating in ratings.items()])
+        self._forget_standings(guild)
+        return len(games)
 
     def _get_player(self, player: disnake.Member) -> sqlite3.Row:
         """Fetches a player row from the bots database"""
-        with sqlite3.connect(self._database_for(player.guild)) as con:
-            con.row_factory = sqlite3.Row
-            player_row = con.execute("SELECT * FROM players WHERE discord_id=?", [player.id]).fetchone()
+        with self._connect(player.guild) as con:
+            player_row = con.execute("SELECT * FROM players WHERE guild_id=? AND discord_id=?", [player.guild.id, player.id]).fetchone()
             if player_row:
                 return player_row
             raise UserNotRegisteredError(f"The player {player.name} with id {player.id} is not registered in the database.")
@@ -129,60 +536,183 @@ class RandardBot(commands.Bot):
     def get_player_rating(self, player):
         return self._get_player(player)['rating']
 
-    def get_leaderboard(self, guild: disnake.Guild) -> list[sqlite3.Row]:
-        """Gets the top 10 players from the current season.
-        Each element of the returned list is a sqlite3.Row object representing a player, with discord_id and rating keys.
-        Players are returned in standing order, with the champion at index 0, runner-up at index 1, etc.
-        """
-        with sqlite3.connect(self._database_for(guild)) as con:
-            con.row_factory = sqlite3.Row
-            cur = con.execute("SELECT discord_id, rating FROM players ORDER BY rating DESC")
-            leaderboard = cur.fetchmany(10)
-        return leaderboard
-
-    def store_leaderboard(self, guild: disnake.Guild) -> list[sqlite3.Row]:
-        """Creates a new table in the database storing the leaderboard for a particular season, storing the discord id and rating of the top 10 players
-        Returns a list of the 10 players, as they exist in the players table, in order from 1st place to 10th"""
-        with sqlite3.connect(self._database_for(guild)) as con:
-            con.row_factory = sqlite3.Row
-            completed_season = con.execute("SELECT * FROM seasons ORDER BY CAST(season_number AS REAL) DESC").fetchone()
-            leaderboard_table_name = f"leaderboard_{completed_season['month']}_{completed_season['year']}"
-            con.execute(f"CREATE TABLE IF NOT EXISTS {leaderboard_table_name}(discord_id, rating, name) ")
-            con.execute(f"DELETE FROM {leaderboard_table_name}")
-            leaderboard = con.execute("SELECT discord_id, rating, name FROM players ORDER BY rating DESC").fetchmany(10)
-            con.executemany(f"INSERT INTO {leaderboard_table_name}(discord_id, rating, name) VALUES (?, ?, ?)",
-                            [(row['discord_id'], row['rating'], row['name']) for row in leaderboard])
-            return leaderboard
-
-    def clear_ratings(self, guild: disnake.Guild):
-        with sqlite3.connect(self._database_for(guild)) as con:
-            con.execute("UPDATE players SET rating=1000")
-
-    def get_current_season(self, guild: disnake.Guild) -> sqlite3.Row:
-        with sqlite3.connect(self._database_for(guild)) as con:
-            con.row_factory = sqlite3.Row
-            return con.execute("SELECT * FROM seasons ORDER BY CAST(season_number AS REAL) DESC").fetchone()
+    def get_standings(self, guild: disnake.Guild) -> Standings:
+        """Returns the guild's standings, reading every player's rating the first time they're needed. After that they're
+        kept up to date as games are recorded and players register, and dropped when ratings are reset or recomputed"""
+        standings = self._standings.get(guild.id)
+        if standings is not None:
+            return standings
+        # held while loading, so a game recorded during the load can't be missed, see _update_standings
+        with self._standings_lock:
+            standings = self._standings.get(guild.id)
+            if standings is None:
+                with self._connect(guild) as con:
+                    cur = con.execute("SELECT discord_id, rating FROM players WHERE guild_id=?", [guild.id])
+                    standings = self._standings[guild.id] = Standings((row['discord_id'], row['rating']) for row in cur)
+        return standings
 
-    def get_legal_set_names(self, guild: disnake.Guild) -> list[Set_name]:
-        return self.get_current_season(guild)['set_names'].split(', ')
+    def _update_standings(self, guild: disnake.Guild, ratings: dict[int, float]):
+        """Applies new ratings, which have already been committed, to the guild's standings if they've been loaded"""
+        with self._standings_lock:
+            standings = self._standings.get(guild.id)
+            if standings is not None:
+                for discord_id, rating in ratings.items():
+                    standings.update(discord_id, rating)
 
-    def get_legal_set_codes(self, guild: disnake.Guild) -> list[Set_code]:
-        return self.get_current_season(guild)['set_codes'].split(', ')
+    def _forget_standings(self, guild: disnake.Guild):
+        with self._standings_lock:
+            self._standings.pop(guild.id, None)
 
-    def get_season_number(self, guild: disnake.Guild) -> int | str:
-        return self.get_current_season(guild)['season_number']
+    def get_rank(self, player: disnake.Member) -> tuple[int, int, float, float]:
+        """Returns the player's rank, the number of players ranked, the percentage of the others they're ahead of, and their rating"""
+        standings = self.get_standings(player.guild)
+        rank = standings.rank(player.id)
+        if rank is None:
+            raise UserNotRegisteredError(f"The player {player.name} with id {player.id} is not registered in the database.")
+        return rank, len(standings), standings.percentile(player.id), standings.rating(player.id)
 
-    @staticmethod
-    def codes_string(mtg_format: list[mtgsdk.Set]) -> str:
-        """Returns a string of comma delimited set codes for the given list of Sets"""
-        return ', '.join(set_.code for set_ in mtg_format)
+    def get_leaderboard_page(self, guild: disnake.Guild, after: tuple[float, str] | None = None,
+                             page_size: int = LEADERBOARD_PAGE_SIZE) -> list[tuple[str, float]]:
+        """Returns the discord ids and ratings of a page of the leaderboard, highest rated first.
+        The first page comes from the standings. Later pages use keyset pagination: after is the (rating, discord_id) of
+        the last player on the previous page, and the page is read from players_by_rating starting right after them"""
+        if after is None:
+            return self.get_standings(guild).top(page_size)
+        with self._connect(guild) as con:
+            cur = con.execute("SELECT discord_id, rating FROM players WHERE guild_id=? AND (rating, discord_id) < (?, ?) "
+                              "ORDER BY rating DESC, discord_id DESC LIMIT ?", [guild.id, *after, page_size])
+            return [(row['discord_id'], row['rating']) for row in cur]
+
+    def get_global_stats(self) -> dict[str, int]:
+        """Counts the guilds, players and games across every guild the bot is in. With a consolidated database that's a single query"""
+        query = "SELECT (SELECT COUNT(DISTINCT guild_id) FROM seasons) AS guilds, (SELECT COUNT(*) FROM players) AS players, (SELECT COUNT(*) FROM games) AS games"
+        totals = Counter()
+        for path in {self._database_for(guild) for guild in self.guilds}:
+            with self.db_pool.connection(path) as con:
+                totals.update(dict(con.execute(query).fetchone()))
+        return dict(totals)
+
+    def get_stored_leaderboard(self, guild: disnake.Guild, season_number: int) -> list[sqlite3.Row]:
+        """Returns the top 10 of the given season's final standings, from 1st place to 10th"""
+        with self._connect(guild) as con:
+            return con.execute("SELECT place, discord_id, rating, name FROM season_standings WHERE guild_id=? AND season_number=? AND place <= 10 ORDER BY place",
+                               [guild.id, season_number]).fetchall()
+
+    def get_season_history(self, guild: disnake.Guild, limit: int = 10) -> list[sqlite3.Row]:
+        """Returns the guild's last few finished seasons, newest first, with their winner's discord id and final rating"""
+        with self._connect(guild) as con:
+            return con.execute("SELECT seasons.season_number, month, year, winner, rating FROM seasons LEFT JOIN season_standings "
+                               "ON season_standings.guild_id=seasons.guild_id AND season_standings.season_number=seasons.season_number AND place=1 "
+                               "WHERE seasons.guild_id=? AND seasons.season_number < (SELECT MAX(season_number) FROM seasons WHERE guild_id=?) "
+                               "ORDER BY seasons.season_number DESC LIMIT ?", [guild.id, guild.id, limit]).fetchall()
+
+    def get_archived_season(self, guild: disnake.Guild, season_number: int) -> tuple[sqlite3.Row, list[Set_name], list[sqlite3.Row], int] | None:
+        """Returns a finished season's row, the names of its sets, the top 10 of its final standings and how many players
+        it ended with, or None if the season doesn't exist or is still going"""
+        with self._connect(guild) as con:
+            season = con.execute("SELECT season_number, month, year, winner FROM seasons WHERE guild_id=? AND season_number=? "
+                                 "AND season_number < (SELECT MAX(season_number) FROM seasons WHERE guild_id=?)", [guild.id, season_number, guild.id]).fetchone()
+            if season is None:
+                return None
+            set_names = [row['set_name'] for row in con.execute("SELECT set_name FROM season_sets WHERE guild_id=? AND season_number=? ORDER BY position",
+                                                                [guild.id, season_number])]
+            standings = con.execute("SELECT place, discord_id, rating, matches, match_wins, match_losses, match_draws FROM season_standings "
+                                    "WHERE guild_id=? AND season_number=? AND place <= 10 ORDER BY place", [guild.id, season_number]).fetchall()
+            players = con.execute("SELECT COUNT(*) FROM season_standings WHERE guild_id=? AND season_number=?", [guild.id, season_number]).fetchone()[0]
+        return season, set_names, standings, players
+
+    def get_player_totals(self, player: disnake.Member) -> sqlite3.Row | None:
+        """Returns the player's totals over every finished season, see season_archive, or None if they haven't finished one"""
+        with self._connect(player.guild) as con:
+            return con.execute("SELECT * FROM player_totals WHERE guild_id=? AND discord_id=?", [player.guild.id, player.id]).fetchone()
+
+    def get_league_records(self, guild: disnake.Guild, limit: int = 5) -> tuple[list[sqlite3.Row], list[sqlite3.Row]]:
+        """Returns the players with the most titles, and the sets with the most matches played in the seasons they were legal,
+        over every finished season. Both are read in order off the totals' indexes"""
+        with self._connect(guild) as con:
+            players = con.execute("SELECT discord_id, titles, podiums, seasons FROM player_totals WHERE guild_id=? "
+                                  "ORDER BY titles DESC, podiums DESC, best_rating DESC LIMIT ?", [guild.id, limit]).fetchall()
+            sets = con.execute("SELECT set_name, seasons, matches FROM set_totals WHERE guild_id=? ORDER BY matches DESC, seasons DESC LIMIT ?",
+                               [guild.id, limit]).fetchall()
+        return players, sets
 
     @staticmethod
-    def names_string(mtg_format: list[mtgsdk.Set]) -> str:
-        """Returns a string of comma delimited set names for the given list of Sets"""
-        return ', '.join(set_.name for set_ in mtg_format)
+    def quarter_of(date: datetime.date) -> str:
+        """The name of the quarter a date falls in, e.g. '2022-Q2'. Each quarter gets one season"""
+        return storage.quarter_of(date)
+
+    def get_rollover(self, guild: disnake.Guild, quarter: str) -> sqlite3.Row | None:
+        with self._connect(guild) as con:
+            return con.execute("SELECT * FROM rollovers WHERE guild_id=? AND quarter=?", [guild.id, quarter]).fetchone()
+
+    def roll_over_season(self, guild: disnake.Guild, quarter: str, new_format: list[mtgsdk.Set]) -> sqlite3.Row:
+        """Ends the current season and starts a new one with new_format: archives the final standings, resets every rating and
+        adds the new season, in one transaction that also checkpoints the rollover under quarter. If the quarter's rollover
+        has already happened nothing changes, so a rollover interrupted by a crash can be resumed without running a season twice.
+        Returns the quarter's row from the rollovers table"""
+        today = datetime.date.today()
+        with self._connect(guild) as con:
+            rollover = con.execute("SELECT * FROM rollovers WHERE guild_id=? AND quarter=?", [guild.id, quarter]).fetchone()
+            if rollover is not None:
+                return rollover
+            old_season_number = con.execute("SELECT MAX(season_number) FROM seasons WHERE guild_id=?", [guild.id]).fetchone()[0]
+            season_archive.archive_season(con, guild.id, old_season_number)
+            con.execute("UPDATE players SET rating=? WHERE guild_id=?", [self._rating_system(con, guild.id).starting_rating, guild.id])
+            new_season_number = self._insert_season(con, guild.id, today, new_format)
+            con.execute("INSERT INTO rollovers(guild_id, quarter, old_season_number, new_season_number) VALUES (?, ?, ?, ?)",
+                        [guild.id, quarter, old_season_number, new_season_number])
+            rollover = con.execute("SELECT * FROM rollovers WHERE guild_id=? AND quarter=?", [guild.id, quarter]).fetchone()
+        self._forget_season(guild)
+        self._forget_standings(guild)
+        self._try_build_legality_index(guild)
+        return rollover
+
+    def mark_rollover_announced(self, guild: disnake.Guild, quarter: str):
+        with self._connect(guild) as con:
+            con.execute("UPDATE rollovers SET announced=1 WHERE guild_id=? AND quarter=?", [guild.id, quarter])
+
+    def get_season(self, guild: disnake.Guild) -> SeasonInfo:
+        """Returns the guild's current season. It's only read from the database the first time it's asked for after it
+        changes, since store_format and roll_over_season are the only ways it can change, and they clear it from the cache"""
+        season = self._seasons.get(guild.id)
+        if season is not None:
+            return season
+        # held while loading, so a season loaded just before a new one is stored can't be cached after _forget_season runs
+        with self._seasons_lock:
+            season = self._seasons.get(guild.id)
+            if season is None:
+                season = self._seasons[guild.id] = self._load_season(guild)
+        return season
+
+    def _load_season(self, guild: disnake.Guild) -> SeasonInfo:
+        with self._connect(guild) as con:
+            season = con.execute("SELECT season_number, month, year FROM seasons WHERE guild_id=? ORDER BY season_number DESC LIMIT 1", [guild.id]).fetchone()
+            sets = con.execute("SELECT set_code, set_name FROM season_sets WHERE guild_id=? AND season_number=? ORDER BY position",
+                               [guild.id, season['season_number']]).fetchall()
+        return SeasonInfo(season['season_number'], season['month'], season['year'],
+                          tuple(row['set_code'] for row in sets), tuple(row['set_name'] for row in sets))
+
+    def _forget_season(self, guild: disnake.Guild):
+        with self._seasons_lock:
+            self._seasons.pop(guild.id, None)
+
+    def get_legal_set_names(self, guild: disnake.Guild) -> list[Set_name]:
+        return list(self.get_season(guild).set_names)
+
+    def get_legal_set_codes(self, guild: disnake.Guild) -> list[Set_code]:
+        return list(self.get_season(guild).set_codes)
+
+    def get_season_number(self, guild: disnake.Guild) -> int:
+        return self.get_season(guild).season_number
+
+    def get_recent_set_codes(self, guild: disnake.Guild, seasons: int) -> set[Set_code]:
+        """Returns the codes of every set that was legal in any of the guild's last few seasons, counting the current one"""
+        with self._connect(guild) as con:
+            cur = con.execute("SELECT DISTINCT set_code FROM season_sets WHERE guild_id=? AND season_number > "
+                              "(SELECT MAX(season_number) FROM seasons WHERE guild_id=?) - ?", [guild.id, guild.id, seasons])
+            return {row['set_code'] for row in cur}
 
     def scryfall_search(self, guild: disnake.Guild, sets=None):
         if sets is None:
-            sets = self.get_legal_set_codes(guild)
-        return f'(s:{ " or s:".join(set_ for set_ in sets)})'
+            return self.get_season(guild).scryfall_query
+        return scryfall_query(sets)
@@ -0,0 +1,139 @@
+__author__ = "Duncan Seibert"
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable
+
+import mtgsdk
+
+from APIutils import Cardname, Set_code
+from card_catalog import CardCatalog, SetInfo
+from decklist_verification import decklist_parser, match_unique_sets, verify_decklist
+from format_chooser import generate_format
+
+DEFAULT_RESULTS_PATH = 'bench_results.json'
+DEFAULT_TOLERANCE = 0.25  # a benchmark regressed if its fastest time grew by more than this fraction of the baseline's
+MIN_REPEAT = 5  # benchmarks timed fewer times than this, in either run, are too noisy to fail a regression check
+
+
+def synthetic_catalog(n_cards=30000, n_sets=400, seed=0) -> CardCatalog:
+    """Makes a catalog shaped roughly like the real one: most cards are printed once or twice, a few are reprinted
+    in dozens of sets, and basic lands are in nearly all of them"""
+    rng = random.Random(seed)
+    set_types = ['core'] * 40 + ['expansion'] * 160 + ['masters', 'commander', 'reprint', 'promo'] * 50
+    sets = [SetInfo(Set_code(f'S{i:03}'), f'Synthetic Set {i}', set_types[i % len(set_types)]) for i in range(n_sets)]
+    codes = [set_.code for set_ in sets]
+    printings = {Cardname(f'Card {i}'): rng.sample(codes, min(n_sets, int(rng.paretovariate(1.2)))) for i in range(n_cards)}
+    for basic in ('Plains', 'Island', 'Swamp', 'Mountain', 'Forest'):
+        printings[Cardname(basic)] = rng.sample(codes, n_sets * 3 // 4)
+    return CardCatalog(printings, sets, built='synthetic')
+
+
+def synthetic_decklist_text(catalog: CardCatalog, distinct_cards: int, seed=0) -> str:
+    rng = random.Random(seed)
+    names = rng.sample(sorted(catalog.card_names), distinct_cards)
+    maindeck = '\n'.join(f'{rng.randint(1, 4)} {name}' for name in names)
+    sideboard = '\n'.join(f'{rng.randint(1, 4)}x {name}' for name in names[:15])
+    return f'Deck\n{maindeck}\n\nSideboard\n{sideboard}\n'
+
+
+def time_it(func: Callable[[], object], repeat: int) -> dict:
+    func()  # warm up caches before timing
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}
+
+
+def benchmarks(catalog: CardCatalog, repeat: int) -> dict[str, dict]:
+    results = {}
+    legal_codes = sorted(catalog.true_set_codes())
+
+    for label, distinct_cards in (('small', 25), ('huge', 20000)):
+        text = synthetic_decklist_text(catalog, min(distinct_cards, len(catalog)))
+        results[f'decklist_parser[{label}]'] = time_it(lambda: decklist_parser(text, string=True), repeat)
+
+    for distinct_cards in (15, 75, 500):
+        decklist, sideboard = decklist_parser(synthetic_decklist_text(catalog, distinct_cards, seed=distinct_cards), string=True)
+        for format_size in (6, 50):
+            legal_sets = legal_codes[:format_size]
+            results[f'verify_decklist[cards={distinct_cards},sets={format_size}]'] = \
+                time_it(lambda: verify_decklist(decklist, sideboard, legal_sets=legal_sets, catalog=catalog, min_deck_size=0), repeat)
+        legal_cards = catalog.legal_cards(legal_codes[:8])
+        results[f'verify_decklist[cards={distinct_cards},legal_cards]'] = \
+            time_it(lambda: verify_decklist(decklist, sideboard, legal_cards=legal_cards, catalog=catalog, min_deck_size=0), repeat)
+
+    # every card is in the same 74 sets, so one card can never be matched and every alternative has to be ruled out
+    shared_sets = {Set_code(f'S{i:03}') for i in range(74)}
+    adversarial = {Cardname(f'Card {i}'): shared_sets for i in range(75)}
+    results['test_unique_sets[adversarial]'] = time_it(lambda: match_unique_sets(adversarial), repeat)
+    rng = random.Random(1)
+    reprints = {Cardname(f'Card {i}'): set(rng.sample(legal_codes, rng.randint(1, 40))) for i in range(75)}
+    results['test_unique_sets[reprint_heavy]'] = time_it(lambda: match_unique_sets(reprints), repeat)
+
+    sets = [mtgsdk.Set({'code': set_.code, 'name': set_.name, 'type': set_.type}) for set_ in catalog.sets if set_.code in legal_codes]
+    results['generate_format'] = time_it(lambda: generate_format(sets=sets, seed=0, catalog=catalog), repeat)
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path, compact_path = os.path.join(directory, 'catalog.json'), os.path.join(directory, 'catalog.bin')
+        catalog.save(json_path)
+        catalog.save_compact(compact_path)
+        results['load_catalog[json]'] = time_it(lambda: CardCatalog.load(json_path), max(MIN_REPEAT, repeat // 10))
+        results['load_catalog[compact]'] = time_it(lambda: CardCatalog.load(compact_path), repeat)
+        compact = CardCatalog.load(compact_path)
+        names = sorted(catalog.card_names)[:1000]
+        results['printings[compact]'] = time_it(lambda: [compact.printings(name) for name in names], repeat)
+        del compact  # the file has to be unmapped before the directory can be removed on windows
+    return results
+
+
+def find_regressions(results: dict[str, dict], baseline: dict[str, dict], tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    """Compares each benchmark's fastest time against the baseline's. Noise on a busy machine only ever adds time, so the
+    minimum is far steadier between runs than the median. Benchmarks either run timed fewer than MIN_REPEAT times are skipped"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or min(result['repeat'], baseline[name].get('repeat', 0)) < MIN_REPEAT:
+            continue
+        if result['min'] > baseline[name]['min'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['min'] * 1000:.3f}ms, baseline {baseline[name]['min'] * 1000:.3f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks decklist parsing and verification, the unique sets solver and '
+                                                 'format generation, entirely offline')
+    parser.add_argument('--catalog', type=str, default=None, help='A card catalog snapshot to benchmark against. Defaults to a synthetic catalog')
+    parser.add_argument('--repeat', type=int, default=20, help=f'Times to run each benchmark. Runs with fewer than {MIN_REPEAT} are never flagged as regressions')
+    parser.add_argument('--output', type=str, default=DEFAULT_RESULTS_PATH, help='Where to save the results as json')
+    parser.add_argument('--baseline', type=str, default=None, help='Results json from an earlier run to check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    catalog = CardCatalog.load(args.catalog) if args.catalog else synthetic_catalog()
+    results = benchmarks(catalog, args.repeat)
+    for name, result in results.items():
+        print(f"{name:<50} median {result['median'] * 1000:9.3f}ms   min {result['min'] * 1000:9.3f}ms")
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'python': platform.python_version(), 'catalog': repr(catalog), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print('Regressions against the baseline:\n' + '\n'.join(regressions))
+            sys.exit(1)
+        print('No regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
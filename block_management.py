@@ -4,11 +4,17 @@ from collections import defaultdict
 
 from mtgsdk import Set
 
-from APIutils import Block
-
-# creates a dict mapping block names to the sets that block contains
-_sets = [set_ for set_ in Set.all() if set_.block and set_.type == 'expansion']
-block_names = set(set_.block for set_ in _sets)
-blocks: defaultdict[Block, list[Set]] = defaultdict(list)
-for set_ in _sets:
-    blocks[set_.block].append(set_)
+from APIutils import Block, expert_sets
+
+
+def get_blocks() -> defaultdict[Block, list[Set]]:
+    """Returns a dict mapping block names to the sets that block contains"""
+    blocks: defaultdict[Block, list[Set]] = defaultdict(list)
+    for set_ in expert_sets():
+        if set_.block:
+            blocks[set_.block].append(set_)
+    return blocks
+
+
+def get_block_names() -> set[Block]:
+    return set(get_blocks())
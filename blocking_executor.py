@@ -0,0 +1,44 @@
+__author__ = "Duncan Seibert"
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+T = TypeVar('T')
+
+# Discord drops an interaction that hasn't been responded to within 3 seconds, so quick database work has to finish before then
+DB_TIMEOUT = 2.5
+# deferred commands, like /verify, and background tasks can afford to wait longer
+SLOW_TIMEOUT = 30
+MAX_WORKERS = 8
+
+
+class BlockingExecutor:
+    """Runs blocking sqlite3 and mtgsdk work on a bounded pool of threads, so the event loop (and with it the gateway
+    heartbeat and every other guild's commands) never waits on it.
+    Each call has a timeout, after which asyncio.TimeoutError is raised in the awaiting coroutine. The worker thread
+    can't be interrupted, but the bound on the pool keeps runaway calls from piling up."""
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='randard-blocking')
+
+    async def run(self, func: Callable[..., T], *args, timeout: float | None = DB_TIMEOUT, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        return await asyncio.wait_for(future, timeout)
+
+    async def run_write(self, func: Callable[..., T], *args, timeout: float | None = SLOW_TIMEOUT, **kwargs) -> T:
+        """Like run, but for writes that have to be seen through once they've started, because the thread commits them
+        whether or not anything is still waiting. The timeout only covers waiting for a free worker: if the call hasn't
+        started by then it's dropped and asyncio.TimeoutError is raised, otherwise it's waited on until it finishes, and
+        cancelling the awaiting coroutine doesn't abandon it either"""
+        concurrent_future = self._executor.submit(functools.partial(func, *args, **kwargs))
+        future = asyncio.wrap_future(concurrent_future)
+        done, _ = await asyncio.wait({future}, timeout=timeout)
+        if not done and concurrent_future.cancel():
+            raise asyncio.TimeoutError
+        return await asyncio.shield(future)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,250 @@
+__author__ = "Duncan Seibert"
+
+import argparse
+import dataclasses
+import datetime
+import functools
+import json
+import os
+from typing import Iterable, Mapping
+
+import mtgsdk
+
+from APIutils import Block, Cardname, Set_code, Set_name, all_sets
+import metrics
+from card_names import CardNameIndex
+from set_pool import COLORS, SetPool
+
+CATALOG_VERSION = 2
+COMPACT_MAGIC = b'RANDCAT\0'  # the first bytes of a compact catalog file, see compact_catalog.py
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'card_catalog.json')
+DEFAULT_COMPACT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'card_catalog.bin')
+TRUE_SET_TYPES = ('core', 'expansion')
+COMBINED_NAME_LAYOUTS = ('split', 'aftermath')  # layouts whose cards are named in decklists as "Front // Back"
+COLOR_LETTERS = {'White': 'W', 'Blue': 'U', 'Black': 'B', 'Red': 'R', 'Green': 'G'}  # mtgsdk names colors in full
+
+
+class CatalogVersionError(ValueError):
+    pass
+
+
+@dataclasses.dataclass(frozen=True)
+class SetInfo:
+    code: Set_code
+    name: Set_name
+    type: str
+    block: Block | None = None
+    release_date: str | None = None
+
+
+class CardCatalog:
+    """An in-memory snapshot of every card name, its colors and the sets it has been printed in, along with metadata for each set.
+    Built once from mtgsdk or a bulk MTGJSON dump, saved to disk as versioned json, and loaded at startup so that
+    decklist verification never has to touch the network."""
+
+    def __init__(self, printings: Mapping[Cardname, Iterable[Set_code]], sets: Iterable[SetInfo] = (), built: str | None = None,
+                 colors: Mapping[Cardname, str] | None = None):
+        self._printings: dict[Cardname, frozenset[Set_code]] = {Cardname(name): frozenset(code.upper() for code in codes)
+                                                                for name, codes in printings.items()}
+        # only colored cards are stored, as their colors' letters in WUBRG order
+        self._colors: dict[Cardname, str] = {Cardname(name): ''.join(color for color in COLORS if color in card_colors)
+                                             for name, card_colors in (colors or {}).items() if card_colors}
+        self._sets: dict[Set_code, SetInfo] = {set_.code.upper(): set_ for set_ in sets}
+        self.built = built or datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+    def __contains__(self, card_name: str) -> bool:
+        return card_name in self._printings
+
+    def __len__(self) -> int:
+        return len(self._printings)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(cards={len(self)}, sets={len(self._sets)}, built='{self.built}')"
+
+    @property
+    def card_names(self) -> Iterable[Cardname]:
+        return self._printings.keys()
+
+    @property
+    def sets(self) -> Iterable[SetInfo]:
+        return self._sets.values()
+
+    def printings(self, card_name: str) -> frozenset[Set_code]:
+        """Returns the codes of every set the named card was printed in, or an empty frozenset for unknown cards"""
+        return self._printings.get(card_name, frozenset())
+
+    def colors(self, card_name: str) -> str:
+        """Returns the named card's colors as letters in WUBRG order, e.g. 'UG', or '' for colorless and unknown cards"""
+        return self._colors.get(card_name, '')
+
+    @functools.cached_property
+    def name_index(self) -> CardNameIndex:
+        return CardNameIndex(self.card_names)
+
+    @functools.cached_property
+    def set_pool(self) -> SetPool:
+        return SetPool(self)
+
+    def resolve(self, card_name: str) -> Cardname | None:
+        """Returns the catalog's exact name for a card name as typed in a decklist, or None if there's no such card"""
+        if card_name in self:
+            return Cardname(card_name)
+        return self.name_index.resolve(card_name)
+
+    def suggest(self, card_name: str, limit=3) -> list[Cardname]:
+        """Returns up to limit card names that are spelled like card_name, for "did you mean" messages"""
+        return self.name_index.suggest(card_name, limit)
+
+    def set_info(self, code: str) -> SetInfo:
+        return self._sets[Set_code(code.upper())]
+
+    def set_codes(self, *set_types: str) -> frozenset[Set_code]:
+        """Returns the codes of all known sets, or only those of the given set types (e.g. 'core', 'expansion')"""
+        return frozenset(code for code, set_ in self._sets.items() if not set_types or set_.type in set_types)
+
+    def true_set_codes(self) -> frozenset[Set_code]:
+        return self.set_codes(*TRUE_SET_TYPES)
+
+    def legal_printings(self, card_names: Iterable[str], legal_sets: Iterable[Set_code]) -> dict[Cardname, frozenset[Set_code]]:
+        """Maps each of the given card names to the subset of its printings that are in legal_sets"""
+        legal_sets = frozenset(code.upper() for code in legal_sets)
+        return {Cardname(name): self.printings(name) & legal_sets for name in card_names}
+
+    def legal_cards(self, legal_sets: Iterable[Set_code]) -> frozenset[Cardname]:
+        """Returns the names of every card printed in at least one of legal_sets"""
+        legal_sets = frozenset(code.upper() for code in legal_sets)
+        return frozenset(name for name, codes in self._printings.items() if not codes.isdisjoint(legal_sets))
+
+    @classmethod
+    def from_cards(cls, cards: Iterable[mtgsdk.Card], sets: Iterable[mtgsdk.Set] = ()) -> 'CardCatalog':
+        """Builds a catalog from mtgsdk Card and Set objects. Multiple printings of the same card are merged."""
+        printings: dict[Cardname, set[Set_code]] = {}
+        colors: dict[Cardname, set[str]] = {}
+        for card in cards:
+            names = [card.name]
+            if card.layout in COMBINED_NAME_LAYOUTS and card.names:
+                names.append(' // '.join(card.names))
+            for name in names:
+                card_printings = printings.setdefault(Cardname(name), set())
+                card_printings.update(card.printings or ())
+                if card.set:
+                    card_printings.add(card.set)
+                colors.setdefault(Cardname(name), set()).update(COLOR_LETTERS.get(color, color) for color in card.colors or ())
+        set_infos = [SetInfo(set_.code, set_.name, set_.type, set_.block, set_.release_date) for set_ in sets]
+        return cls(printings, set_infos, colors=colors)
+
+    @classmethod
+    def from_mtgsdk(cls, names: Iterable[str] | None = None) -> 'CardCatalog':
+        """Builds a catalog by crawling the mtgsdk API. If names is given, only those cards are fetched.
+        Note: fetching every card takes a long time, this is meant to be run offline, not by the bot"""
+        query = mtgsdk.Card.where(name='|'.join(names)) if names is not None else mtgsdk.Card
+        with metrics.timed('randard_mtgsdk_seconds', call='Card.all'):
+            cards = query.all()
+        return cls.from_cards(cards, all_sets())
+
+    @classmethod
+    def from_mtgjson(cls, path: str) -> 'CardCatalog':
+        """Builds a catalog from an MTGJSON AllPrintings.json bulk dump"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)['data']
+        printings: dict[Cardname, set[Set_code]] = {}
+        colors: dict[Cardname, set[str]] = {}
+        sets = []
+        for code, set_data in data.items():
+            sets.append(SetInfo(Set_code(code), set_data['name'], set_data['type'], set_data.get('block'), set_data.get('releaseDate')))
+            for card in set_data.get('cards', ()):
+                card_printings = printings.setdefault(Cardname(card['name']), set())
+                card_printings.update(card.get('printings', ()))
+                card_printings.add(Set_code(code))
+                colors.setdefault(Cardname(card['name']), set()).update(card.get('colors', ()))
+        return cls(printings, sets, colors=colors)
+
+    def to_json(self) -> dict:
+        return {'version': CATALOG_VERSION,
+                'built': self.built,
+                'sets': [dataclasses.asdict(set_) for set_ in self._sets.values()],
+                'cards': {name: sorted(codes) for name, codes in self._printings.items()},
+                'colors': self._colors}
+
+    @classmethod
+    def from_json(cls, snapshot: dict) -> 'CardCatalog':
+        if snapshot.get('version') != CATALOG_VERSION:
+            raise CatalogVersionError(f"Card catalog snapshot has version {snapshot.get('version')}, expected {CATALOG_VERSION}. Rebuild it with card_catalog.py")
+        return cls(snapshot['cards'], [SetInfo(**set_) for set_ in snapshot['sets']], snapshot['built'], snapshot['colors'])
+
+    def save(self, path: str = DEFAULT_CATALOG_PATH):
+        """Writes the catalog to disk. The snapshot is written to a temporary file first so readers never see a partial file"""
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    def save_compact(self, path: str = DEFAULT_COMPACT_PATH):
+        """Writes the catalog to disk in the memory mappable layout read by compact_catalog.CompactCatalog"""
+        from compact_catalog import write_compact  # imported here since compact_catalog builds on this module
+        write_compact(self, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_CATALOG_PATH) -> 'CardCatalog':
+        """Loads a json snapshot, or opens a compact catalog written by save_compact"""
+        with open(path, 'rb') as f:
+            is_compact = f.read(len(COMPACT_MAGIC)) == COMPACT_MAGIC
+        if is_compact:
+            from compact_catalog import CompactCatalog
+            return CompactCatalog(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_json(json.load(f))
+
+
+_loaded_catalogs: dict[str, CardCatalog] = {}
+
+
+def default_catalog_path() -> str:
+    """The compact catalog if one has been built, since it opens almost instantly, otherwise the json snapshot"""
+    return DEFAULT_COMPACT_PATH if os.path.exists(DEFAULT_COMPACT_PATH) else DEFAULT_CATALOG_PATH
+
+
+def get_catalog(path: str | None = None) -> CardCatalog:
+    """Returns the catalog stored at path, defaulting to default_catalog_path(), loading it from disk only the first time it is asked for.
+    Raises FileNotFoundError if no snapshot has been built yet"""
+    path = path or default_catalog_path()
+    try:
+        return _loaded_catalogs[path]
+    except KeyError:
+        catalog = _loaded_catalogs[path] = CardCatalog.load(path)
+        return catalog
+
+
+def reload_catalog(path: str | None = None) -> CardCatalog:
+    """Loads the catalog stored at path from disk again, for when the snapshot has been rebuilt while the bot is running"""
+    path = path or default_catalog_path()
+    catalog = _loaded_catalogs[path] = CardCatalog.load(path)
+    return catalog
+
+
+def use_catalog(catalog: CardCatalog, path: str | None = None):
+    """Makes get_catalog return catalog for path, defaulting to default_catalog_path(), without reading anything from disk.
+    For running the bot against a synthetic catalog"""
+    _loaded_catalogs[path or default_catalog_path()] = catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds the local card catalog snapshot used for decklist verification')
+    parser.add_argument('-o', '--output', type=str, default=DEFAULT_CATALOG_PATH, help='Where to write the snapshot')
+    parser.add_argument('--mtgjson', type=str, default=None, help='Path to an MTGJSON AllPrintings.json file. If omitted, the mtgsdk API is crawled instead')
+    parser.add_argument('--compact-output', type=str, default=DEFAULT_COMPACT_PATH, help='Where to write the compact, memory mappable copy of the catalog the bot loads')
+    parser.add_argument('--from-snapshot', type=str, default=None, help='Rewrite an existing json snapshot as a compact catalog instead of building a new one')
+    args = parser.parse_args()
+
+    if args.from_snapshot:
+        catalog = CardCatalog.load(args.from_snapshot)
+    else:
+        catalog = CardCatalog.from_mtgjson(args.mtgjson) if args.mtgjson else CardCatalog.from_mtgsdk()
+        catalog.save(args.output)
+        print(f"Saved {catalog!r} to {args.output}")
+    catalog.save_compact(args.compact_output)
+    print(f"Saved the compact catalog to {args.compact_output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+__author__ = "Duncan Seibert"
+
+import re
+import unicodedata
+from collections import Counter
+from typing import Iterable
+
+from APIutils import Cardname
+
+_IGNORED_CHARACTERS = re.compile(r"[^\w\s/]")
+SUGGESTION_THRESHOLD = 0.4  # minimum trigram similarity for a name to be suggested
+
+
+def normalize_name(name: str) -> str:
+    """Reduces a card name to a lookup key that ignores case, accents, punctuation, spacing, and how // is spaced,
+    so "jace the mind sculptor" and "Jace, the Mind Sculptor" get the same key"""
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(character for character in name if not unicodedata.combining(character))
+    name = name.casefold().replace('æ', 'ae').replace('//', ' // ')
+    name = _IGNORED_CHARACTERS.sub('', name)
+    return ' '.join(name.split())
+
+
+def trigrams(key: str) -> set[str]:
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CardNameIndex:
+    """Resolves the card names people actually type into decklists to the exact names used by the card catalog.
+    Exact matches after normalize_name are a single dict lookup. Double faced and split cards, which the catalog may
+    name in full ("Delver of Secrets // Insectile Aberration"), can also be found by their front face.
+    For names that can't be resolved, suggest offers the closest known names using a trigram index."""
+
+    def __init__(self, names: Iterable[Cardname]):
+        self._exact: dict[str, Cardname] = {}
+        names = sorted(names)
+        for name in names:
+            self._exact.setdefault(normalize_name(name), name)
+        for name in names:
+            if ' // ' in name:
+                self._exact.setdefault(normalize_name(name.split(' // ')[0]), name)
+        self._keys: list[str] = list(self._exact)
+        self._postings: dict[str, list[int]] | None = None  # built the first time a suggestion is needed
+
+    def __len__(self):
+        return len(self._exact)
+
+    def resolve(self, name: str) -> Cardname | None:
+        """Returns the catalog's name for the given card name, or None if there's no such card"""
+        return self._exact.get(normalize_name(name))
+
+    def suggest(self, name: str, limit=3) -> list[Cardname]:
+        """Returns up to limit known card names that are spelled similarly to name, most similar first"""
+        if self._postings is None:
+            self._build_postings()
+        query = trigrams(normalize_name(name))
+        shared = Counter()
+        for trigram in query:
+            shared.update(self._postings.get(trigram, ()))
+        scores = []
+        for key_index, count in shared.most_common(limit * 10):
+            similarity = 2 * count / (len(query) + self._trigram_counts[key_index])
+            if similarity >= SUGGESTION_THRESHOLD:
+                scores.append((similarity, self._keys[key_index]))
+        suggestions = []
+        for _, key in sorted(scores, key=lambda score: (-score[0], score[1])):
+            if self._exact[key] not in suggestions:
+                suggestions.append(self._exact[key])
+        return suggestions[:limit]
+
+    def _build_postings(self):
+        postings: dict[str, list[int]] = {}
+        trigram_counts: list[int] = []
+        for key_index, key in enumerate(self._keys):
+            key_trigrams = trigrams(key)
+            trigram_counts.append(len(key_trigrams))
+            for trigram in key_trigrams:
+                postings.setdefault(trigram, []).append(key_index)
+        # the counts are assigned first, since other threads treat a non-None _postings as the index being ready
+        self._trigram_counts = trigram_counts
+        self._postings = postings
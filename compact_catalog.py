@@ -0,0 +1,169 @@
+__author__ = "Duncan Seibert"
+
+import dataclasses
+import functools
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import Iterable
+
+from APIutils import Cardname, Set_code
+from card_catalog import CATALOG_VERSION, COLORS, COMPACT_MAGIC, CardCatalog, CatalogVersionError, SetInfo
+
+# magic, catalog version, byte order, card count, set code count, printing count, set card count, name table size, metadata length
+HEADER = struct.Struct('<8sHcxIIIIII')
+EMPTY_SLOT = 0xFFFFFFFF
+
+
+def _align(n: int) -> int:
+    return (n + 7) // 8 * 8
+
+
+class CompactCatalog(CardCatalog):
+    """A card catalog read straight out of a memory mapped file written by write_compact, instead of json.
+    Set codes are interned to small integers, each card's printings and each set's cards are packed int arrays, and the
+    names are one utf-8 blob in sorted order with an array of offsets into it. A name is found through an open addressing
+    hash table of card indexes, keyed on the crc32 of the name, that's also stored in the file.
+    Opening one takes a few milliseconds regardless of the catalog's size, nothing is decoded until it's looked up,
+    and processes that open the same file share one copy of it through the page cache. It pickles as its path, so
+    worker processes it's sent to open the file themselves rather than receiving a copy."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, version, byte_order, n_cards, n_codes, n_printings, n_set_cards, table_size, metadata_length = HEADER.unpack_from(view)
+        if magic != COMPACT_MAGIC:
+            raise CatalogVersionError(f"{path} isn't a compact card catalog")
+        if version != CATALOG_VERSION or byte_order != sys.byteorder[0].encode():
+            raise CatalogVersionError(f"Compact card catalog has version {version}, expected {CATALOG_VERSION}, or was built on a machine "
+                                      f"with a different byte order. Rebuild it with card_catalog.py")
+        position = _align(HEADER.size)
+
+        def section(length: int, typecode: str = 'B') -> memoryview:
+            nonlocal position
+            size = length * array(typecode).itemsize
+            data = view[position:position + size].cast(typecode)
+            position = _align(position + size)
+            return data
+
+        metadata = json.loads(bytes(section(metadata_length)))
+        self.built: str = metadata['built']
+        self._codes: list[Set_code] = metadata['codes']
+        self._code_indexes: dict[Set_code, int] = {code: i for i, code in enumerate(self._codes)}
+        self._sets: dict[Set_code, SetInfo] = {set_['code'].upper(): SetInfo(**set_) for set_ in metadata['sets']}
+        self._name_offsets = section(n_cards + 1, 'I')
+        self._names = section(self._name_offsets[-1])
+        self._printing_offsets = section(n_cards + 1, 'I')
+        self._printings = section(n_printings, 'H')
+        self._colors = section(n_cards)
+        self._set_card_offsets = section(n_codes + 1, 'I')
+        self._set_cards = section(n_set_cards, 'I')
+        self._name_table = section(table_size, 'I')
+
+    def __reduce__(self):
+        return self.__class__, (self.path,)
+
+    def __contains__(self, card_name: str) -> bool:
+        return self._index(card_name) is not None
+
+    def __len__(self) -> int:
+        return len(self._name_offsets) - 1
+
+    def _index(self, card_name: str) -> int | None:
+        key = card_name.encode()
+        table, names, offsets = self._name_table, self._names, self._name_offsets
+        mask = len(table) - 1
+        slot = zlib.crc32(key) & mask
+        while (index := table[slot]) != EMPTY_SLOT:
+            if names[offsets[index]:offsets[index + 1]] == key:
+                return index
+            slot = (slot + 1) & mask
+        return None
+
+    def _name(self, index: int) -> Cardname:
+        return Cardname(str(self._names[self._name_offsets[index]:self._name_offsets[index + 1]], 'utf-8'))
+
+    @functools.cached_property
+    def _all_names(self) -> tuple[Cardname, ...]:
+        return tuple(self._name(i) for i in range(len(self)))
+
+    @property
+    def card_names(self) -> Iterable[Cardname]:
+        return self._all_names
+
+    def printings(self, card_name: str) -> frozenset[Set_code]:
+        index = self._index(card_name)
+        if index is None:
+            return frozenset()
+        codes = self._codes
+        return frozenset(codes[code] for code in self._printings[self._printing_offsets[index]:self._printing_offsets[index + 1]])
+
+    def colors(self, card_name: str) -> str:
+        index = self._index(card_name)
+        if index is None:
+            return ''
+        bits = self._colors[index]
+        return ''.join(color for i, color in enumerate(COLORS) if bits & 1 << i)
+
+    def legal_cards(self, legal_sets: Iterable[Set_code]) -> frozenset[Cardname]:
+        """Returns the names of every card printed in at least one of legal_sets, read from each legal set's list of cards"""
+        indexes = set()
+        for code in legal_sets:
+            code_index = self._code_indexes.get(code.upper())
+            if code_index is not None:
+                indexes.update(self._set_cards[self._set_card_offsets[code_index]:self._set_card_offsets[code_index + 1]])
+        return frozenset(self._name(i) for i in indexes)
+
+    def to_json(self) -> dict:
+        return CardCatalog({name: self.printings(name) for name in self.card_names}, self.sets, self.built,
+                           {name: self.colors(name) for name in self.card_names}).to_json()
+
+
+def write_compact(catalog: CardCatalog, path: str):
+    """Writes catalog to path in the layout CompactCatalog reads. It's written to a temporary file first, so readers never see a partial file"""
+    names = sorted(catalog.card_names, key=lambda name: name.encode())
+    codes = sorted(set().union(*(catalog.printings(name) for name in names), (set_.code.upper() for set_ in catalog.sets)))
+    code_indexes = {code: i for i, code in enumerate(codes)}
+    if len(codes) > 1 << 16:
+        raise ValueError(f"Too many sets for a compact catalog: {len(codes)}")
+
+    name_offsets, encoded_names = array('I', [0]), bytearray()
+    printing_offsets, printings = array('I', [0]), array('H')
+    colors = bytearray()
+    set_cards: list[list[int]] = [[] for _ in codes]
+    for index, name in enumerate(names):
+        encoded_names += name.encode()
+        name_offsets.append(len(encoded_names))
+        card_codes = sorted(code_indexes[code] for code in catalog.printings(name))
+        printings.extend(card_codes)
+        printing_offsets.append(len(printings))
+        colors.append(sum(1 << i for i, color in enumerate(COLORS) if color in catalog.colors(name)))
+        for code_index in card_codes:
+            set_cards[code_index].append(index)
+    set_card_offsets, flat_set_cards = array('I', [0]), array('I')
+    for cards in set_cards:
+        flat_set_cards.extend(cards)
+        set_card_offsets.append(len(flat_set_cards))
+    # at most half full, and a power of two so a slot is a mask of the hash
+    table_size = 1 << max(1, (2 * len(names) - 1).bit_length())
+    name_table = array('I', [EMPTY_SLOT]) * table_size
+    for index, name in enumerate(names):
+        slot = zlib.crc32(name.encode()) & (table_size - 1)
+        while name_table[slot] != EMPTY_SLOT:
+            slot = (slot + 1) & (table_size - 1)
+        name_table[slot] = index
+
+    metadata = json.dumps({'built': catalog.built, 'codes': codes, 'sets': [dataclasses.asdict(set_) for set_ in catalog.sets]}).encode()
+    header = HEADER.pack(COMPACT_MAGIC, CATALOG_VERSION, sys.byteorder[0].encode(), len(names), len(codes), len(printings), len(flat_set_cards), table_size, len(metadata))
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        for section in (header, metadata, name_offsets, encoded_names, printing_offsets, printings, colors, set_card_offsets, flat_set_cards, name_table):
+            data = bytes(section)
+            f.write(data + bytes(_align(len(data)) - len(data)))
+    os.replace(temp_path, path)
@@ -0,0 +1,62 @@
+__author__ = "Duncan Seibert"
+
+import contextlib
+import sqlite3
+import threading
+from typing import Iterator
+
+PRAGMAS = ("journal_mode=WAL",  # readers don't block the writer, and commits only append to the log
+           "synchronous=NORMAL",  # safe with WAL, and skips an fsync on every commit
+           "busy_timeout=5000",
+           "temp_store=MEMORY",
+           "cache_size=-16000")  # 16MB page cache per connection
+CACHED_STATEMENTS = 256
+
+
+class ConnectionPool:
+    """Keeps one long-lived sqlite3 connection open per database file, instead of reconnecting on every query.
+    Connections are opened lazily, tuned with PRAGMAS, and keep up to CACHED_STATEMENTS prepared statements around.
+    Each connection is guarded by its own lock, so it can be shared between threads."""
+
+    def __init__(self):
+        self._connections: dict[str, tuple[sqlite3.Connection, threading.RLock]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._connections)
+
+    @contextlib.contextmanager
+    def connection(self, path: str) -> Iterator[sqlite3.Connection]:
+        """Yields the connection for the database at path inside a transaction, which is committed when the block exits
+        normally and rolled back if it raises. Rows are returned as sqlite3.Row objects."""
+        con, lock = self._get(path)
+        with lock, con:
+            yield con
+
+    def _get(self, path: str) -> tuple[sqlite3.Connection, threading.RLock]:
+        try:
+            return self._connections[path]
+        except KeyError:
+            pass
+        with self._lock:
+            if path not in self._connections:
+                con = sqlite3.connect(path, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+                con.row_factory = sqlite3.Row
+                for pragma in PRAGMAS:
+                    con.execute(f"PRAGMA {pragma}")
+                self._connections[path] = con, threading.RLock()
+            return self._connections[path]
+
+    def close(self, path: str):
+        """Closes the connection to the database at path, if one is open. It will be reopened the next time it's used"""
+        with self._lock:
+            entry = self._connections.pop(path, None)
+        if entry is not None:
+            con, lock = entry
+            with lock:
+                con.execute("PRAGMA optimize")
+                con.close()
+
+    def close_all(self):
+        for path in list(self._connections):
+            self.close(path)
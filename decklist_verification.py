@@ -1,56 +1,219 @@
 __author__ = "Duncan Seibert"
 
 import argparse
-from collections import Counter, defaultdict
-from typing import Collection, TextIO
+import codecs
+import csv
+import dataclasses
+import itertools
+import json
+import os
+import re
+import time
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Collection, Iterable, Iterator, Mapping, NamedTuple, TextIO
+from xml.etree import ElementTree
 
-import mtgsdk
-
-from APIutils import ALL_TRUE_SETS, Cardname, Decklist, Set_code
+from APIutils import Cardname, Decklist, Set_code
+from card_catalog import CardCatalog, get_catalog
+import metrics
 
 MAX_CARDS_EXCEPTIONS = ('Relentless Rats', 'Rat Colony', 'Persistent Petitioners', 'Shadowborn Apostle',
                         'Plains', 'Island', 'Swamp', 'Mountain', 'Forest')
 
 
 class DecklistError(SyntaxError):
-    pass
+    """Raised by decklist_parser with every problem found in the decklist, one per line of the message.
+    The individual problems are also available as the errors attribute"""
+    def __init__(self, errors: str | list[str]):
+        self.errors: list[str] = [errors] if isinstance(errors, str) else list(errors)
+        super().__init__('\n'.join(self.errors))
 
 
-def decklist_parser(decklist_file: str | TextIO, string=False) -> tuple[Decklist, Decklist]:
-    """Parses a decklist string where each line is "Nx CARDNAME"
-    returns a tuple of two Decklist objects (i.e. collections.Counters) that map card names to the number of that
-    card in the deck. The first Decklist is the maindeck, the second is the sideboard"""
-    if string:
-        lines = decklist_file.splitlines()
+class DecklistEntry(NamedTuple):
+    card_name: Cardname
+    quantity: int
+    sideboard: bool
+    line: int  # the line number for text decklists, or the position of the card element for xml ones
+
+
+DECKLIST_FORMATS = ('text', 'dek', 'cod')
+CHUNK_SIZE = 1 << 16
+MAINDECK_HEADINGS = ('deck', 'main', 'commander', 'companion')
+SKIPPED_HEADINGS = ('about', 'name')  # Arena exports can start with an About section naming the deck
+ARENA_SUFFIX = re.compile(r'\s+\([A-Za-z0-9_]{2,6}\)(?:\s+\S+)?$')  # e.g. "4 Llanowar Elves (DOM) 168"
+DecklistSource = str | bytes | BinaryIO | TextIO
+
+
+def _iter_chunks(source: DecklistSource, string: bool) -> Iterator[str | bytes]:
+    """Yields the decklist in chunks, without reading the whole file into memory up front"""
+    if string and isinstance(source, str):
+        for offset in range(0, len(source), CHUNK_SIZE):
+            yield source[offset:offset + CHUNK_SIZE]
+    elif string:
+        view = memoryview(source)
+        for offset in range(0, len(view), CHUNK_SIZE):
+            yield bytes(view[offset:offset + CHUNK_SIZE])
+    elif isinstance(source, str):
+        with open(source, 'rb') as f:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b'')
     else:
-        with open(decklist_file, 'r') as f:
-            lines = f.readlines()
-    maindeck = Decklist()
-    sideboard = Decklist()
-    working_decklist = maindeck
-    for (idx, line) in enumerate(lines):
-        if not line.strip():
-            continue  # skips blank lines
-        num, *card_words = line.split()
-        card_name = Cardname(' '.join(word.strip() for word in card_words))
+        yield from iter(lambda: source.read(CHUNK_SIZE), source.read(0))
+
+
+def _iter_text_lines(chunks: Iterable[str | bytes]) -> Iterator[str]:
+    """Decodes chunks incrementally and splits them into lines. Byte order marks pick the encoding, otherwise it's utf-8"""
+    decoder = None
+    pending = ''
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                encoding = 'utf-16' if chunk[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE) else 'utf-8-sig'
+                decoder = codecs.getincrementaldecoder(encoding)()
+            chunk = _decode(decoder, chunk)
+        lines = (pending + chunk).splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+        yield from lines
+    if decoder is not None:
+        pending += _decode(decoder, b'', final=True)
+    if pending:
+        yield pending
+
+
+def _decode(decoder: codecs.IncrementalDecoder, chunk: bytes, final=False) -> str:
+    try:
+        return decoder.decode(chunk, final)
+    except UnicodeDecodeError:
+        raise DecklistError("Oops, I can't read that. Please send me a .txt file, with utf-8 encoding. "
+                            "Try copying your decklist into Notepad and saving it from there.")
+
+
+def _parse_text(chunks: Iterable[str | bytes], errors: list[str]) -> Iterator[DecklistEntry]:
+    """Plain, MTGO and Arena style text decklists, where each line is a heading or "Nx CARDNAME" """
+    sideboard = False
+    for line_number, line in enumerate(_iter_text_lines(chunks), start=1):
+        line = line.strip()
+        if not line or line.startswith(('//', '#')):
+            continue  # skips blank lines and comments
+        num, *card_words = line.split(None, 1)
+        if num.upper() == 'SB:':  # MTGO's "SB: 2 Forest" style of sideboard line
+            sideboard = True
+            num, *card_words = card_words[0].split(None, 1) if card_words else ['']
         num = num.strip('xX')
-        if idx == 0 and 'deck' in str(num).lower():
+        heading = num.rstrip(':').lower()
+        if not num.isdecimal():
+            if 'side' in heading:
+                sideboard = True
+            elif any(word in heading for word in MAINDECK_HEADINGS):
+                sideboard = False
+            elif heading not in SKIPPED_HEADINGS:
+                errors.append(f'Each line in the file, except for maindeck and sideboard headings, must start with an integer; line {line_number} ("{line}") does not')
             continue
-        elif 'side' in str(num).lower():
-            working_decklist = sideboard
+        if not card_words:
+            errors.append(f'Line {line_number} ("{line}") is missing a card name')
             continue
-        try:
-            num = int(num)
-        except ValueError:
-            raise DecklistError(f'Each line in the file, except for maindeck and sideboard headings, must start with an integer; line {idx+1} does not')
-        working_decklist[card_name] += num
+        card_name = card_words[0]
+        if '  ' in card_name or '\t' in card_name:
+            card_name = ' '.join(card_name.split())
+        if card_name.endswith(')') or '(' in card_name:
+            card_name = ARENA_SUFFIX.sub('', card_name)
+        yield DecklistEntry(Cardname(card_name), int(num), sideboard, line_number)
+
+
+def _parse_xml(chunks: Iterable[str | bytes], errors: list[str], decklist_format: str) -> Iterator[DecklistEntry]:
+    """MTGO .dek files, made of <Cards Quantity="4" Sideboard="false" Name="..."/> elements, and Cockatrice .cod files,
+    made of <card number="4" name="..."/> elements inside <zone name="main"> or <zone name="side"> elements"""
+    parser = ElementTree.XMLPullParser(events=('start', 'end'))
+    zone = 'main'
+    card_number = 0
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == 'start' and element.tag == 'zone':
+                    zone = element.get('name', 'main').lower()
+                if event != 'end':
+                    continue
+                if decklist_format == 'dek' and element.tag == 'Cards':
+                    card_number += 1
+                    quantity, name, sideboard = element.get('Quantity'), element.get('Name'), element.get('Sideboard', 'false').lower() == 'true'
+                elif decklist_format == 'cod' and element.tag == 'card' and zone in ('main', 'side'):
+                    card_number += 1
+                    quantity, name, sideboard = element.get('number'), element.get('name'), zone == 'side'
+                else:
+                    continue
+                element.clear()  # keeps memory flat for huge files
+                if not (quantity and quantity.isdecimal() and name):
+                    errors.append(f'Card {card_number} in the file is missing its name or quantity')
+                    continue
+                yield DecklistEntry(Cardname(name), int(quantity), sideboard, card_number)
+        parser.close()
+    except ElementTree.ParseError as err:
+        errors.append(f"The file isn't a valid .{decklist_format} file: {err}")
+
+
+def _sniff_format(first_chunk: str | bytes) -> str:
+    start = first_chunk.lstrip()[:512]
+    if isinstance(start, bytes):
+        start = start.decode('utf-8', errors='ignore').lstrip('\ufeff')
+    if start.startswith('<'):
+        return 'cod' if 'cockatrice_carddeck' in start else 'dek'
+    return 'text'
+
+
+def iter_decklist(source: DecklistSource, errors: list[str], *, string=False, decklist_format: str | None = None) -> Iterator[DecklistEntry]:
+    """Streams the entries of a decklist in one pass, appending a message to errors for each bad line instead of stopping.
+    source is a filepath, an open file (text or binary), or if string is True, the contents of the file as str or bytes
+    (e.g. the payload of a disnake.Attachment). decklist_format is one of DECKLIST_FORMATS, and is detected from the
+    start of the file if not given"""
+    chunks = _iter_chunks(source, string)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return
+    if decklist_format is None:
+        decklist_format = _sniff_format(first_chunk)
+    chunks = itertools.chain([first_chunk], chunks)
+    if decklist_format == 'text':
+        yield from _parse_text(chunks, errors)
+    elif decklist_format in ('dek', 'cod'):
+        yield from _parse_xml(chunks, errors, decklist_format)
+    else:
+        raise ValueError(f"decklist_format must be one of {DECKLIST_FORMATS}, not {decklist_format!r}")
+
+
+def decklist_format_for(filename: str) -> str | None:
+    """Guesses the format of a decklist from its file extension, or returns None to detect it from the contents"""
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    return extension if extension in DECKLIST_FORMATS else None
+
+
+def decklist_parser(decklist_file: DecklistSource, string=False, *, decklist_format: str | None = None) -> tuple[Decklist, Decklist]:
+    """Parses a decklist where each line is "Nx CARDNAME", or an MTGO .dek or Cockatrice .cod file.
+    See iter_decklist for the types of decklist_file accepted.
+    returns a tuple of two Decklist objects (i.e. collections.Counters) that map card names to the number of that
+    card in the deck. The first Decklist is the maindeck, the second is the sideboard
+    Raises a DecklistError listing every bad line if there are any"""
+    maindeck = Decklist()
+    sideboard = Decklist()
+    errors: list[str] = []
+    for entry in iter_decklist(decklist_file, errors, string=string, decklist_format=decklist_format):
+        (sideboard if entry.sideboard else maindeck)[entry.card_name] += entry.quantity
+    if errors:
+        raise DecklistError(errors)
     return maindeck, sideboard
 
 
+@metrics.instrument('randard_verify_seconds')
 def verify_decklist(decklist: Decklist, sideboard: Decklist | None = None, *, legal_sets: Collection[Set_code] | None = None,
-                    max_cards=4, min_deck_size=60, max_deck_size=None, min_sideboard_size=0, max_sideboard_size=15) -> list[str] | bool:
+                    max_cards=4, min_deck_size=60, max_deck_size=None, min_sideboard_size=0, max_sideboard_size=15,
+                    catalog: CardCatalog | None = None, legal_cards: Collection[Cardname] | None = None) -> list[str] | bool:
     """takes a decklist or pair of decklists representing maindeck and sideboard, as returned by decklist_parser
-    returns True if that deck is valid for the given maximum number of cards and legal sets, or a list of errors otherwise"""
+    returns True if that deck is valid for the given maximum number of cards and legal sets, or a list of errors otherwise
+    Card names are resolved and printings looked up in catalog, which defaults to the local snapshot from
+    card_catalog.get_catalog(). Names that can't be resolved are reported along with suggestions of similar names.
+    If legal_cards, a precomputed set of every legal card name, is given, legal_sets is ignored and legality is just
+    a membership check. The catalog is then only used for names that aren't exactly in legal_cards"""
 
     errors = []
 
@@ -76,41 +239,183 @@ def verify_decklist(decklist: Decklist, sideboard: Decklist | None = None, *, le
         case _:
             raise TypeError(f"verify_decklist positional arguments must be of type collections.Counter, had type {[type(decklist), type(sideboard)]}")
 
-    for card, num in decklist.most_common():
+    if catalog is None and (legal_cards is None or not all(card in legal_cards for card in decklist)):
+        catalog = get_catalog()  # only needed if some names have to be resolved or looked up
+    card_names: dict[Cardname, Cardname | None] = {card: card if catalog is None else catalog.resolve(card) for card in decklist}
+    resolved_decklist = Decklist()
+    for card, num in decklist.items():
+        resolved_decklist[card_names[card] or card] += num
+
+    for card, num in resolved_decklist.most_common():
         if num <= max_cards:
             break
         if card not in MAX_CARDS_EXCEPTIONS:
             errors.append(f'{card} has more than {max_cards} {"copies" if max_cards > 1 else "copy"}')
 
-    if legal_sets is not None:
-        legal_sets = set(legal_sets)  # this is where I'll revise to allow for special formats
-    else:
-        legal_sets = ALL_TRUE_SETS
-    decklist_cards: list[mtgsdk.Card] = mtgsdk.Card.where(name="|".join(card for card in decklist)).all()
-    card_sets: defaultdict[Cardname: set[Set_code]] = \
-        {card.name: (set(card.printings) & legal_sets) for card in decklist_cards}
-    for card in decklist:
-        if not card_sets[card]:
+    if legal_cards is None:
+        if legal_sets is None:
+            legal_sets = catalog.true_set_codes()  # this is where I'll revise to allow for special formats
+        legal_cards = {card for card, sets in catalog.legal_printings(filter(None, card_names.values()), legal_sets).items() if sets}
+    for card, name in card_names.items():
+        if name is None:
+            suggestions = catalog.suggest(card)
+            did_you_mean = f" Did you mean {' or '.join(suggestions)}?" if suggestions else " Double check the spelling."
+            errors.append(f"{card} isn't a card I know of.{did_you_mean}")
+        elif name not in legal_cards:
             errors.append(f'{card} is not legal')
 
     return errors or True
 
 
-def main():
+@dataclasses.dataclass
+class DeckReport:
+    name: str
+    errors: list[str]
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+
+@dataclasses.dataclass
+class BatchReport:
+    decks: list[DeckReport]
+    seconds: float
+
+    @property
+    def summary(self) -> dict:
+        valid = sum(deck.valid for deck in self.decks)
+        return {'decks': len(self.decks), 'valid': valid, 'invalid': len(self.decks) - valid, 'seconds': round(self.seconds, 4),
+                'decks_per_second': round(len(self.decks) / self.seconds, 1) if self.seconds else None}
+
+    def write(self, path: str):
+        """Writes the report to path, as csv if path ends in .csv and as json otherwise"""
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['deck', 'valid', 'errors'])
+                writer.writerows([deck.name, deck.valid, '; '.join(deck.errors)] for deck in self.decks)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'summary': self.summary,
+                           'decks': [{'name': deck.name, 'valid': deck.valid, 'errors': deck.errors} for deck in self.decks]}, f, indent=2)
+
+
+def _parse_batch_chunk(chunk: list[tuple[str, str | bytes]]) -> list[tuple[str, tuple[Decklist, Decklist] | DecklistError]]:
+    parsed = []
+    for name, contents in chunk:
+        try:
+            parsed.append((name, decklist_parser(contents, string=True, decklist_format=decklist_format_for(name))))
+        except DecklistError as err:
+            parsed.append((name, err))
+    return parsed
+
+
+_batch_catalog: CardCatalog | None = None  # the catalog each batch worker process was started with
+
+
+def _init_batch_worker(catalog: CardCatalog):
+    global _batch_catalog
+    _batch_catalog = catalog
+
+
+def _verify_batch_chunk(chunk: list[tuple[str, tuple[Decklist, Decklist]]], legal_cards: frozenset[Cardname], verify_kwargs: dict,
+                        catalog: CardCatalog | None = None) -> list[DeckReport]:
+    reports = []
+    for name, decklist in chunk:
+        verification = verify_decklist(*decklist, legal_cards=legal_cards, catalog=catalog or _batch_catalog, **verify_kwargs)
+        reports.append(DeckReport(name, [] if verification is True else verification))
+    return reports
+
+
+def _chunks(items: list, n: int) -> list[list]:
+    return [items[i::n] for i in range(n) if items[i::n]]
+
+
+def verify_decklists(batch: Mapping[str, str | bytes], *, legal_sets: Collection[Set_code] | None = None, catalog: CardCatalog | None = None,
+                     processes: int | None = None, **verify_kwargs) -> BatchReport:
+    """Verifies many decklists at once, e.g. every list submitted for a tournament.
+    batch maps a name for each deck (like its filename) to the contents of its decklist file. The decks are parsed and checked
+    in parallel across processes worker processes (defaulting to one per cpu, 1 runs everything in this process),
+    and the legality of every card named in any of the decks is looked up in the catalog in a single pass.
+    Any other keyword arguments are passed on to verify_decklist.
+    Returns a BatchReport with a DeckReport for each deck, in the order they were given."""
+    start = time.perf_counter()
+    if catalog is None:
+        catalog = get_catalog()
+    if legal_sets is None:
+        legal_sets = catalog.true_set_codes()
+    processes = processes or os.cpu_count() or 1
+    items = list(batch.items())
+    order = {name: i for i, (name, _) in enumerate(items)}
+
+    # the catalog is only sent to each worker once, for resolving any misspelled card names
+    executor = ProcessPoolExecutor(processes, initializer=_init_batch_worker, initargs=(catalog,)) if processes > 1 and len(items) > 1 else None
+    try:
+        def run(func, chunks, *args):
+            if executor is None:
+                return [func(chunk, *args) for chunk in chunks]
+            return list(executor.map(func, chunks, *([arg] * len(chunks) for arg in args)))
+
+        parsed = [deck for chunk in run(_parse_batch_chunk, _chunks(items, processes)) for deck in chunk]
+        decklists = [(name, decklist) for name, decklist in parsed if not isinstance(decklist, DecklistError)]
+        reports = [DeckReport(name, error.errors) for name, error in parsed if isinstance(error, DecklistError)]
+
+        all_cards = set().union(*(maindeck.keys() | sideboard.keys() for _, (maindeck, sideboard) in decklists))
+        resolved_cards = {card: catalog.resolve(card) for card in all_cards}
+        legal_printings = catalog.legal_printings(filter(None, resolved_cards.values()), legal_sets)
+        legal_cards = frozenset(card for card, name in resolved_cards.items() if name is not None and legal_printings[name]) | \
+            frozenset(name for name, sets in legal_printings.items() if sets)
+        # worker processes already have the catalog from _init_batch_worker, so it's only passed along when running inline
+        verify_args = (legal_cards, verify_kwargs) if executor is not None else (legal_cards, verify_kwargs, catalog)
+        reports += [deck for chunk in run(_verify_batch_chunk, _chunks(decklists, processes), *verify_args) for deck in chunk]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    reports.sort(key=lambda deck: order[deck.name])
+    return BatchReport(reports, time.perf_counter() - start)
+
+
+def read_decklists(path: str) -> dict[str, bytes]:
+    """Reads every decklist file (.txt, .dek or .cod) in a directory or .zip file, returning a dict mapping each file's name to its contents"""
+    extensions = tuple(f'.{decklist_format}' for decklist_format in DECKLIST_FORMATS[1:]) + ('.txt',)
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name) for name in sorted(archive.namelist()) if name.lower().endswith(extensions)}
+    decklists = {}
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(extensions):
+            with open(os.path.join(path, name), 'rb') as f:
+                decklists[name] = f.read()
+    return decklists
+
+
+def main(argv: Iterable[str] | None = None):
     parser = argparse.ArgumentParser(description='Verifies that a given .txt decklist is a valid decklist for a format'
-                                                 ' consisting of the sets in the other arguments')
-    parser.add_argument('decklist_file', type=str, nargs=1)
-    parser.add_argument('sets', type=str, nargs='*')
-    args = parser.parse_args()
-    argument_file = args.decklist_file
-    sets = args.sets
+                                                 ' consisting of the sets in the other arguments. Given a directory or .zip'
+                                                 ' file of decklists instead, verifies all of them and writes a report')
+    parser.add_argument('decklist_file', type=str, help='A decklist file, or a directory or .zip file of them')
+    parser.add_argument('sets', type=str, nargs='*', help='Set codes of the legal sets. Defaults to every core and expansion set')
+    parser.add_argument('--report', type=str, default=None, help='Where to write the batch report, as .json or .csv. Defaults to printing a summary')
+    parser.add_argument('--processes', type=int, default=None, help='Number of worker processes for batch verification')
+    args = parser.parse_args(argv)
+    sets = args.sets or None
+
+    if not (os.path.isdir(args.decklist_file) or zipfile.is_zipfile(args.decklist_file)):
+        decklist = decklist_parser(args.decklist_file, decklist_format=decklist_format_for(args.decklist_file))
+        verification = verify_decklist(*decklist, legal_sets=sets)
+        print(verification)
+        return verification
 
-    with open(argument_file, 'r') as decklist_file:
-        decklist = decklist_parser(decklist_file)
-    return verify_decklist(*decklist, legal_sets=sets)
+    report = verify_decklists(read_decklists(args.decklist_file), legal_sets=sets, processes=args.processes)
+    if args.report:
+        report.write(args.report)
+    print(json.dumps(report.summary))
+    return report
 
 
-def test_unique_sets(cards: dict[str, set[Set_code]]) -> dict[Cardname, Set_code] | None:
+def test_unique_sets(cards: Mapping[str, Collection[Set_code]]) -> dict[Cardname, Set_code] | None:
     """decklist tester for a unique format variant. Returns None if decklist is not valid for the format, otherwise
     returns a dict mapping each card to the unique set it is paired with.
     In this special format, for each set in Magic's history, you may have up to one representative card,
@@ -119,31 +424,57 @@ def test_unique_sets(cards: dict[str, set[Set_code]]) -> dict[Cardname, Set_code
     if you include a copy of him in your deck, it can contain no other cards that were only printed in Worldwake.
     But, cards like "Dispel", which were printed in other sets, may be included, locking you out of other cards
     from one of the card's other sets.
-    Note: Very slow
+    Use match_unique_sets to find out which cards couldn't be given a set.
     """
-    # if the set of cards are a legal deck for the 1 card per set format, will return one possible choice of sets for each card
-    # otherwise will return None
-    cards = {cardname: cards[cardname] for cardname in sorted(cards, key=lambda x: len(cards[x]))}  # this line does double duty:
-    # it makes a copy of cards, so you don't end up mutating the object you pass in, and sorts the copy such that cards
-    # that are only in a few sets come first, significantly improving the worst-case performance
-    card_name: Cardname
-    set_names: set[Set_code]
-    card_name, set_names = cards.popitem()
-    if len(cards) == 0:
-        # base case, when we're down to the single card named card_name
-        try:
-            return {card_name: set_names.pop()}  # just picks an arbitrary set, since you only have one card left
-        except (KeyError, IndexError):  # this will happen if there are no sets left in set_names, because all of card_name's sets have been chosen earlier in the process
-            return None
-    for chosen_set in set_names:
-        # this is the recursive case, and we iterate over each set in set_names to see if we can make it work with any of them
-        trimmed_cards = {card: sets-{chosen_set} for card, sets in cards.items()}  # card_name got popped, so just have to remove chosen_set from any other card that has it
-        rest_of_the_cards = test_unique_sets(trimmed_cards)
-        if rest_of_the_cards:  # the function was able to find a legal choice for all the rest of the cards
-            return {card_name: chosen_set, **rest_of_the_cards}
-    return None  # will only get here if each of card_name's sets fail to lead to a valid solution, or it card_name has no sets left
+    matching, unmatched = match_unique_sets(cards)
+    return None if unmatched else matching
+
+
+def match_unique_sets(cards: Mapping[str, Collection[Set_code]]) -> tuple[dict[Cardname, Set_code], list[Cardname]]:
+    """Pairs as many cards as possible with a unique set, by finding a maximum bipartite matching between cards and
+    sets with the Hopcroft-Karp algorithm, which runs in O(E * sqrt(V)) time rather than exponential time.
+    Returns a tuple of the dict mapping each matched card to its set, and a list of the cards that couldn't be matched.
+    The deck is legal for the unique sets format exactly when that list is empty."""
+    # cards that are only in a few sets come first, so the greedy first pass leaves as few cards unmatched as possible
+    adjacency: dict[Cardname, list[Set_code]] = {Cardname(card): sorted(cards[card])
+                                                 for card in sorted(cards, key=lambda card: (len(cards[card]), card))}
+    card_match: dict[Cardname, Set_code | None] = dict.fromkeys(adjacency)
+    set_match: dict[Set_code, Cardname] = {}
+
+    def augment(card: Cardname) -> bool:
+        # depth first search for an augmenting path along the layers found by the breadth first search below
+        for set_code in adjacency[card]:
+            other_card = set_match.get(set_code)
+            if other_card is None or (layers.get(other_card) == layers[card] + 1 and augment(other_card)):
+                card_match[card] = set_code
+                set_match[set_code] = card
+                return True
+        layers[card] = None  # dead end, don't search through this card again in this phase
+        return False
+
+    while True:
+        # breadth first search from every unmatched card, layering the matched cards by distance
+        layers: dict[Cardname, int | None] = {card: 0 for card, set_code in card_match.items() if set_code is None}
+        queue = deque(layers)
+        found_free_set = False
+        while queue:
+            card = queue.popleft()
+            for set_code in adjacency[card]:
+                other_card = set_match.get(set_code)
+                if other_card is None:
+                    found_free_set = True
+                elif other_card not in layers:
+                    layers[other_card] = layers[card] + 1
+                    queue.append(other_card)
+        if not found_free_set:
+            break
+        for card in [card for card, set_code in card_match.items() if set_code is None]:
+            augment(card)
+
+    matching = {card: set_code for card, set_code in card_match.items() if set_code is not None}
+    unmatched = [card for card, set_code in card_match.items() if set_code is None]
+    return matching, unmatched
 
 
 if __name__ == '__main__':
-    # main()
-    pass
+    main()
@@ -1,14 +1,112 @@
 __author__ = "Duncan Seibert"
 
-from random import sample, randint
+import dataclasses
+import random
+from typing import Hashable, Iterable
 
 import mtgsdk
 
-from APIutils import ALL_TRUE_SETS
+from APIutils import Set_code, all_true_sets
+from card_catalog import CardCatalog, CatalogVersionError, get_catalog
+from set_pool import SetPool
 
+RECENT_SEASONS = 4  # a season's sets can't come back until this many seasons have passed
+BLOCK_PULL_CHANCE = 0.5  # how often picking a set from a block brings the rest of its block along with it
 
-def generate_format(format_size=None) -> list[mtgsdk.Set]:
-    if format_size is None:
-        format_size = randint(6, 8)
-    randard_format: list[mtgsdk.Set] = sample(ALL_TRUE_SETS, format_size)  # chooses a random sample of sets to use for the format
-    return randard_format
+
+@dataclasses.dataclass(frozen=True)
+class FormatConstraints:
+    """What a generated format should look like. A format that breaks any of these is only used if no candidate keeps them all.
+    Among the candidates that do, the one closest to target_cards, with the most even colors and the fewest split blocks wins"""
+    min_sets: int = 6
+    max_sets: int = 8
+    target_cards: int = 2000  # the README's "roughly 2,000 cards"
+    card_tolerance: int = 500
+    min_core_sets: int = 1
+    max_color_imbalance: float = 0.35  # (most common color - least common color) / average color, among the pool's colored cards
+    block_split_penalty: float = 0.1  # score added for each block that only some of the sets of are in the format
+    candidates: int = 500
+
+
+DEFAULT_CONSTRAINTS = FormatConstraints()
+
+
+@dataclasses.dataclass(frozen=True)
+class Candidate:
+    codes: tuple[Set_code, ...]
+    violations: int
+    score: float
+
+
+def evaluate(pool: SetPool, codes: Iterable[Set_code], constraints: FormatConstraints = DEFAULT_CONSTRAINTS) -> Candidate:
+    """Counts how many of the constraints the format breaks, and scores how far it is from the ideal format, lower being better"""
+    codes = tuple(codes)
+    card_count, color_counts = pool.measure(codes)
+    average_color = sum(color_counts) / len(color_counts)
+    imbalance = (max(color_counts) - min(color_counts)) / average_color if average_color else 0.0
+    blocks = {pool.stats(code).block for code in codes} - {None}
+    split_blocks = sum(1 for block in blocks if not set(pool.block(block)) <= set(codes))
+    violations = sum((not constraints.min_sets <= len(codes) <= constraints.max_sets,
+                      sum(1 for code in codes if pool.stats(code).type == 'core') < constraints.min_core_sets,
+                      abs(card_count - constraints.target_cards) > constraints.card_tolerance,
+                      imbalance > constraints.max_color_imbalance))
+    score = abs(card_count - constraints.target_cards) / constraints.target_cards + imbalance + split_blocks * constraints.block_split_penalty
+    return Candidate(codes, violations, score)
+
+
+def _sample_candidate(pool: SetPool, available: list[Set_code], size: int, constraints: FormatConstraints, rng: random.Random) -> list[Set_code]:
+    cores = [code for code in available if pool.stats(code).type == 'core']
+    chosen = rng.sample(cores, min(constraints.min_core_sets, len(cores), size))
+    remaining = [code for code in available if code not in chosen]
+    while len(chosen) < size and remaining:
+        code = remaining.pop(rng.randrange(len(remaining)))
+        chosen.append(code)
+        block = pool.stats(code).block
+        if block and rng.random() < BLOCK_PULL_CHANCE:
+            for blockmate in pool.block(block):
+                if len(chosen) < size and blockmate in remaining:
+                    remaining.remove(blockmate)
+                    chosen.append(blockmate)
+    return chosen
+
+
+def choose_format(pool: SetPool, available: Iterable[str], constraints: FormatConstraints = DEFAULT_CONSTRAINTS,
+                  recent: Iterable[str] = (), seed: Hashable = None) -> list[Set_code]:
+    """Picks the codes of a format from the available sets, skipping those in recent unless there aren't enough sets without them.
+    constraints.candidates random formats are sampled and the best one kept, so the same seed always picks the same format"""
+    rng = random.Random(seed)
+    available = sorted({Set_code(code.upper()) for code in available} & set(pool.codes()))
+    recent = {code.upper() for code in recent}
+    fresh = [code for code in available if code not in recent]
+    if len(fresh) >= constraints.max_sets:
+        available = fresh
+    best = None
+    for _ in range(constraints.candidates):
+        size = rng.randint(constraints.min_sets, constraints.max_sets)
+        candidate = evaluate(pool, _sample_candidate(pool, available, size, constraints, rng), constraints)
+        if best is None or (candidate.violations, candidate.score) < (best.violations, best.score):
+            best = candidate
+    return list(best.codes) if best is not None else []
+
+
+def generate_format(format_size=None, sets: list[mtgsdk.Set] | None = None, *, recent: Iterable[str] = (), seed: Hashable = None,
+                    constraints: FormatConstraints = DEFAULT_CONSTRAINTS, catalog: CardCatalog | None = None) -> list[mtgsdk.Set]:
+    """Picks a format from sets, which defaults to every core and expansion set, that keeps to constraints and repeats none of
+    the sets in recent. format_size fixes the number of sets. Sets the card catalog doesn't know about yet are never picked,
+    and without a catalog the format is just a random sample of sets"""
+    if sets is None:
+        sets = all_true_sets()
+    if format_size is not None:
+        constraints = dataclasses.replace(constraints, min_sets=format_size, max_sets=format_size)
+    if catalog is None:
+        try:
+            catalog = get_catalog()
+        except (FileNotFoundError, CatalogVersionError) as err:
+            print(f"No usable card catalog, so the new format is picked without any constraints: {err}")
+    if catalog is not None:
+        sets_by_code = {set_.code.upper(): set_ for set_ in sets}
+        codes = choose_format(catalog.set_pool, sets_by_code, constraints, recent, seed)
+        if codes:
+            return [sets_by_code[code] for code in codes]
+    rng = random.Random(seed)
+    return rng.sample(sets, min(len(sets), rng.randint(constraints.min_sets, constraints.max_sets)))
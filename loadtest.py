@@ -0,0 +1,420 @@
+__author__ = "Duncan Seibert"
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+import APIutils
+import card_catalog
+import metrics
+from benchmarks import synthetic_catalog
+
+DEFAULT_OPERATIONS = 2000
+DEFAULT_CONCURRENCY = 50
+# relative frequency of each operation in the mixed workload. A game is submitted with /game, then confirmed or canceled
+# by the opponent with the buttons on the message the bot sent them
+DEFAULT_MIX = {'game': 4, 'verify': 2, 'rating': 2, 'rank': 2, 'leaderboard': 1, 'register': 1}
+CONFIRM_CHANCE = 0.9  # the rest of the games are canceled by the opponent
+
+
+class FakeDiscord:
+    """Stands in for discord's API. Every call the handlers make through the fake objects below waits latency seconds,
+    like a request to discord would, and is counted"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.channels: dict[int, 'FakeChannel'] = {}
+        self._ids = itertools.count(1 << 40)  # snowflake sized, so they're stored the way real ids are
+
+    def new_id(self) -> int:
+        return next(self._ids)
+
+    async def call(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+
+class FakeRole:
+    def __init__(self, api: FakeDiscord, name: str):
+        self.id = api.new_id()
+        self.name = name
+
+    @property
+    def mention(self):
+        return f'<@&{self.id}>'
+
+
+class FakeMessage:
+    def __init__(self, api: FakeDiscord, channel: 'FakeChannel', content: str | None = None, components: list | None = None):
+        self._api = api
+        self.id = api.new_id()
+        self.channel = channel
+        self.content = content
+        self.components = components or []
+
+    async def edit(self, content: str | None = None, components: list | None = None, **fields):
+        await self._api.call()
+        if content is not None:
+            self.content = content
+        if components is not None:
+            self.components = components
+
+
+class FakeChannel:
+    def __init__(self, api: FakeDiscord, name: str):
+        self._api = api
+        self.id = api.new_id()
+        self.name = name
+        self.messages: dict[int, FakeMessage] = {}
+        api.channels[self.id] = self
+
+    async def send(self, content: str | None = None, components: list | None = None, **fields) -> FakeMessage:
+        await self._api.call()
+        message = FakeMessage(self._api, self, content, components)
+        self.messages[message.id] = message
+        return message
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return self.messages[message_id]
+
+
+class FakeMember:
+    def __init__(self, api: FakeDiscord, guild: 'FakeGuild', name: str):
+        self._api = api
+        self.id = api.new_id()
+        self.name = name
+        self.discriminator = '0001'
+        self.guild = guild
+        self.roles: list[FakeRole] = [guild.default_role]
+        self.dm_channel = FakeChannel(api, f'dm-{name}')
+
+    @property
+    def mention(self):
+        return f'<@{self.id}>'
+
+    async def add_roles(self, *roles: FakeRole):
+        await self._api.call()
+        self.roles.extend(role for role in roles if role not in self.roles)
+
+    async def send(self, content: str | None = None, **fields) -> FakeMessage:
+        return await self.dm_channel.send(content, **fields)
+
+
+class FakeGuild:
+    """A guild with n_members members and nothing else. The bot makes its role and channels itself, as it would in a new guild"""
+
+    def __init__(self, api: FakeDiscord, name: str, n_members: int):
+        self._api = api
+        self.id = api.new_id()
+        self.name = name
+        self.default_role = FakeRole(api, '@everyone')
+        self.roles: list[FakeRole] = [self.default_role]
+        self.channels: list[FakeChannel] = []
+        self.members = [FakeMember(api, self, f'{name}-player{i}') for i in range(n_members)]
+        self._members_by_id = {member.id: member for member in self.members}
+
+    def get_role(self, role_id: int) -> FakeRole | None:
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    def get_channel(self, channel_id: int) -> FakeChannel | None:
+        return next((channel for channel in self.channels if channel.id == channel_id), None)
+
+    async def getch_member(self, member_id: int) -> FakeMember:
+        return self._members_by_id[member_id]  # always cached, since the bot would have the members intent
+
+    async def getch_members(self, member_ids: list[int]) -> list[FakeMember]:
+        return [self._members_by_id[member_id] for member_id in member_ids if member_id in self._members_by_id]
+
+    async def create_role(self, name: str, **fields) -> FakeRole:
+        await self._api.call()
+        role = FakeRole(self._api, name)
+        self.roles.append(role)
+        return role
+
+    async def create_text_channel(self, name: str, **fields) -> FakeChannel:
+        await self._api.call()
+        channel = FakeChannel(self._api, name)
+        self.channels.append(channel)
+        return channel
+
+
+class FakeAttachment:
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self._data = data
+
+    async def read(self) -> bytes:
+        return self._data
+
+
+class FakeResponse:
+    def __init__(self, inter: 'FakeInteraction'):
+        self._inter = inter
+
+    async def defer(self, **fields):
+        await self._inter._api.call()
+        self._inter.responded = True
+
+    async def send_message(self, content: str | None = None, **fields):
+        await self._inter.send(content, **fields)
+
+    async def edit_message(self, **fields):
+        await self._inter.edit_original_message(**fields)
+
+
+class FakeComponent:
+    def __init__(self, custom_id: str):
+        self.custom_id = custom_id
+
+
+class FakeInteraction:
+    """A slash command or button interaction from user. A button interaction's original message is the message the button was on"""
+
+    def __init__(self, api: FakeDiscord, guild: FakeGuild | None, user: FakeMember, message: FakeMessage | None = None, custom_id: str | None = None):
+        self._api = api
+        self.id = api.new_id()
+        self.token = f'token-{self.id}'
+        self.guild = guild
+        self.user = self.author = user
+        self.response = FakeResponse(self)
+        self.responded = False
+        self.command_failed = False
+        self.component = FakeComponent(custom_id) if custom_id is not None else None
+        self._channel = message.channel if message is not None else FakeChannel(api, f'interaction-{self.id}')
+        self.message = message
+        self.sent: list[FakeMessage] = []
+
+    async def send(self, content: str | None = None, **fields) -> None:
+        message = await self._channel.send(content, **fields)
+        self.sent.append(message)
+        if self.message is None:
+            self.message = message
+        self.responded = True
+
+    async def edit_original_message(self, **fields):
+        if self.message is None:
+            self.message = await self._channel.send()
+        await self.message.edit(**fields)
+
+    async def original_message(self) -> FakeMessage:
+        await self._api.call()
+        return self.message
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """The nearest rank qth percentile of an already sorted, non-empty list"""
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values) + 0.5) - 1))]
+
+
+class LoadTest:
+    """Runs the bot's real command and button handlers, and its quarterly rollover, against fake guilds, with a synthetic
+    card catalog and databases in a temporary directory, so nothing touches discord, mtgsdk or the real databases.
+    Only discord's side is faked: the handlers, the database methods and the worker threads they run on are the bot's own"""
+
+    def __init__(self, bot, cog, api: FakeDiscord, guilds: list[FakeGuild], seed=0):
+        self.bot = bot
+        self.cog = cog
+        self.api = api
+        self.guilds = guilds
+        self.rng = random.Random(seed)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, list[BaseException]] = defaultdict(list)
+        self._decklists: dict[int, list[bytes]] = {}
+
+    async def timed(self, operation: str, coroutine):
+        start = time.perf_counter()
+        try:
+            await coroutine
+        except Exception as err:
+            self.errors[operation].append(err)
+        else:
+            self.latencies[operation].append(time.perf_counter() - start)
+
+    async def setup(self, concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def join(guild: FakeGuild):
+            async with semaphore:
+                await self.timed('setup', self.bot.on_guild_join(guild))
+
+        await asyncio.gather(*(join(guild) for guild in self.guilds))
+        for guild in self.guilds:
+            legal_cards = sorted(await self.bot.run_blocking(self.bot.get_legal_cards, guild))
+            all_cards = sorted(card_catalog.get_catalog().card_names)
+            # mostly legal decks, which are the slowest to verify since every card is checked, with the odd illegal card
+            self._decklists[guild.id] = [self._decklist(legal_cards, all_cards, illegal=i % 5 == 0).encode() for i in range(20)]
+
+    def _decklist(self, legal_cards: list[str], all_cards: list[str], illegal: bool) -> str:
+        names = self.rng.sample(legal_cards, min(15, len(legal_cards)))
+        if illegal:
+            names[-1] = self.rng.choice(all_cards)
+        maindeck = '\n'.join(f'4 {name}' for name in names)
+        sideboard = '\n'.join(f'1 {name}' for name in names[:5])
+        return f'Deck\n{maindeck}\n\nSideboard\n{sideboard}\n'
+
+    async def register_all(self, concurrency: int):
+        """Registers every member, as happens when a league starts, so the mixed workload has players to work with"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def register(member: FakeMember):
+            async with semaphore:
+                await self.run('register', member.guild, member)
+
+        await asyncio.gather(*(register(member) for guild in self.guilds for member in guild.members))
+
+    async def run(self, operation: str, guild: FakeGuild, user: FakeMember | None = None):
+        import BotMain
+        user = user or self.rng.choice(guild.members)
+        inter = FakeInteraction(self.api, guild, user)
+        if operation == 'register':
+            await self.timed(operation, BotMain.register.callback(inter))
+        elif operation == 'rating':
+            await self.timed(operation, BotMain.rating.callback(inter))
+        elif operation == 'rank':
+            await self.timed(operation, BotMain.rank_command.callback(inter, player=None))
+        elif operation == 'leaderboard':
+            await self.timed(operation, BotMain.leaderboard_command.callback(inter))
+        elif operation == 'verify':
+            attachment = FakeAttachment('deck.txt', self.rng.choice(self._decklists[guild.id]))
+            await self.timed(operation, BotMain.verify.callback(inter, decklist_file=attachment))
+        elif operation == 'game':
+            opponent = self.rng.choice([member for member in guild.members if member is not user])
+            await self.timed(operation, BotMain.game_command.callback(inter, opponent=opponent, submitter_score=2,
+                                                                      opponent_score=self.rng.randint(0, 1), ties=0))
+            prompts = [message for message in opponent.dm_channel.messages.values() if message.components]
+            if not prompts:
+                return  # the submission failed, which was recorded above
+            prompt = prompts[-1]
+            action = 'confirm' if self.rng.random() < CONFIRM_CHANCE else 'cancel'
+            button = next(button for button in prompt.components if button.custom_id.split(':')[2] == action)
+            click = FakeInteraction(self.api, None, opponent, prompt, button.custom_id)
+            await self.timed(action, BotMain.game_button(click))
+        else:
+            raise ValueError(f"Unknown operation {operation!r}")
+
+    async def mixed(self, operations: int, concurrency: int, mix: dict[str, int]):
+        """Runs operations randomly chosen operations, weighted by mix, with concurrency of them in flight at once"""
+        names, weights = list(mix), list(mix.values())
+        remaining = iter(range(operations))
+
+        async def worker():
+            for _ in remaining:
+                guild = self.rng.choice(self.guilds)
+                await self.run(self.rng.choices(names, weights)[0], guild)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def roll_over(self, quarter: str, concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def roll_over(guild: FakeGuild):
+            async with semaphore:
+                await self.timed('quarterly_update', self.cog.quarterly_update(guild, quarter))
+
+        await asyncio.gather(*(roll_over(guild) for guild in self.guilds))
+
+    def report(self, wall_seconds: float) -> dict:
+        results = {}
+        for operation in sorted(self.latencies.keys() | self.errors.keys()):
+            latencies = sorted(self.latencies.get(operation, ()))
+            results[operation] = {'count': len(latencies), 'errors': len(self.errors.get(operation, ())),
+                                  'p50': percentile(latencies, 50) if latencies else None,
+                                  'p99': percentile(latencies, 99) if latencies else None,
+                                  'max': latencies[-1] if latencies else None}
+        total = sum(result['count'] for result in results.values())
+        return {'operations': results, 'total': total, 'seconds': wall_seconds, 'throughput': total / wall_seconds, 'api_calls': self.api.calls}
+
+
+def use_synthetic_sets(catalog: card_catalog.CardCatalog, directory: str):
+    """Points APIutils at a freshly written set list made from the catalog's sets, so format generation never fetches the real one"""
+    path = os.path.join(directory, 'set_cache.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'fetched': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                   'sets': [{'code': set_.code, 'name': set_.name, 'type': set_.type, 'block': set_.block,
+                             'releaseDate': set_.release_date, 'onlineOnly': False} for set_ in catalog.sets]}, f)
+    APIutils.SET_REGISTRY = APIutils.SetRegistry(path)
+
+
+def print_report(report: dict):
+    print(f"{'operation':<18}{'count':>8}{'errors':>8}{'p50':>12}{'p99':>12}{'max':>12}")
+    for operation, result in report['operations'].items():
+        times = ''.join(f"{result[key] * 1000:>10.2f}ms" if result[key] is not None else f"{'-':>12}" for key in ('p50', 'p99', 'max'))
+        print(f"{operation:<18}{result['count']:>8}{result['errors']:>8}{times}")
+    print(f"{report['total']} operations in {report['seconds']:.2f}s, {report['throughput']:.1f} operations/s, "
+          f"{report['api_calls']} simulated discord requests")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load tests the bot's command and button handlers against fake guilds, entirely offline. "
+                                                 "Still needs a private_info.py to import the bot, but nothing is sent to discord")
+    parser.add_argument('--guilds', type=int, default=5)
+    parser.add_argument('--members', type=int, default=200, help='Members per guild, all of whom register')
+    parser.add_argument('--operations', type=int, default=DEFAULT_OPERATIONS, help='Operations in the mixed workload')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Operations in flight at once')
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated milliseconds per discord request')
+    parser.add_argument('--cards', type=int, default=30000, help='Cards in the synthetic catalog')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='Where to save the results, and the bot\'s own metrics, as json')
+    parser.add_argument('--verbose', action='store_true', help="Show what the bot prints while it's under load")
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(n_cards=args.cards, seed=args.seed)
+    card_catalog.use_catalog(catalog)
+    directory = tempfile.mkdtemp(prefix='randard-loadtest-')
+    use_synthetic_sets(catalog, directory)
+
+    import BotMain
+    bot = BotMain.bot
+    cog = bot.get_cog('RandardMaintenanceCog')
+    cog.cog_unload()  # the loops would wait for a gateway connection that never comes
+    bot.db_path = os.path.join(directory, '')
+    api = FakeDiscord(args.latency / 1000)
+    guilds = [FakeGuild(api, f'guild{i}', args.members) for i in range(args.guilds)]
+    guilds_by_id = {guild.id: guild for guild in guilds}
+    bot.get_guild = guilds_by_id.get
+    bot.get_partial_messageable = api.channels.__getitem__
+
+    async def edit_interaction_message(token: str, message_id: int, **fields):
+        await api.call()
+
+    bot.edit_interaction_message = edit_interaction_message
+    test = LoadTest(bot, cog, api, guilds, args.seed)
+    next_quarter = bot.quarter_of(datetime.date.today() + datetime.timedelta(days=92))
+
+    async def run() -> dict:
+        await test.setup(args.concurrency)
+        start = time.perf_counter()
+        await test.register_all(args.concurrency)
+        await test.mixed(args.operations, args.concurrency, DEFAULT_MIX)
+        await test.roll_over(next_quarter, args.concurrency)
+        return test.report(time.perf_counter() - start)
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            report = bot.loop.run_until_complete(run())
+    finally:
+        bot.blocking.shutdown()
+        bot.db_pool.close_all()
+        shutil.rmtree(directory, ignore_errors=True)
+    print_report(report)
+    for operation, errors in test.errors.items():
+        print(f"first {operation} error: {errors[0]!r}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'report': report, 'metrics': metrics.METRICS.snapshot()}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+__author__ = "Duncan Seibert"
+
+import asyncio
+import bisect
+import contextlib
+import cProfile
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+EVENT_LOOP_LAG_INTERVAL = 0.5  # seconds between event loop lag samples
+DUMP_INTERVAL = 60  # seconds between json dumps
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last count is for values above every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list[int]:
+        total, cumulative = 0, []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Metrics:
+    """Latency histograms and counters, keyed by metric name and labels, that any thread can record to.
+    Rendered in the Prometheus text format for serve, or as json for dump"""
+
+    def __init__(self):
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple[str, Labels]:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextlib.contextmanager
+    def timed(self, name: str, **labels) -> Iterator[None]:
+        """Records how long the block takes under name, with an outcome label of 'ok', or 'error' if it raised"""
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            yield
+            outcome = 'ok'
+        finally:
+            self.observe(name, time.perf_counter() - start, outcome=outcome, **labels)
+
+    def instrument(self, name: str, **labels) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """Decorates a function, or a coroutine function, so every call to it is timed"""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def timed_coroutine(*args, **kwargs):
+                    with self.timed(name, **labels):
+                        return await func(*args, **kwargs)
+                return timed_coroutine
+
+            @functools.wraps(func)
+            def timed_function(*args, **kwargs):
+                with self.timed(name, **labels):
+                    return func(*args, **kwargs)
+            return timed_function
+        return decorator
+
+    def instrument_methods(self, name: str, label: str = 'method'):
+        """Class decorator that times every public, synchronous method the class itself defines, labeled with the method's name"""
+        def decorator(cls):
+            for attribute, value in list(vars(cls).items()):
+                if not attribute.startswith('_') and inspect.isfunction(value) and not inspect.iscoroutinefunction(value):
+                    setattr(cls, attribute, self.instrument(name, **{label: attribute})(value))
+            return cls
+        return decorator
+
+    def render(self) -> str:
+        """Everything recorded so far, in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {key: (histogram.buckets, histogram.cumulative_counts(), histogram.sum, histogram.count)
+                          for key, histogram in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{name}{_format_labels(labels)} {value}' for (metric, labels), value in sorted(counters.items()) if metric == name)
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, labels), (buckets, cumulative, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, bucket_count in zip((*map(str, buckets), '+Inf'), cumulative):
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {bucket_count}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+                lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'time': time.time(),
+                    'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in self._counters.items()],
+                    'histograms': [{'name': name, 'labels': dict(labels), 'buckets': list(histogram.buckets), 'counts': list(histogram.counts),
+                                    'sum': histogram.sum, 'count': histogram.count}
+                                   for (name, labels), histogram in self._histograms.items()]}
+
+    def dump(self, path: str):
+        """Writes a json snapshot to path. It's written to a temporary file first so readers never see a partial file"""
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + '}'
+
+
+METRICS = Metrics()
+observe = METRICS.observe
+increment = METRICS.increment
+timed = METRICS.timed
+instrument = METRICS.instrument
+instrument_methods = METRICS.instrument_methods
+
+
+async def monitor_event_loop(interval: float = EVENT_LOOP_LAG_INTERVAL, metrics: Metrics = METRICS):
+    """Records how late the event loop wakes up from a sleep, which is how long something blocked it, until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe('randard_event_loop_lag_seconds', max(0.0, loop.time() - start - interval))
+
+
+async def dump_periodically(path: str, interval: float = DUMP_INTERVAL, metrics: Metrics = METRICS):
+    while True:
+        await asyncio.sleep(interval)
+        metrics.dump(path)
+
+
+async def serve(port: int, host: str = '127.0.0.1', metrics: Metrics = METRICS) -> asyncio.AbstractServer:
+    """Serves /metrics in the Prometheus text format and /metrics.json as json, on localhost by default"""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # the headers aren't needed
+            path = request_line.split()[1].decode() if len(request_line.split()) > 1 else ''
+            if path == '/metrics':
+                status, content_type, body = '200 OK', 'text/plain; version=0.0.4', metrics.render()
+            elif path == '/metrics.json':
+                status, content_type, body = '200 OK', 'application/json', json.dumps(metrics.snapshot())
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', 'not found\n'
+            body = body.encode()
+            writer.write(f'HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+class CommandProfiler:
+    """Runs cProfile over a sample of the invocations of the chosen slash commands, and saves each profile to directory as
+    <command>-<timestamp>.prof, for use with pstats or snakeviz.
+    Only one invocation is profiled at a time. The profiler sees everything the event loop runs while the command is
+    awaiting, so other tasks' work shows up in the profile too"""
+
+    def __init__(self, commands: Iterable[str], sample_rate: float, directory: str):
+        self.commands = frozenset(commands)
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self._active: tuple[int, str, cProfile.Profile] | None = None
+
+    def start(self, invocation_id: int, command: str):
+        if self._active is not None or command not in self.commands or random.random() >= self.sample_rate:
+            return
+        profile = cProfile.Profile()
+        self._active = invocation_id, command, profile
+        profile.enable()
+
+    def stop(self, invocation_id: int):
+        if self._active is None or self._active[0] != invocation_id:
+            return
+        _, command, profile = self._active
+        profile.disable()
+        self._active = None
+        os.makedirs(self.directory, exist_ok=True)
+        profile.dump_stats(os.path.join(self.directory, f'{command}-{time.strftime("%Y%m%d-%H%M%S")}-{invocation_id}.prof'))
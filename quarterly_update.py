@@ -1,15 +1,22 @@
+import asyncio
 import dataclasses
 import datetime
 
 import disnake
 from disnake.ext import commands, tasks
 
+import metrics
 from RandardBot import RandardBot
-from format_chooser import generate_format
+from blocking_executor import SLOW_TIMEOUT
+from format_chooser import RECENT_SEASONS, generate_format
+from standings import ordinal
+
+ROLLOVER_CONCURRENCY = 5  # guilds rolled over at once
 
 
 @dataclasses.dataclass
 class LeaderboardEntry:
+    place: int
     user: disnake.Member
     rating: int
 
@@ -18,32 +25,90 @@ class RandardMaintenanceCog(commands.Cog):
     def __init__(self, bot):
         self.bot: RandardBot = bot
         self.update_loop.start()
+        self.expiry_loop.start()
 
     def cog_unload(self):
         self.update_loop.cancel()
+        self.expiry_loop.cancel()
 
     @tasks.loop(time=datetime.time(hour=10))
     async def update_loop(self):
-        today = datetime.date.today()
-        if today.day == 1 and today.month % 3 == 1:
-            for guild in self.bot.guilds:
-                await self.quarterly_update(guild)
-
-    async def quarterly_update(self: RandardBot, guild: disnake.Guild):
-        ORDINALS = ["1st", "2nd", "3rd", "4th", "5th", "6th", "7th", "8th", "9th", "10th"]
-        old_season_number = self.get_season_number(guild)
-        leaderboard = self.store_leaderboard(guild)
-        leaderboard = [LeaderboardEntry(await guild.getch_member(player['discord_id']), player['rating']) for player in leaderboard]
-        self.clear_ratings(guild)
-        new_format = generate_format()
-        self.store_format(new_format, guild)
-        new_season_number = self.get_season_number(guild)
-        player_role = await self.get_player_role(guild)
-        announcements_channel = await self.get_announcements_channel(guild)
-        header = f"Attention {player_role.mention}s!\nSeason {old_season_number} has ended, and season {new_season_number} is upon us.\nFirst, our leaderboard: \n"
-        leaderboard_announcement = '\n'.join(f"{ORDINALS[i]} Place: {player.user.mention:}" for i, player in enumerate(leaderboard))
+        # rather than only running on the first of the quarter, every guild that hasn't rolled over this quarter yet is
+        # caught up, which also resumes a rollover that was interrupted by a crash or restart
+        await self.roll_over_all(self.bot.quarter_of(datetime.date.today()))
+
+    @update_loop.before_loop
+    async def before_update_loop(self):
+        # bot.guilds is empty until the gateway is ready, so a rollover run any earlier would quietly skip every guild
+        await self.bot.wait_until_ready()
+
+    async def roll_over_all(self, quarter: str):
+        """Runs quarterly_update for every guild, at most ROLLOVER_CONCURRENCY at a time so the bot's requests are spread
+        out under discord's rate limits instead of arriving all at once. One guild failing doesn't stop the others"""
+        semaphore = asyncio.Semaphore(ROLLOVER_CONCURRENCY)
+
+        async def roll_over(guild: disnake.Guild):
+            async with semaphore:
+                with metrics.timed('randard_quarterly_update_seconds'):
+                    await self.quarterly_update(guild, quarter)
+
+        guilds = list(self.bot.guilds)
+        results = await asyncio.gather(*(roll_over(guild) for guild in guilds), return_exceptions=True)
+        for guild, result in zip(guilds, results):
+            if isinstance(result, Exception):
+                print(f"Quarterly update failed for {guild.name} with id {guild.id}, it will be retried tomorrow: {result!r}")
+
+    @tasks.loop(minutes=15)
+    async def expiry_loop(self):
+        """Expires pending games their opponents never answered, including any that expired while the bot was offline,
+        and takes the buttons off their messages"""
+        for guild in self.bot.guilds:
+            expired = await self.bot.run_blocking(self.bot.expire_pending_games, guild)
+            for game in expired:
+                if game['opponent_message_id'] is None:
+                    continue
+                message = self.bot.get_partial_messageable(game['opponent_channel_id']).get_partial_message(game['opponent_message_id'])
+                try:
+                    await message.edit(components=[])
+                except disnake.HTTPException:
+                    pass
+            if expired:
+                metrics.increment('randard_pending_games_total', len(expired), outcome='expired')
+                print(f"expired {len(expired)} pending games in {guild.name}")
+
+    @expiry_loop.before_loop
+    async def before_expiry_loop(self):
+        await self.bot.wait_until_ready()
+
+    async def quarterly_update(self, guild: disnake.Guild, quarter: str | None = None):
+        """Rolls the guild over to a new season for the given quarter, defaulting to the current one, and announces it.
+        Each step is checkpointed in the guild's rollovers table, so calling this again for the same quarter only finishes
+        whatever hadn't been done yet"""
+        if quarter is None:
+            quarter = self.bot.quarter_of(datetime.date.today())
+        rollover = await self.bot.run_blocking(self.bot.get_rollover, guild, quarter)
+        if rollover is None:
+            recent = await self.bot.run_blocking(self.bot.get_recent_set_codes, guild, RECENT_SEASONS)
+            # seeded by guild and quarter, so a rollover retried after a crash picks the same format as the first attempt
+            new_format = await self.bot.run_blocking(generate_format, recent=recent, seed=f'{guild.id}:{quarter}', timeout=SLOW_TIMEOUT)
+            rollover = await self.bot.run_blocking(self.bot.roll_over_season, guild, quarter, new_format, timeout=SLOW_TIMEOUT)
+        if rollover['announced']:
+            return
+
+        stored_leaderboard = await self.bot.run_blocking(self.bot.get_stored_leaderboard, guild, rollover['old_season_number'])
+        # one batch of websocket requests for whoever isn't cached, instead of a getch_member call per player.
+        # Players who have since left the guild aren't returned, and are left out of the announcement, without moving anyone else up
+        members = {member.id: member for member in await guild.getch_members([int(player['discord_id']) for player in stored_leaderboard])}
+        leaderboard = [LeaderboardEntry(player['place'], members[int(player['discord_id'])], player['rating']) for player in stored_leaderboard
+                       if int(player['discord_id']) in members]
+        new_format_names = await self.bot.run_blocking(self.bot.get_legal_set_names, guild)
+        player_role = await self.bot.get_player_role(guild)
+        announcements_channel = await self.bot.get_announcements_channel(guild)
+        header = f"Attention {player_role.mention}s!\nSeason {rollover['old_season_number']} has ended, and season {rollover['new_season_number']} is upon us.\nFirst, our leaderboard: \n"
+        leaderboard_announcement = '\n'.join(f"{ordinal(player.place)} Place: {player.user.mention}" for player in leaderboard)
         new_format_header = '\n\nAnd now, our new format:\n'
-        new_format_announcement = '\n'.join(set_.name for set_ in new_format)
+        new_format_announcement = '\n'.join(new_format_names)
         signoff = '\n\nGood luck and happy deckbuilding!'
         compiled_message = header+leaderboard_announcement+new_format_header+new_format_announcement+signoff
         await announcements_channel.send(compiled_message)
+        await self.bot.run_blocking(self.bot.mark_rollover_announced, guild, quarter)
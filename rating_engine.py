@@ -0,0 +1,67 @@
+__author__ = "Duncan Seibert"
+
+import dataclasses
+from typing import Iterable
+
+STARTING_RATING = 1000
+K_FACTOR = 40  # ELO constant. Higher k means scores change faster, 40 is rather high
+
+
+@dataclasses.dataclass(frozen=True)
+class GameRecord:
+    """One confirmed match between two players, as stored in the games table"""
+    submitter_id: str
+    opponent_id: str
+    submitter_games_won: int
+    opponent_games_won: int
+    ties: int = 0
+
+    @property
+    def total_games(self):
+        return self.submitter_games_won + self.opponent_games_won + self.ties
+
+
+class RatingSystem:
+    """Base class for the ways a player's rating can be calculated from their games.
+    Subclasses implement rate, and the rest of the bot only ever goes through it, so switching rating systems is just
+    a matter of recomputing the season with RandardBot.recompute_ratings"""
+    starting_rating: float = STARTING_RATING
+
+    def rate(self, submitter_rating: float, opponent_rating: float, game: GameRecord) -> tuple[float, float]:
+        """Returns the submitter's and opponent's new ratings after the given game"""
+        raise NotImplementedError
+
+    def replay(self, games: Iterable[GameRecord]) -> tuple[dict[str, float], list[tuple[float, float]]]:
+        """Applies every game, in order, to players who all start at starting_rating.
+        Returns the final rating of every player who played, and the ratings both players went into each game with"""
+        ratings: dict[str, float] = {}
+        starting_ratings: list[tuple[float, float]] = []
+        starting_rating = self.starting_rating
+        rate = self.rate
+        for game in games:
+            before = ratings.get(game.submitter_id, starting_rating), ratings.get(game.opponent_id, starting_rating)
+            starting_ratings.append(before)
+            ratings[game.submitter_id], ratings[game.opponent_id] = rate(*before, game)
+        return ratings, starting_ratings
+
+
+@dataclasses.dataclass(frozen=True)
+class Elo(RatingSystem):
+    """The ELO variant the bot has always used, where each game in a match counts separately and ties are half a win"""
+    k: float = K_FACTOR
+    starting_rating: float = STARTING_RATING
+
+    def rate(self, submitter_rating: float, opponent_rating: float, game: GameRecord) -> tuple[float, float]:
+        total_games = game.total_games
+        games_won = game.submitter_games_won + (game.ties / 2)
+        games_lost = game.opponent_games_won + (game.ties / 2)
+
+        submitter_expected_score = total_games/(1+10**((opponent_rating-submitter_rating)/400))
+        opponent_expected_score = total_games-submitter_expected_score
+
+        submitter_rating_change = self.k*(games_won - submitter_expected_score)
+        opponent_rating_change = self.k*(games_lost - opponent_expected_score)
+        return submitter_rating + submitter_rating_change, opponent_rating + opponent_rating_change
+
+
+DEFAULT_RATING_SYSTEM = Elo()
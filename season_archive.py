@@ -0,0 +1,75 @@
+__author__ = "Duncan Seibert"
+
+import sqlite3
+
+# the record of every finished season, and totals over all of them. Part of storage.SCHEMA
+SCHEMA = (
+    # every player's final place in each finished season, and their record of matches in it
+    "CREATE TABLE season_standings(guild_id INTEGER, season_number INTEGER, place INTEGER, discord_id TEXT, name TEXT, rating REAL, "
+    "matches INT DEFAULT 0, match_wins INT DEFAULT 0, match_losses INT DEFAULT 0, match_draws INT DEFAULT 0, "
+    "PRIMARY KEY (guild_id, season_number, place)) WITHOUT ROWID",
+    "CREATE INDEX season_standings_by_player ON season_standings(guild_id, discord_id, season_number)",
+    # each player's totals over every finished season, added to as each season is tallied, so /stats reads a single row
+    "CREATE TABLE player_totals(guild_id INTEGER, discord_id TEXT, name TEXT, seasons INT, titles INT, podiums INT, best_place INT, "
+    "best_rating REAL, matches INT, match_wins INT, match_losses INT, match_draws INT, PRIMARY KEY (guild_id, discord_id)) WITHOUT ROWID",
+    "CREATE INDEX player_totals_by_titles ON player_totals(guild_id, titles, podiums, best_rating)",
+    # how many finished seasons each set was legal in, and how many matches were played in those seasons
+    "CREATE TABLE set_totals(guild_id INTEGER, set_code TEXT, set_name TEXT, seasons INT, matches INT, PRIMARY KEY (guild_id, set_code)) WITHOUT ROWID",
+    "CREATE INDEX set_totals_by_matches ON set_totals(guild_id, matches, seasons)",
+)
+
+# each player's wins, losses and draws in one season, read off the games_by_season index
+_MATCH_RECORDS = (
+    "SELECT discord_id, COUNT(*) AS matches, SUM(won) AS match_wins, SUM(lost) AS match_losses, SUM(NOT won AND NOT lost) AS match_draws FROM ("
+    "SELECT submitter_id AS discord_id, submitter_games_won > opponent_games_won AS won, submitter_games_won < opponent_games_won AS lost "
+    "FROM games WHERE guild_id=:guild_id AND season_number=:season_number "
+    "UNION ALL SELECT opponent_id, opponent_games_won > submitter_games_won, opponent_games_won < submitter_games_won "
+    "FROM games WHERE guild_id=:guild_id AND season_number=:season_number) GROUP BY discord_id"
+)
+
+
+def archive_season(con: sqlite3.Connection, guild_id: int, season_number: int):
+    """Snapshots every registered player's place and rating as the final standings of the season, then tallies it.
+    Has to run exactly once per season, before the ratings are reset, which RandardBot.roll_over_season makes sure of"""
+    con.execute("INSERT INTO season_standings(guild_id, season_number, place, discord_id, name, rating) "
+                "SELECT guild_id, ?, ROW_NUMBER() OVER (ORDER BY rating DESC, discord_id DESC), discord_id, name, rating FROM players WHERE guild_id=?",
+                [season_number, guild_id])
+    tally_season(con, guild_id, season_number)
+
+
+def tally_season(con: sqlite3.Connection, guild_id: int, season_number: int, imported: bool = False):
+    """Fills in the match records of a season's standings and its winner, and adds it to the player and set totals.
+    Only the one season's rows are read, so the cost doesn't grow with the number of seasons played.
+    The winner is whoever finished 1st, unless no games were played at all. Standings that were imported from before the
+    archive often have no games in the ledger, so for those whoever finished 1st is always the winner"""
+    params = {'guild_id': guild_id, 'season_number': season_number}
+    con.execute(f"UPDATE season_standings SET matches=records.matches, match_wins=records.match_wins, match_losses=records.match_losses, "
+                f"match_draws=records.match_draws FROM ({_MATCH_RECORDS}) AS records "
+                f"WHERE guild_id=:guild_id AND season_number=:season_number AND season_standings.discord_id=records.discord_id", params)
+    matches = con.execute("SELECT COUNT(*) FROM games WHERE guild_id=:guild_id AND season_number=:season_number", params).fetchone()[0]
+    winner = con.execute("SELECT discord_id FROM season_standings WHERE guild_id=:guild_id AND season_number=:season_number AND place=1",
+                         params).fetchone() if matches or imported else None
+    con.execute("UPDATE seasons SET winner=? WHERE guild_id=? AND season_number=?", [winner[0] if winner else None, guild_id, season_number])
+    # the WHERE true is so sqlite doesn't read ON CONFLICT as the start of a join constraint
+    con.execute("INSERT INTO player_totals(guild_id, discord_id, name, seasons, titles, podiums, best_place, best_rating, matches, match_wins, match_losses, match_draws) "
+                "SELECT guild_id, discord_id, name, 1, place = 1 AND :has_winner, place <= 3, place, rating, matches, match_wins, match_losses, match_draws "
+                "FROM season_standings WHERE guild_id=:guild_id AND season_number=:season_number AND true "
+                "ON CONFLICT (guild_id, discord_id) DO UPDATE SET name=excluded.name, seasons=seasons + 1, titles=titles + excluded.titles, "
+                "podiums=podiums + excluded.podiums, best_place=MIN(best_place, excluded.best_place), best_rating=MAX(best_rating, excluded.best_rating), "
+                "matches=matches + excluded.matches, match_wins=match_wins + excluded.match_wins, match_losses=match_losses + excluded.match_losses, "
+                "match_draws=match_draws + excluded.match_draws", {**params, 'has_winner': winner is not None})
+    con.execute("INSERT INTO set_totals(guild_id, set_code, set_name, seasons, matches) "
+                "SELECT guild_id, set_code, set_name, 1, :matches FROM season_sets WHERE guild_id=:guild_id AND season_number=:season_number AND true "
+                "ON CONFLICT (guild_id, set_code) DO UPDATE SET set_name=excluded.set_name, seasons=seasons + 1, matches=matches + excluded.matches",
+                {**params, 'matches': matches})
+
+
+def tally_past_seasons(con: sqlite3.Connection, guild_id: int | None = None):
+    """Tallies every season but the current one, of one guild or of all of them, for databases whose standings were
+    imported from before there was an archive. Seasons are tallied in order, so each player's totals end up under their latest name"""
+    guild_filter = "AND guild_id=?" if guild_id is not None else ""
+    seasons = con.execute(f"SELECT guild_id, season_number FROM seasons AS s WHERE season_number < "
+                          f"(SELECT MAX(season_number) FROM seasons WHERE guild_id=s.guild_id) {guild_filter} ORDER BY guild_id, season_number",
+                          [guild_id] if guild_id is not None else []).fetchall()
+    for season_guild_id, season_number in seasons:
+        tally_season(con, season_guild_id, season_number, imported=True)
@@ -0,0 +1,81 @@
+__author__ = "Duncan Seibert"
+
+import dataclasses
+from typing import TYPE_CHECKING, Iterable
+
+from APIutils import Block, Set_code
+
+if TYPE_CHECKING:
+    from card_catalog import CardCatalog
+
+COLORS = 'WUBRG'
+
+
+@dataclasses.dataclass(frozen=True)
+class SetStats:
+    code: Set_code
+    type: str
+    block: Block | None
+    release_date: str | None
+    card_count: int
+    color_counts: tuple[int, ...]  # how many of the set's cards are each color, in WUBRG order
+
+
+class SetPool:
+    """Per-set statistics for generating formats, computed in one pass over a card catalog.
+    Each set's cards are kept as a bitset over the catalog's card names, so the size and colors of any combination of sets,
+    with reprints only counted once, take a few integer ORs and popcounts instead of building set unions"""
+
+    def __init__(self, catalog: 'CardCatalog'):
+        names = sorted(catalog.card_names)
+        width = (len(names) + 7) // 8
+        set_bits: dict[Set_code, bytearray] = {}
+        color_bits = {color: bytearray(width) for color in COLORS}
+        for index, name in enumerate(names):
+            byte, bit = divmod(index, 8)
+            for code in catalog.printings(name):
+                set_bits.setdefault(code, bytearray(width))[byte] |= 1 << bit
+            for color in catalog.colors(name):
+                color_bits[color][byte] |= 1 << bit
+        self._cards: dict[Set_code, int] = {code: int.from_bytes(bits, 'little') for code, bits in set_bits.items()}
+        self._colors: tuple[int, ...] = tuple(int.from_bytes(color_bits[color], 'little') for color in COLORS)
+
+        self._stats: dict[Set_code, SetStats] = {}
+        blocks: dict[Block, list[SetStats]] = {}
+        for set_ in catalog.sets:
+            code = Set_code(set_.code.upper())
+            cards = self._cards.get(code, 0)
+            stats = SetStats(code, set_.type, set_.block, set_.release_date, cards.bit_count(), self._count_colors(cards))
+            self._stats[code] = stats
+            if set_.block:
+                blocks.setdefault(set_.block, []).append(stats)
+        # each block's sets in the order they were released
+        self._blocks: dict[Block, tuple[Set_code, ...]] = {
+            block: tuple(stats.code for stats in sorted(block_sets, key=lambda stats: (stats.release_date or '', stats.code)))
+            for block, block_sets in blocks.items()}
+
+    def __contains__(self, code: str) -> bool:
+        return code.upper() in self._stats
+
+    def __len__(self):
+        return len(self._stats)
+
+    def stats(self, code: str) -> SetStats:
+        return self._stats[Set_code(code.upper())]
+
+    def codes(self, *set_types: str) -> list[Set_code]:
+        """Returns the codes of every set with statistics, or only those of the given set types, in alphabetical order"""
+        return sorted(code for code, stats in self._stats.items() if not set_types or stats.type in set_types)
+
+    def block(self, block: Block) -> tuple[Set_code, ...]:
+        return self._blocks.get(block, ())
+
+    def measure(self, codes: Iterable[str]) -> tuple[int, tuple[int, ...]]:
+        """Returns how many distinct cards the given sets contain between them, and how many of those are each color"""
+        cards = 0
+        for code in codes:
+            cards |= self._cards.get(code.upper(), 0)
+        return cards.bit_count(), self._count_colors(cards)
+
+    def _count_colors(self, cards: int) -> tuple[int, ...]:
+        return tuple((cards & color).bit_count() for color in self._colors)
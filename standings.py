@@ -0,0 +1,65 @@
+__author__ = "Duncan Seibert"
+
+import bisect
+import threading
+from typing import Iterable
+
+LEADERBOARD_PAGE_SIZE = 10
+
+
+def ordinal(n: int) -> str:
+    """1 -> '1st', 2 -> '2nd', 11 -> '11th', 23 -> '23rd'"""
+    suffix = 'th' if 10 <= n % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
+    return f"{n}{suffix}"
+
+
+class Standings:
+    """Every registered player in a guild, kept sorted by (rating, discord_id) so that a player's rank and percentile are a
+    binary search instead of counting rows. Ties in rating are broken by discord_id, the same order the leaderboard's
+    keyset pagination uses. Built once from the players table, then updated as games are confirmed"""
+
+    def __init__(self, ratings: Iterable[tuple[str, float]] = ()):
+        self._ratings: dict[str, float] = {str(discord_id): rating for discord_id, rating in ratings}
+        self._keys: list[tuple[float, str]] = sorted((rating, discord_id) for discord_id, rating in self._ratings.items())
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, discord_id) -> bool:
+        return str(discord_id) in self._ratings
+
+    def update(self, discord_id, rating: float):
+        """Adds a player, or moves them to their new rating"""
+        discord_id = str(discord_id)
+        with self._lock:
+            old_rating = self._ratings.get(discord_id)
+            if old_rating is not None:
+                del self._keys[bisect.bisect_left(self._keys, (old_rating, discord_id))]
+            self._ratings[discord_id] = rating
+            bisect.insort(self._keys, (rating, discord_id))
+
+    def rating(self, discord_id) -> float | None:
+        return self._ratings.get(str(discord_id))
+
+    def rank(self, discord_id) -> int | None:
+        """The player's place in the standings, 1 being the highest rated, or None if they aren't registered"""
+        discord_id = str(discord_id)
+        with self._lock:
+            rating = self._ratings.get(discord_id)
+            if rating is None:
+                return None
+            return len(self._keys) - bisect.bisect_left(self._keys, (rating, discord_id))
+
+    def percentile(self, discord_id) -> float | None:
+        """The percentage of the other players who are ranked below the player"""
+        rank = self.rank(discord_id)
+        if rank is None:
+            return None
+        others = len(self._keys) - 1
+        return 100 * (others - (rank - 1)) / others if others else 100.0
+
+    def top(self, n: int = LEADERBOARD_PAGE_SIZE) -> list[tuple[str, float]]:
+        """The n highest rated players' discord ids and ratings, highest first"""
+        with self._lock:
+            return [(discord_id, rating) for rating, discord_id in reversed(self._keys[-n:])] if n else []
@@ -0,0 +1,268 @@
+__author__ = "Duncan Seibert"
+
+import argparse
+import datetime
+import glob
+import os
+import re
+import sqlite3
+from typing import Iterable
+
+import private_info
+import season_archive
+from private_info import DB_PATH
+
+# Set CONSOLIDATED_DB = True in private_info.py to keep every guild in one database file instead of one file per guild.
+# Both layouts use the same schema, keyed by guild_id, so the choice only changes which file a guild's rows live in
+CONSOLIDATED_DB: bool = getattr(private_info, 'CONSOLIDATED_DB', False)
+SCHEMA_VERSION = 6  # stored in PRAGMA user_version. The per-guild files from before guild_id keyed tables are version 0
+
+SCHEMA = (
+    "CREATE TABLE players(guild_id INTEGER, discord_id TEXT, name TEXT, discriminator TEXT, registration_date TEXT, rating INT DEFAULT 1000, "
+    "last_game TEXT DEFAULT null, PRIMARY KEY (guild_id, discord_id))",
+    # the leaderboard's order, so its pages and top 10 are read straight off the index instead of sorting every player
+    "CREATE INDEX players_by_rating ON players(guild_id, rating, discord_id)",
+    "CREATE TABLE seasons(guild_id INTEGER, season_number INTEGER, month TEXT, year INT, winner TEXT DEFAULT null, PRIMARY KEY (guild_id, season_number))",
+    # the sets legal in each season, in the order they were announced
+    "CREATE TABLE season_sets(guild_id INTEGER, season_number INTEGER, position INTEGER, set_code TEXT, set_name TEXT, "
+    "PRIMARY KEY (guild_id, season_number, position)) WITHOUT ROWID",
+    # the final standings of every finished season, and totals over all of them, see season_archive
+    *season_archive.SCHEMA,
+    # the legality index for each season, see RandardBot.build_legality_index
+    "CREATE TABLE legality_indexes(guild_id INTEGER, season_number INTEGER, catalog_built TEXT, PRIMARY KEY (guild_id, season_number))",
+    "CREATE TABLE legal_cards(guild_id INTEGER, season_number INTEGER, card_name TEXT, PRIMARY KEY (guild_id, season_number, card_name)) WITHOUT ROWID",
+    # the ledger of every confirmed game, which ratings can always be recomputed from
+    "CREATE TABLE games(game_id INTEGER PRIMARY KEY, guild_id INTEGER, season_number INTEGER, date TEXT, submitter_id TEXT, opponent_id TEXT, "
+    "submitter_games_won INT, opponent_games_won INT, ties INT DEFAULT 0, submitter_rating REAL, opponent_rating REAL)",
+    "CREATE INDEX games_by_season ON games(guild_id, season_number, game_id)",
+    "CREATE INDEX games_by_submitter ON games(guild_id, submitter_id, season_number)",
+    "CREATE INDEX games_by_opponent ON games(guild_id, opponent_id, season_number)",
+    # games waiting on the opponent's confirmation, kept here rather than in memory so they survive a restart
+    "CREATE TABLE pending_games(game_id INTEGER PRIMARY KEY, guild_id INTEGER, submitter_id TEXT, opponent_id TEXT, submitter_games_won INT, "
+    "opponent_games_won INT, ties INT DEFAULT 0, expires TEXT, opponent_channel_id INT DEFAULT null, opponent_message_id INT DEFAULT null, "
+    "submitter_token TEXT DEFAULT null, submitter_message_id INT DEFAULT null)",
+    "CREATE INDEX pending_games_by_expiry ON pending_games(guild_id, expires)",
+    # a checkpoint for each quarter's season rollover, see RandardBot.roll_over_season
+    "CREATE TABLE rollovers(guild_id INTEGER, quarter TEXT, old_season_number INTEGER, new_season_number INTEGER, announced INT DEFAULT 0, "
+    "PRIMARY KEY (guild_id, quarter))",
+    # the ids of the roles and channels the bot uses in each guild, see RandardBot._guild_resource
+    "CREATE TABLE guild_resources(guild_id INTEGER, name TEXT, resource_id INTEGER, PRIMARY KEY (guild_id, name)) WITHOUT ROWID",
+    # the ELO k factor of guilds that have switched away from the default one with /recompute_ratings, see RandardBot.get_rating_system
+    "CREATE TABLE rating_systems(guild_id INTEGER PRIMARY KEY, k REAL)",
+)
+
+
+def _insert_season_sets(con: sqlite3.Connection, seasons: Iterable[tuple[int, int, str, str]]):
+    """Splits the comma delimited set codes and names that seasons used to be stored with into season_sets rows.
+    Each season is a tuple of guild_id, season_number, set_codes and set_names"""
+    con.executemany("INSERT INTO season_sets(guild_id, season_number, position, set_code, set_name) VALUES (?, ?, ?, ?, ?)",
+                    [(guild_id, season_number, position, code, name) for guild_id, season_number, codes, names in seasons
+                     for position, (code, name) in enumerate(zip(codes.split(', '), names.split(', ')))])
+
+
+def _normalize_seasons(con: sqlite3.Connection):
+    con.execute("CREATE TABLE season_sets(guild_id INTEGER, season_number INTEGER, position INTEGER, set_code TEXT, set_name TEXT, "
+                "PRIMARY KEY (guild_id, season_number, position)) WITHOUT ROWID")
+    _insert_season_sets(con, con.execute("SELECT guild_id, season_number, set_codes, set_names FROM seasons").fetchall())
+    con.execute("ALTER TABLE seasons DROP COLUMN set_codes")
+    con.execute("ALTER TABLE seasons DROP COLUMN set_names")
+
+
+def _archive_leaderboards(con: sqlite3.Connection):
+    """Moves the top 10 of each finished season, which was all that used to be kept, into the season archive, and tallies
+    every finished season from it and the games table"""
+    for statement in season_archive.SCHEMA:
+        con.execute(statement)
+    con.execute("INSERT INTO season_standings(guild_id, season_number, place, discord_id, name, rating) "
+                "SELECT guild_id, season_number, place, discord_id, name, rating FROM leaderboards")
+    con.execute("DROP TABLE leaderboards")
+    season_archive.tally_past_seasons(con)
+
+
+# what brings a database from the previous version up to each version, either statements or functions that take the
+# connection. SCHEMA is always the latest version
+MIGRATIONS = {
+    2: ("CREATE TABLE guild_resources(guild_id INTEGER, name TEXT, resource_id INTEGER, PRIMARY KEY (guild_id, name)) WITHOUT ROWID",),
+    3: (_normalize_seasons,),
+    4: ("CREATE INDEX players_by_rating ON players(guild_id, rating, discord_id)",),
+    5: (_archive_leaderboards,),
+    6: ("CREATE TABLE rating_systems(guild_id INTEGER PRIMARY KEY, k REAL)",),
+}
+
+_LEADERBOARD_TABLE = re.compile(r'leaderboard_(\w+)_(\d+)')
+_LEGACY_FILE = re.compile(r'Randard_(\d+)\.db')
+
+
+class LegacyDatabaseError(sqlite3.DatabaseError):
+    """Raised when a database from before SCHEMA_VERSION 1 is opened as if it had already been migrated"""
+    pass
+
+
+def database_path(guild_id: int, db_path: str = DB_PATH, consolidated: bool = CONSOLIDATED_DB) -> str:
+    """Returns the filepath of the database holding the given guild's rows"""
+    return f"{db_path}Randard.db" if consolidated else f"{db_path}Randard_{guild_id}.db"
+
+
+def legacy_database_path(guild_id: int, db_path: str = DB_PATH) -> str:
+    return f"{db_path}Randard_{guild_id}.db"
+
+
+def archived_database_path(legacy_path: str) -> str:
+    """Where a legacy database is moved to once it's been migrated, kept in case anything needs to be recovered from it"""
+    return f"{legacy_path[:-len('.db')]}.legacy.db"
+
+
+def migrating_database_path(legacy_path: str) -> str:
+    """Where a legacy database is kept while it's being migrated. Finding one means a migration was interrupted"""
+    return f"{legacy_path[:-len('.db')]}.migrating.db"
+
+
+def quarter_of(date: datetime.date) -> str:
+    """The name of the quarter a date falls in, e.g. '2022-Q2'. Each quarter gets one season"""
+    return f"{date.year}-Q{(date.month - 1) // 3 + 1}"
+
+
+def ensure_schema(con: sqlite3.Connection):
+    """Creates every table on a new database, or brings an older one up to SCHEMA_VERSION with MIGRATIONS.
+    Raises LegacyDatabaseError if con is a per-guild database that still needs migrating"""
+    if con.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        return
+    if not con.in_transaction:
+        # sqlite3 doesn't start a transaction for CREATE TABLE on its own, and a half created schema can't be told apart from a legacy one.
+        # IMMEDIATE takes the write lock straight away, so another connection can't create or migrate the schema between the version being read and written
+        con.execute("BEGIN IMMEDIATE")
+    version = con.execute("PRAGMA user_version").fetchone()[0]  # read again, since another connection may have just brought it up to date
+    if version == SCHEMA_VERSION:
+        return
+    if version == 0 and con.execute("SELECT 1 FROM sqlite_schema WHERE type='table'").fetchone() is not None:
+        raise LegacyDatabaseError("This database has to be migrated with migrate_legacy_database before it can be used")
+    if version == 0:
+        statements = SCHEMA
+    else:
+        statements = [statement for next_version in range(version + 1, SCHEMA_VERSION + 1) for statement in MIGRATIONS[next_version]]
+    for statement in statements:
+        if callable(statement):
+            statement(con)
+        else:
+            con.execute(statement)
+    con.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+
+def is_legacy_database(path: str) -> bool:
+    if not os.path.exists(path):
+        return False
+    con = sqlite3.connect(path)
+    try:
+        return (con.execute("PRAGMA user_version").fetchone()[0] == 0
+                and con.execute("SELECT 1 FROM sqlite_schema WHERE type='table' AND name='players'").fetchone() is not None)
+    finally:
+        con.close()
+
+
+def archive_legacy_database(path: str) -> str:
+    """Moves a legacy database out of the way of its replacement, and returns where it was moved to.
+    The database is taken out of WAL mode first, so that everything in its write-ahead log moves with it"""
+    con = sqlite3.connect(path)
+    try:
+        con.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        con.close()
+    migrating_path = migrating_database_path(path)
+    os.replace(path, migrating_path)
+    return migrating_path
+
+
+def migrate_legacy_database(legacy_path: str, target_path: str, guild_id: int) -> int:
+    """Copies a guild's database from before SCHEMA_VERSION 1 into the database at target_path, under guild_id.
+    The per-season leaderboard_{month}_{year} tables become the standings of their seasons, see season_archive. Legality indexes aren't
+    copied, they're rebuilt from the card catalog the first time they're needed.
+    Does nothing if the target already has seasons for the guild, so an interrupted migration can safely be run again.
+    Returns the number of players migrated"""
+    con = sqlite3.connect(target_path)
+    try:
+        con.execute("PRAGMA busy_timeout=5000")
+        with con:
+            ensure_schema(con)
+        con.execute("ATTACH DATABASE ? AS legacy", [legacy_path])
+        try:
+            with con:
+                # checked with the write lock held, so two migrations of the same guild can't both copy it
+                con.execute("BEGIN IMMEDIATE")
+                if con.execute("SELECT 1 FROM seasons WHERE guild_id=?", [guild_id]).fetchone() is not None:
+                    return 0
+                return _copy_legacy_tables(con, guild_id)
+        finally:
+            con.execute("DETACH DATABASE legacy")
+    finally:
+        con.close()
+
+
+def _copy_legacy_tables(con: sqlite3.Connection, guild_id: int) -> int:
+    tables = {row[0] for row in con.execute("SELECT name FROM legacy.sqlite_schema WHERE type='table'")}
+    players = con.execute("INSERT INTO players(guild_id, discord_id, name, discriminator, registration_date, rating, last_game) "
+                          "SELECT ?, discord_id, name, discriminator, registration_date, rating, last_game FROM legacy.players", [guild_id]).rowcount
+    con.execute("INSERT INTO seasons(guild_id, season_number, month, year, winner) "
+                "SELECT ?, season_number, month, year, winner FROM legacy.seasons", [guild_id])
+    _insert_season_sets(con, con.execute("SELECT ?, season_number, set_codes, set_names FROM legacy.seasons", [guild_id]).fetchall())
+    for table in tables:
+        match = _LEADERBOARD_TABLE.fullmatch(table)
+        if match is None:
+            continue
+        # each table was named for the newest season at the time, so it belongs to the last season from that month
+        con.execute(f"INSERT INTO season_standings(guild_id, season_number, place, discord_id, rating, name) "
+                    f"SELECT ?, (SELECT MAX(season_number) FROM seasons WHERE guild_id=? AND month=? AND year=?), "
+                    f"ROW_NUMBER() OVER (ORDER BY rating DESC), discord_id, rating, name FROM legacy.{table}",
+                    [guild_id, guild_id, match[1], int(match[2])])
+    if 'games' in tables:
+        con.execute("INSERT INTO games(guild_id, season_number, date, submitter_id, opponent_id, submitter_games_won, opponent_games_won, ties, submitter_rating, opponent_rating) "
+                    "SELECT ?, season_number, date, submitter_id, opponent_id, submitter_games_won, opponent_games_won, ties, submitter_rating, opponent_rating "
+                    "FROM legacy.games ORDER BY game_id", [guild_id])
+    if 'pending_games' in tables:
+        con.execute("INSERT INTO pending_games(game_id, guild_id, submitter_id, opponent_id, submitter_games_won, opponent_games_won, ties, expires, "
+                    "opponent_channel_id, opponent_message_id, submitter_token, submitter_message_id) "
+                    "SELECT game_id, ?, submitter_id, opponent_id, submitter_games_won, opponent_games_won, ties, expires, "
+                    "opponent_channel_id, opponent_message_id, submitter_token, submitter_message_id FROM legacy.pending_games", [guild_id])
+    if 'rollovers' in tables:
+        con.execute("INSERT INTO rollovers(guild_id, quarter, old_season_number, new_season_number, announced) "
+                    "SELECT ?, quarter, old_season_number, new_season_number, announced FROM legacy.rollovers", [guild_id])
+    else:
+        # the current season is taken to be this quarter's, as it is for a newly set up guild
+        con.execute("INSERT INTO rollovers(guild_id, quarter, new_season_number, announced) VALUES (?, ?, (SELECT MAX(season_number) FROM seasons WHERE guild_id=?), 1)",
+                    [guild_id, quarter_of(datetime.date.today()), guild_id])
+    season_archive.tally_past_seasons(con, guild_id)
+    return players
+
+
+def upgrade_legacy_database(guild_id: int, db_path: str = DB_PATH, consolidated: bool = CONSOLIDATED_DB) -> int | None:
+    """Migrates the guild's legacy database, if it has one, into the database it now belongs in, and archives the old file.
+    Once a guild has been migrated this only costs a couple of stat calls, or opening its database when there's a file per guild.
+    Returns the number of players migrated, or None if there was nothing to migrate"""
+    legacy_path = legacy_database_path(guild_id, db_path)
+    migrating_path = migrating_database_path(legacy_path)
+    if is_legacy_database(legacy_path):
+        # moved before migrating, since with one file per guild the new database takes the legacy file's place
+        archive_legacy_database(legacy_path)
+    elif not os.path.exists(migrating_path):
+        return None
+    players = migrate_legacy_database(migrating_path, database_path(guild_id, db_path, consolidated), guild_id)
+    os.replace(migrating_path, archived_database_path(legacy_path))
+    return players
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrates every per-guild Randard database from before schema version 1 to the current schema")
+    parser.add_argument('--db-path', type=str, default=DB_PATH, help="The directory prefix the databases are stored under, DB_PATH by default")
+    parser.add_argument('--consolidate', action=argparse.BooleanOptionalAction, default=CONSOLIDATED_DB,
+                        help="Whether to move every guild into a single Randard.db. Defaults to CONSOLIDATED_DB from private_info.py")
+    args = parser.parse_args()
+
+    for path in sorted(glob.glob(f"{glob.escape(args.db_path)}Randard_*.db")):
+        match = _LEGACY_FILE.fullmatch(os.path.basename(path))
+        if match is None or not is_legacy_database(path):
+            continue
+        players = upgrade_legacy_database(int(match[1]), args.db_path, args.consolidate)
+        print(f"Migrated guild {match[1]}: {players} players")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import datetime
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import mtgsdk
+
+import APIutils
+from APIutils import SetRegistry
+
+
+class SetRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'set_cache.json')
+        # a cache file from long before the ttl
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched': '2022-01-01T00:00:00+00:00', 'sets': [{'code': 'AAA', 'name': 'Alpha', 'type': 'core'}]}, f)
+
+    def test_failed_refresh(self):
+        registry = SetRegistry(self.path)
+        with mock.patch.object(mtgsdk.Set, 'all', side_effect=OSError('unreachable')) as set_all:
+            self.assertEqual([set_.code for set_ in registry.sets()], ['AAA'])
+            # until retry_interval has passed the stale sets are used without trying again
+            registry.sets()
+            self.assertEqual(set_all.call_count, 1)
+            registry._retry_after -= registry.retry_interval
+            registry.sets()
+            self.assertEqual(set_all.call_count, 2)
+        with mock.patch.object(mtgsdk.Set, 'all', return_value=[mtgsdk.Set({'code': 'BBB', 'name': 'Beta', 'type': 'core'})]):
+            self.assertEqual([set_.code for set_ in registry.refresh()], ['BBB'])
+        self.assertIsNone(registry._retry_after)
+        self.assertEqual([set_.code for set_ in SetRegistry(self.path).sets()], ['BBB'])
+
+    def test_stalled_refresh(self):
+        stalled = threading.Event()
+        self.addCleanup(stalled.set)
+        registry = SetRegistry(self.path)
+        with mock.patch.object(mtgsdk.Set, 'all', side_effect=stalled.wait), mock.patch.object(APIutils, 'SET_FETCH_TIMEOUT', 0.05):
+            self.assertEqual([set_.code for set_ in registry.sets()], ['AAA'])
+        self.assertGreater(registry._retry_after, datetime.datetime.now(datetime.timezone.utc))
+
+
+if __name__ == '__main__':
+    unittest.main()
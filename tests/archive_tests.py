@@ -0,0 +1,60 @@
+import sqlite3
+import unittest
+
+import season_archive
+
+# the tables the archive reads from, as storage.SCHEMA has them
+TABLES = (
+    "CREATE TABLE players(guild_id INTEGER, discord_id TEXT, name TEXT, rating INT DEFAULT 1000, PRIMARY KEY (guild_id, discord_id))",
+    "CREATE TABLE seasons(guild_id INTEGER, season_number INTEGER, winner TEXT DEFAULT null, PRIMARY KEY (guild_id, season_number))",
+    "CREATE TABLE season_sets(guild_id INTEGER, season_number INTEGER, position INTEGER, set_code TEXT, set_name TEXT, "
+    "PRIMARY KEY (guild_id, season_number, position)) WITHOUT ROWID",
+    "CREATE TABLE games(game_id INTEGER PRIMARY KEY, guild_id INTEGER, season_number INTEGER, submitter_id TEXT, opponent_id TEXT, "
+    "submitter_games_won INT, opponent_games_won INT)",
+)
+
+
+class SeasonArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite3.connect(':memory:')
+        self.con.row_factory = sqlite3.Row
+        for statement in TABLES + season_archive.SCHEMA:
+            self.con.execute(statement)
+
+    def play_season(self, season_number: int, sets: list[str], ratings: dict[str, int], games: list[tuple[str, str, int, int]]):
+        con = self.con
+        con.execute("INSERT INTO seasons(guild_id, season_number) VALUES (1, ?)", [season_number])
+        con.executemany("INSERT INTO season_sets VALUES (1, ?, ?, ?, ?)", [(season_number, i, code, f'{code} name') for i, code in enumerate(sets)])
+        con.executemany("INSERT OR REPLACE INTO players(guild_id, discord_id, name, rating) VALUES (1, ?, ?, ?)",
+                        [(player, f'player {player}', rating) for player, rating in ratings.items()])
+        con.executemany("INSERT INTO games(guild_id, season_number, submitter_id, opponent_id, submitter_games_won, opponent_games_won) "
+                        "VALUES (1, ?, ?, ?, ?, ?)", [(season_number, *game) for game in games])
+        season_archive.archive_season(con, 1, season_number)
+
+    def test_archive(self):
+        self.play_season(0, ['AAA', 'BBB'], {'1': 1040, '2': 960, '3': 1000}, [('1', '2', 2, 0), ('2', '1', 1, 1)])
+        self.play_season(1, ['AAA', 'CCC'], {'1': 980, '2': 1020, '3': 1000}, [('2', '1', 2, 1)])
+        self.play_season(2, ['DDD'], {'1': 1000, '2': 1000, '3': 1000}, [])
+        con = self.con
+        self.assertEqual([row['winner'] for row in con.execute("SELECT winner FROM seasons ORDER BY season_number")], ['1', '2', None])
+        standings = con.execute("SELECT discord_id, matches, match_wins, match_losses, match_draws FROM season_standings "
+                                "WHERE season_number=0 ORDER BY place").fetchall()
+        self.assertEqual([tuple(row) for row in standings], [('1', 2, 1, 0, 1), ('3', 0, 0, 0, 0), ('2', 2, 0, 1, 1)])
+        totals = {row['discord_id']: row for row in con.execute("SELECT * FROM player_totals")}
+        self.assertEqual((totals['1']['seasons'], totals['1']['titles'], totals['1']['best_place'], totals['1']['matches']), (3, 1, 1, 3))
+        self.assertEqual((totals['2']['titles'], totals['2']['match_wins'], totals['2']['match_losses']), (1, 1, 1))
+        sets = {row['set_code']: (row['seasons'], row['matches']) for row in con.execute("SELECT * FROM set_totals")}
+        self.assertEqual(sets, {'AAA': (2, 3), 'BBB': (1, 2), 'CCC': (1, 1), 'DDD': (1, 0)})
+
+    def test_imported_standings(self):
+        con = self.con
+        con.executemany("INSERT INTO seasons(guild_id, season_number) VALUES (1, ?)", [(0,), (1,)])
+        con.executemany("INSERT INTO season_standings(guild_id, season_number, place, discord_id, name, rating) VALUES (1, 0, ?, ?, ?, ?)",
+                        [(1, '2', 'player 2', 1100), (2, '1', 'player 1', 950)])
+        season_archive.tally_past_seasons(con)
+        self.assertEqual(con.execute("SELECT winner FROM seasons WHERE season_number=0").fetchone()[0], '2')
+        self.assertEqual(con.execute("SELECT titles FROM player_totals WHERE discord_id='2'").fetchone()[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from benchmarks import MIN_REPEAT, find_regressions
+
+
+def result(fastest: float, median: float = 1.0, repeat: int = MIN_REPEAT) -> dict:
+    return {'min': fastest, 'median': median, 'repeat': repeat}
+
+
+class FindRegressionsTestCase(unittest.TestCase):
+    def test_fastest_time(self):
+        baseline = {'parser': result(0.010), 'solver': result(0.010)}
+        # the solver's median doubled on a busy machine but its fastest run didn't, so only the parser regressed
+        results = {'parser': result(0.013, median=0.010), 'solver': result(0.011, median=2.0), 'new': result(1.0)}
+        regressions = find_regressions(results, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('parser: 13.000ms'))
+        self.assertEqual(find_regressions(results, baseline, tolerance=0.5), [])
+
+    def test_under_sampled(self):
+        slower = {'parser': result(1.0)}
+        self.assertEqual(find_regressions({'parser': result(1.0, repeat=MIN_REPEAT - 1)}, {'parser': result(0.010)}), [])
+        self.assertEqual(find_regressions(slower, {'parser': result(0.010, repeat=MIN_REPEAT - 1)}), [])
+        # baselines saved before repeat was recorded are skipped too
+        self.assertEqual(find_regressions(slower, {'parser': {'min': 0.010, 'median': 0.010}}), [])
+        self.assertEqual(len(find_regressions(slower, {'parser': result(0.010)})), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
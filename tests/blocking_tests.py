@@ -0,0 +1,34 @@
+import asyncio
+import time
+import unittest
+
+from blocking_executor import BlockingExecutor
+
+
+class BlockingExecutorTestCase(unittest.TestCase):
+    def test_run_write(self):
+        executor = BlockingExecutor(max_workers=1)
+        written = []
+
+        def write(value, seconds):
+            time.sleep(seconds)
+            written.append(value)
+            return value
+
+        async def main():
+            # once started, a write is waited on past its timeout
+            self.assertEqual(await executor.run_write(write, 'slow', 0.2, timeout=0.05), 'slow')
+            # a write still waiting for the only worker when its timeout runs out is dropped
+            busy = asyncio.ensure_future(executor.run_write(write, 'busy', 0.2))
+            await asyncio.sleep(0.05)
+            with self.assertRaises(asyncio.TimeoutError):
+                await executor.run_write(write, 'dropped', 0, timeout=0.05)
+            await busy
+
+        asyncio.run(main())
+        executor.shutdown()
+        self.assertEqual(written, ['slow', 'busy'])
+
+
+if __name__ == '__main__':
+    unittest.main()
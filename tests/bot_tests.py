@@ -0,0 +1,116 @@
+import asyncio
+import os
+import sys
+import tempfile
+import types
+import unittest
+
+# private_info.py holds the bot's token, so each user makes their own, see README.md. The bot here is pointed at a temporary directory, so nothing is read from it
+try:
+    import private_info
+except ImportError:
+    sys.modules['private_info'] = types.SimpleNamespace(DB_PATH='')
+
+import mtgsdk
+
+import storage
+from RandardBot import RandardBot
+from rating_engine import Elo, GameRecord
+
+FORMAT = [mtgsdk.Set({'code': 'AAA', 'name': 'Alpha'}), mtgsdk.Set({'code': 'BBB', 'name': 'Beta'})]
+NEXT_FORMAT = [mtgsdk.Set({'code': 'CCC', 'name': 'Gamma'})]
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Runs the bot's database methods against a guild with two registered players, in a temporary directory"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # the bot looks its loop up when it's made, and earlier tests' asyncio.run calls leave the main thread without one
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.db_path = os.path.join(directory.name, '')
+        self.bot = self.make_bot()
+        self.guild = types.SimpleNamespace(id=1234, name='guild')
+        self.alice, self.bob = (types.SimpleNamespace(id=player_id, name=name, discriminator='0001', guild=self.guild)
+                                for player_id, name in ((1, 'alice'), (2, 'bob')))
+        with self.bot._connect(self.guild) as con:
+            storage.ensure_schema(con)
+        self.bot.store_format(FORMAT, self.guild)
+        for player in (self.alice, self.bob):
+            self.bot.register_player(player)
+
+    def make_bot(self) -> RandardBot:
+        bot = RandardBot()
+        self.addCleanup(bot.db_pool.close_all)
+        self.addCleanup(bot.blocking.shutdown)
+        bot.db_path = self.db_path
+        return bot
+
+    def ratings(self) -> dict[str, float]:
+        with self.bot._connect(self.guild) as con:
+            return {row['discord_id']: row['rating'] for row in con.execute("SELECT discord_id, rating FROM players WHERE guild_id=?", [self.guild.id])}
+
+    def games(self) -> int:
+        with self.bot._connect(self.guild) as con:
+            return con.execute("SELECT COUNT(*) FROM games WHERE guild_id=?", [self.guild.id]).fetchone()[0]
+
+    def test_confirm_pending_game(self):
+        self.bot.add_pending_game(self.guild, 1, GameRecord('1', '2', 2, 1))
+        self.assertEqual(self.bot.confirm_pending_game(self.alice, self.bob, 1)['submitter_games_won'], 2)
+        ratings = self.ratings()
+        self.assertGreater(ratings['1'], ratings['2'])
+        # a second confirmation, say from a double click, finds nothing left to confirm
+        self.assertIsNone(self.bot.confirm_pending_game(self.alice, self.bob, 1))
+        self.assertIsNone(self.bot.cancel_pending_game(self.guild, 1))
+        self.assertEqual(self.games(), 1)
+        self.assertEqual(self.ratings(), ratings)
+
+    def test_cancel_pending_game(self):
+        self.bot.add_pending_game(self.guild, 1, GameRecord('1', '2', 2, 1))
+        self.assertIsNotNone(self.bot.cancel_pending_game(self.guild, 1))
+        self.assertIsNone(self.bot.cancel_pending_game(self.guild, 1))
+        self.assertIsNone(self.bot.confirm_pending_game(self.alice, self.bob, 1))
+        self.assertIsNone(self.bot.get_pending_game(self.guild, 1))
+        self.assertEqual(self.games(), 0)
+
+    def test_recompute_ratings(self):
+        other_guild = types.SimpleNamespace(id=5678, name='other guild')
+        with self.bot._connect(other_guild) as con:
+            storage.ensure_schema(con)
+        self.bot.add_pending_game(self.guild, 1, GameRecord('1', '2', 1, 0))
+        self.bot.confirm_pending_game(self.alice, self.bob, 1)
+        self.assertEqual(self.bot.recompute_ratings(self.guild, Elo(k=20)), 1)
+        self.assertEqual(self.ratings(), {'1': 1010, '2': 990})
+        self.assertEqual(self.bot.get_rating_system(other_guild), self.bot.rating_system)
+        # the switch is stored with the guild, so it outlasts the bot and every later game is rated with it
+        self.bot.db_pool.close_all()
+        self.bot = self.make_bot()
+        self.assertEqual(self.bot.get_rating_system(self.guild), Elo(k=20))
+        self.bot.add_pending_game(self.guild, 2, GameRecord('2', '1', 1, 0))
+        self.bot.confirm_pending_game(self.bob, self.alice, 2)
+        ratings = self.ratings()
+        self.assertAlmostEqual(ratings['2'] - 990, 20 * (1 - 1 / (1 + 10 ** (20 / 400))))
+
+    def test_roll_over_season(self):
+        self.bot.add_pending_game(self.guild, 1, GameRecord('2', '1', 2, 0))
+        self.bot.confirm_pending_game(self.bob, self.alice, 1)
+        rollover = self.bot.roll_over_season(self.guild, '2022-Q2', NEXT_FORMAT)
+        self.assertEqual((rollover['old_season_number'], rollover['new_season_number']), (0, 1))
+        # resumed after a crash, the same quarter's rollover doesn't start another season or archive this one again
+        self.assertEqual(tuple(self.bot.roll_over_season(self.guild, '2022-Q2', FORMAT)), tuple(rollover))
+        season = self.bot.get_season(self.guild)
+        self.assertEqual((season.season_number, season.set_codes), (1, ('CCC',)))
+        self.assertEqual(set(self.ratings().values()), {self.bot.rating_system.starting_rating})
+        with self.bot._connect(self.guild) as con:
+            self.assertEqual([tuple(row) for row in con.execute("SELECT place, discord_id FROM season_standings WHERE guild_id=? ORDER BY season_number, place",
+                                                                [self.guild.id])], [(1, '2'), (2, '1')])
+            self.assertEqual(tuple(con.execute("SELECT seasons, titles FROM player_totals WHERE guild_id=? AND discord_id='2'", [self.guild.id]).fetchone()), (1, 1))
+            self.assertEqual(con.execute("SELECT COUNT(*) FROM seasons WHERE guild_id=?", [self.guild.id]).fetchone()[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
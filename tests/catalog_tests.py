@@ -0,0 +1,62 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from card_catalog import CardCatalog, CatalogVersionError
+from compact_catalog import CompactCatalog
+
+CATALOG = CardCatalog.load('test_catalog.json')
+
+
+class CardCatalogTestCase(unittest.TestCase):
+    def test_printings(self):
+        self.assertEqual(CATALOG.printings('Dispel'), {'WWK'})
+        self.assertEqual(CATALOG.printings('Not A Real Card'), frozenset())
+        self.assertEqual(CATALOG.true_set_codes(), {'10E', 'M10', 'ZEN', 'WWK'})
+        self.assertEqual(CATALOG.legal_printings(['Jace, the Mind Sculptor'], ['wwk', 'zen']), {'Jace, the Mind Sculptor': {'WWK'}})
+
+    def test_legal_cards(self):
+        self.assertEqual(CATALOG.legal_cards({'zen'}), {'Forest', 'Mountain', 'Misty Rainforest', 'Lotus Cobra'})
+
+    def test_name_index(self):
+        catalog = CardCatalog({'Delver of Secrets // Insectile Aberration': ['ISD'], 'Alive // Well': ['GTC'], 'Æther Vial': ['DST']})
+        self.assertEqual(catalog.resolve('Delver of Secrets'), 'Delver of Secrets // Insectile Aberration')
+        self.assertEqual(catalog.resolve('alive//well'), 'Alive // Well')
+        self.assertEqual(catalog.resolve('Aether Vial'), 'Æther Vial')
+        self.assertIsNone(catalog.resolve('Aether Vail'))
+        self.assertEqual(catalog.suggest('Aether Vail'), ['Æther Vial'])
+        self.assertEqual(CATALOG.suggest('Misty Rain Forest')[0], 'Misty Rainforest')
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.json')
+            CATALOG.save(path)
+            loaded = CardCatalog.load(path)
+        self.assertEqual(loaded.to_json(), CATALOG.to_json())
+
+    def test_compact(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.bin')
+            CATALOG.save_compact(path)
+            compact = CardCatalog.load(path)
+            self.assertIsInstance(compact, CompactCatalog)
+            self.assertEqual(len(compact), len(CATALOG))
+            self.assertEqual(compact.printings('Forest'), CATALOG.printings('Forest'))
+            self.assertEqual(compact.printings('Not A Real Card'), frozenset())
+            self.assertEqual(compact.colors('Jace, the Mind Sculptor'), 'U')
+            self.assertEqual(compact.legal_cards({'zen', 'M10'}), CATALOG.legal_cards({'zen', 'M10'}))
+            self.assertEqual(compact.true_set_codes(), CATALOG.true_set_codes())
+            self.assertEqual(compact.resolve('jace, the mind sculptor'), 'Jace, the Mind Sculptor')
+            self.assertEqual(compact.to_json(), CATALOG.to_json())
+            self.assertEqual(pickle.loads(pickle.dumps(compact)).printings('Dispel'), {'WWK'})
+
+    def test_version_mismatch(self):
+        snapshot = CATALOG.to_json()
+        snapshot['version'] = 0
+        with self.assertRaises(CatalogVersionError):
+            CardCatalog.from_json(snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,17 @@
 import unittest
-from decklist_verification import verify_decklist, decklist_parser
+import decklist_verification
+from decklist_verification import DecklistError, verify_decklist, decklist_parser, match_unique_sets, verify_decklists
+from card_catalog import CardCatalog
 from collections import Counter
+import codecs
+import io
+import time
+
+import mtgsdk
 import vcr
 
+CATALOG = CardCatalog.load('test_catalog.json')
+
 
 class MyTestCase(unittest.TestCase):
     @vcr.use_cassette
@@ -10,16 +19,97 @@ class MyTestCase(unittest.TestCase):
         test_decklist_1, test_sideboard_2 = decklist_parser('test_decklist_1')
         decklist_1 = Counter({'Giant Growth': 1, 'Llanowar Elves': 4, 'Forest': 55})
         self.assertEqual(test_decklist_1, decklist_1)
-        self.assertTrue(verify_decklist(decklist_1, legal_sets={'10e'}))
+        catalog = CardCatalog.from_cards(mtgsdk.Card.where(name="|".join(decklist_1)).all())
+        self.assertTrue(verify_decklist(decklist_1, legal_sets={'10e'}, catalog=catalog))
 
-    @vcr.use_cassette
     def test_2(self):
         test_decklist_2, test_sideboard_2 = decklist_parser('test_decklist_2')
         decklist_2 = Counter({'Mountain': 60})
         sideboard_2 = Counter({"Forest": 2})
         self.assertEqual(test_decklist_2, decklist_2)
         self.assertEqual(sideboard_2, test_sideboard_2)
-        self.assertTrue(verify_decklist(decklist_2))
+        self.assertTrue(verify_decklist(decklist_2, catalog=CATALOG))
+
+    def test_parse_formats(self):
+        arena = 'About\nName Elves\n\nDeck\n4 Llanowar Elves (M19) 314\n56 Forest (ZEN) 246\n\nSideboard\n2 Giant Growth (M10) 186\n'
+        dek = ('<?xml version="1.0" encoding="utf-8"?>\n<Deck><NetDeckID>0</NetDeckID>'
+               '<Cards CatID="1" Quantity="4" Sideboard="false" Name="Llanowar Elves" />'
+               '<Cards CatID="2" Quantity="56" Sideboard="false" Name="Forest" />'
+               '<Cards CatID="3" Quantity="2" Sideboard="true" Name="Giant Growth" /></Deck>')
+        cod = ('<?xml version="1.0" encoding="UTF-8"?>\n<cockatrice_carddeck version="1"><deckname>Elves</deckname>'
+               '<zone name="main"><card number="4" name="Llanowar Elves"/><card number="56" name="Forest"/></zone>'
+               '<zone name="side"><card number="2" name="Giant Growth"/></zone>'
+               '<zone name="tokens"><card number="1" name="Elf Warrior"/></zone></cockatrice_carddeck>')
+        expected = (Counter({'Llanowar Elves': 4, 'Forest': 56}), Counter({'Giant Growth': 2}))
+        self.assertEqual(decklist_parser(arena, string=True), expected)
+        self.assertEqual(decklist_parser(codecs.BOM_UTF8 + arena.encode(), string=True), expected)
+        self.assertEqual(decklist_parser(io.BytesIO(arena.encode('utf-16'))), expected)
+        self.assertEqual(decklist_parser(dek.encode(), string=True), expected)
+        self.assertEqual(decklist_parser(io.StringIO(cod)), expected)
+
+    def test_parse_errors(self):
+        with self.assertRaises(DecklistError) as context:
+            decklist_parser('4 Llanowar Elves\nfour Forest\n\n20\nIsland', string=True)
+        self.assertEqual(len(context.exception.errors), 3)
+        self.assertIn('line 2', context.exception.errors[0])
+        with self.assertRaises(DecklistError):
+            decklist_parser(b'4 Forest\xff\n', string=True)
+        with self.assertRaises(DecklistError):
+            decklist_parser(b'<Deck><Cards Quantity="4"', string=True)
+
+    def test_illegal_cards(self):
+        decklist = Counter({'Jace, the Mind Sculptor': 4, 'Forest': 56})
+        self.assertEqual(verify_decklist(decklist, legal_sets={'ZEN'}, catalog=CATALOG),
+                         ['Jace, the Mind Sculptor is not legal'])
+
+    def test_legal_cards_index(self):
+        decklist = Counter({'Jace, the Mind Sculptor': 4, 'Forest': 56})
+        legal_cards = CATALOG.legal_cards({'ZEN'})
+        self.assertEqual(verify_decklist(decklist, legal_cards=legal_cards, catalog=CATALOG), ['Jace, the Mind Sculptor is not legal'])
+        self.assertTrue(verify_decklist(decklist, legal_cards=CATALOG.legal_cards({'ZEN', 'WWK'})))
+
+    def test_batch(self):
+        batch = {'elves.txt': '4 llanowar elves\n56 Forest', 'jace.txt': '4 Jace, the Mind Sculptor\n56 Island',
+                 'typo.txt': 'four Llanowar Elves'}
+        for processes in (1, 2):
+            report = verify_decklists(batch, legal_sets={'M10'}, catalog=CATALOG, processes=processes)
+            self.assertEqual([deck.name for deck in report.decks], list(batch))
+            self.assertEqual([deck.valid for deck in report.decks], [True, False, False])
+            self.assertEqual(report.decks[1].errors, ['Jace, the Mind Sculptor is not legal', "Island isn't a card I know of. Double check the spelling."])
+            self.assertEqual(report.summary['valid'], 1)
+
+    def test_name_resolution(self):
+        decklist = Counter({'jace the mind sculptor': 2, 'Jace, the Mind Sculptor': 2, 'Llanowar Elfs': 4, 'Forest': 52})
+        self.assertEqual(verify_decklist(decklist, legal_sets={'WWK'}, catalog=CATALOG),
+                         ["Llanowar Elfs isn't a card I know of. Did you mean Llanowar Elves?"])
+        self.assertEqual(verify_decklist(decklist + Counter({'Jace, the Mind Sculptor': 1}), legal_sets={'WWK', 'M10'}, catalog=CATALOG),
+                         ['Jace, the Mind Sculptor has more than 4 copies', "Llanowar Elfs isn't a card I know of. Did you mean Llanowar Elves?"])
+        self.assertEqual(verify_decklist(Counter({'Qwxzzy': 4}), catalog=CATALOG, min_deck_size=0), ["Qwxzzy isn't a card I know of. Double check the spelling."])
+
+    def test_unique_sets(self):
+        cards = {card: CATALOG.printings(card) for card in ('Jace, the Mind Sculptor', 'Dispel', 'Giant Growth')}
+        matching = decklist_verification.test_unique_sets(cards)
+        self.assertEqual(matching.keys(), cards.keys())
+        self.assertEqual(len(set(matching.values())), 3)
+        self.assertEqual(matching['Dispel'], 'WWK')
+
+        cards['Stoneforge Mystic'] = CATALOG.printings('Stoneforge Mystic')
+        self.assertIsNone(decklist_verification.test_unique_sets(cards))
+        matching, unmatched = match_unique_sets(cards)
+        self.assertEqual(len(matching), 3)
+        self.assertIn(unmatched, (['Dispel'], ['Stoneforge Mystic']))
+
+    def test_unique_sets_reprint_heavy(self):
+        # 75 cards that were all printed in the same 74 sets, so the search has to exhaust every alternative
+        shared_sets = {f'S{i:02}' for i in range(74)}
+        cards = {f'Card {i}': shared_sets for i in range(75)}
+        start = time.perf_counter()
+        matching, unmatched = match_unique_sets(cards)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(len(matching), 74)
+        self.assertEqual(len(unmatched), 1)
+        cards['Card 0'] = shared_sets | {'S74'}
+        self.assertEqual(len(decklist_verification.test_unique_sets(cards)), 75)
 
 
 if __name__ == '__main__':
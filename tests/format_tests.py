@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+import mtgsdk
+
+import format_chooser
+from card_catalog import CardCatalog, CatalogVersionError, SetInfo
+from format_chooser import FormatConstraints, choose_format, evaluate, generate_format
+
+COLORS = 'WUBRG'
+
+
+def make_catalog() -> CardCatalog:
+    """Twelve sets of 300 cards, evenly split between the colors: 3 core sets, a 3 set block, and 6 standalone expansions.
+    Every core set reprints the same 50 cards"""
+    sets = [SetInfo(f'C{i}', f'Core {i}', 'core') for i in range(3)]
+    sets += [SetInfo(f'B{i}', f'Block {i}', 'expansion', 'Block', f'2010-0{i + 1}-01') for i in range(3)]
+    sets += [SetInfo(f'X{i}', f'Expansion {i}', 'expansion') for i in range(6)]
+    printings, colors = {}, {}
+    for set_ in sets:
+        for i in range(300):
+            name = f'Reprint {i}' if set_.type == 'core' and i < 50 else f'{set_.code} {i}'
+            printings.setdefault(name, []).append(set_.code)
+            colors[name] = COLORS[i % 5]
+    return CardCatalog(printings, sets, colors=colors)
+
+
+CATALOG = make_catalog()
+
+
+class FormatGeneratorTestCase(unittest.TestCase):
+    def test_set_pool(self):
+        pool = CATALOG.set_pool
+        self.assertEqual(pool.stats('c0').card_count, 300)
+        self.assertEqual(pool.stats('C0').color_counts, (60, 60, 60, 60, 60))
+        self.assertEqual(pool.block('Block'), ('B0', 'B1', 'B2'))
+        self.assertEqual(pool.measure(['C0', 'C1'])[0], 550)
+
+    def test_constraints(self):
+        constraints = FormatConstraints(min_sets=7, max_sets=7, target_cards=2000, card_tolerance=100)
+        codes = choose_format(CATALOG.set_pool, CATALOG.set_codes(), constraints, recent={'X0', 'x1'}, seed='42:2026-Q4')
+        self.assertEqual(codes, choose_format(CATALOG.set_pool, CATALOG.set_codes(), constraints, recent={'X0', 'x1'}, seed='42:2026-Q4'))
+        self.assertEqual(len(codes), 7)
+        self.assertTrue({'X0', 'X1'}.isdisjoint(codes))
+        self.assertTrue(any(code.startswith('C') for code in codes))
+        self.assertEqual(evaluate(CATALOG.set_pool, codes, constraints).violations, 0)
+
+    def test_block_coherence(self):
+        constraints = FormatConstraints(min_sets=3, max_sets=3, target_cards=900, min_core_sets=0, block_split_penalty=1)
+        self.assertEqual(sorted(choose_format(CATALOG.set_pool, ['B0', 'B1', 'B2', 'X0', 'X1'], constraints, seed=0)), ['B0', 'B1', 'B2'])
+
+    def test_outdated_catalog(self):
+        sets = [mtgsdk.Set({'code': f'X{i}', 'name': f'Expansion {i}', 'type': 'expansion'}) for i in range(10)]
+        with mock.patch.object(format_chooser, 'get_catalog', side_effect=CatalogVersionError):
+            self.assertEqual(len(generate_format(4, sets, seed=0)), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
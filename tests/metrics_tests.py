@@ -0,0 +1,38 @@
+import asyncio
+import unittest
+
+from metrics import Metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_render(self):
+        metrics = Metrics()
+        metrics.observe('command_seconds', 0.003, command='rank')
+        metrics.observe('command_seconds', 0.2, command='rank')
+        metrics.increment('games_total', 2, outcome='confirmed')
+        lines = metrics.render().splitlines()
+        self.assertIn('games_total{outcome="confirmed"} 2', lines)
+        self.assertIn('command_seconds_bucket{command="rank",le="0.005"} 1', lines)
+        self.assertIn('command_seconds_bucket{command="rank",le="+Inf"} 2', lines)
+        self.assertIn('command_seconds_count{command="rank"} 2', lines)
+
+    def test_instrument(self):
+        metrics = Metrics()
+
+        @metrics.instrument('calls', call='sync')
+        def fail():
+            raise ValueError
+
+        @metrics.instrument('calls', call='async')
+        async def succeed():
+            return 1
+
+        with self.assertRaises(ValueError):
+            fail()
+        self.assertEqual(asyncio.run(succeed()), 1)
+        counts = {tuple(sorted(histogram['labels'].items())): histogram['count'] for histogram in metrics.snapshot()['histograms']}
+        self.assertEqual(counts, {(('call', 'sync'), ('outcome', 'error')): 1, (('call', 'async'), ('outcome', 'ok')): 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
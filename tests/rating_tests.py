@@ -0,0 +1,47 @@
+import unittest
+
+from rating_engine import Elo, GameRecord
+from standings import Standings, ordinal
+
+
+class RatingEngineTestCase(unittest.TestCase):
+    def test_elo(self):
+        elo = Elo()
+        submitter, opponent = elo.rate(1000, 1000, GameRecord('1', '2', 2, 1))
+        self.assertAlmostEqual(submitter, 1020)
+        self.assertAlmostEqual(opponent, 980)
+        self.assertAlmostEqual(sum(elo.rate(1200, 900, GameRecord('1', '2', 0, 1, 2))), 2100)
+
+    def test_replay(self):
+        games = [GameRecord('1', '2', 2, 0), GameRecord('2', '3', 1, 1, 1), GameRecord('3', '1', 2, 1)]
+        elo = Elo(k=20)
+        ratings, starting_ratings = elo.replay(games)
+        self.assertEqual(starting_ratings[0], (1000, 1000))
+        ratings_before, _ = elo.replay(games[:2])
+        self.assertEqual(starting_ratings[2], (ratings_before['3'], ratings_before['1']))
+        expected = dict(ratings_before)
+        expected['3'], expected['1'] = elo.rate(ratings_before['3'], ratings_before['1'], games[2])
+        self.assertEqual(ratings, expected)
+        self.assertAlmostEqual(sum(ratings.values()), 3000)
+
+
+class StandingsTestCase(unittest.TestCase):
+    def test_rank(self):
+        standings = Standings([('1', 1000), ('2', 1100), ('3', 900), ('4', 1000)])
+        self.assertEqual([standings.rank(player) for player in '1234'], [3, 1, 4, 2])
+        self.assertEqual(standings.top(2), [('2', 1100), ('4', 1000)])
+        self.assertAlmostEqual(standings.percentile('2'), 100)
+        self.assertAlmostEqual(standings.percentile('3'), 0)
+        standings.update('3', 1200)
+        standings.update(5, 950)
+        self.assertEqual([standings.rank(player) for player in '12345'], [4, 2, 1, 3, 5])
+        self.assertIsNone(standings.rank('6'))
+        self.assertEqual(len(standings), 5)
+
+    def test_ordinal(self):
+        self.assertEqual([ordinal(n) for n in (1, 2, 3, 4, 11, 12, 13, 21, 102, 111)],
+                         ['1st', '2nd', '3rd', '4th', '11th', '12th', '13th', '21st', '102nd', '111th'])
+
+
+if __name__ == '__main__':
+    unittest.main()
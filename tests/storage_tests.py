@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import types
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+# private_info.py holds the bot's token, so each user makes their own, see README.md. Every test here passes its own paths, so nothing is read from it
+try:
+    import private_info
+except ImportError:
+    sys.modules['private_info'] = types.SimpleNamespace(DB_PATH='')
+
+import storage
+
+GUILD_ID = 1234
+
+# a guild's database from before SCHEMA_VERSION 1, as the bot used to make them
+LEGACY_SCHEMA = (
+    "CREATE TABLE players(discord_id TEXT UNIQUE, name TEXT, discriminator TEXT, registration_date TEXT, rating INT DEFAULT 1000, last_game TEXT DEFAULT null)",
+    "CREATE TABLE seasons(season_number INTEGER PRIMARY KEY, month TEXT, year INT, set_names TEXT, set_codes TEXT, winner TEXT DEFAULT null)",
+    "CREATE TABLE leaderboard_January_2022(discord_id, rating, name)",
+)
+
+# storage.SCHEMA as it was at version 1, which MIGRATIONS brings up to date one version at a time
+SCHEMA_V1 = (
+    "CREATE TABLE players(guild_id INTEGER, discord_id TEXT, name TEXT, discriminator TEXT, registration_date TEXT, rating INT DEFAULT 1000, "
+    "last_game TEXT DEFAULT null, PRIMARY KEY (guild_id, discord_id))",
+    "CREATE TABLE seasons(guild_id INTEGER, season_number INTEGER, month TEXT, year INT, set_names TEXT, set_codes TEXT, winner TEXT DEFAULT null, "
+    "PRIMARY KEY (guild_id, season_number))",
+    "CREATE TABLE leaderboards(guild_id INTEGER, season_number INTEGER, place INTEGER, discord_id TEXT, rating INT, name TEXT, "
+    "PRIMARY KEY (guild_id, season_number, place)) WITHOUT ROWID",
+    "CREATE TABLE legality_indexes(guild_id INTEGER, season_number INTEGER, catalog_built TEXT, PRIMARY KEY (guild_id, season_number))",
+    "CREATE TABLE legal_cards(guild_id INTEGER, season_number INTEGER, card_name TEXT, PRIMARY KEY (guild_id, season_number, card_name)) WITHOUT ROWID",
+    "CREATE TABLE games(game_id INTEGER PRIMARY KEY, guild_id INTEGER, season_number INTEGER, date TEXT, submitter_id TEXT, opponent_id TEXT, "
+    "submitter_games_won INT, opponent_games_won INT, ties INT DEFAULT 0, submitter_rating REAL, opponent_rating REAL)",
+    "CREATE INDEX games_by_season ON games(guild_id, season_number, game_id)",
+    "CREATE INDEX games_by_submitter ON games(guild_id, submitter_id, season_number)",
+    "CREATE INDEX games_by_opponent ON games(guild_id, opponent_id, season_number)",
+    "CREATE TABLE pending_games(game_id INTEGER PRIMARY KEY, guild_id INTEGER, submitter_id TEXT, opponent_id TEXT, submitter_games_won INT, "
+    "opponent_games_won INT, ties INT DEFAULT 0, expires TEXT, opponent_channel_id INT DEFAULT null, opponent_message_id INT DEFAULT null, "
+    "submitter_token TEXT DEFAULT null, submitter_message_id INT DEFAULT null)",
+    "CREATE INDEX pending_games_by_expiry ON pending_games(guild_id, expires)",
+    "CREATE TABLE rollovers(guild_id INTEGER, quarter TEXT, old_season_number INTEGER, new_season_number INTEGER, announced INT DEFAULT 0, "
+    "PRIMARY KEY (guild_id, quarter))",
+)
+
+
+def make_legacy_database(path: str):
+    con = sqlite3.connect(path)
+    with con:
+        for statement in LEGACY_SCHEMA:
+            con.execute(statement)
+        con.executemany("INSERT INTO players(discord_id, name, discriminator, registration_date, rating) VALUES (?, ?, '0001', '2022-01-01', ?)",
+                        [('1', 'alice', 1000), ('2', 'bob', 1000)])
+        con.executemany("INSERT INTO seasons(season_number, month, year, set_names, set_codes) VALUES (?, ?, 2022, ?, ?)",
+                        [(0, 'January', 'Alpha, Beta', 'AAA, BBB'), (1, 'April', 'Gamma', 'CCC')])
+        con.executemany("INSERT INTO leaderboard_January_2022(discord_id, rating, name) VALUES (?, ?, ?)", [('1', 990, 'alice'), ('2', 1010, 'bob')])
+    con.close()
+
+
+def columns(con: sqlite3.Connection) -> dict[str, list[str]]:
+    """Every table in the database, and its columns"""
+    tables = [row[0] for row in con.execute("SELECT name FROM sqlite_schema WHERE type='table' ORDER BY name")]
+    return {table: [row[1] for row in con.execute(f"PRAGMA table_info({table})")] for table in tables}
+
+
+class SchemaTestCase(unittest.TestCase):
+    def test_new_database(self):
+        con = sqlite3.connect(':memory:')
+        storage.ensure_schema(con)
+        self.assertEqual(con.execute("PRAGMA user_version").fetchone()[0], storage.SCHEMA_VERSION)
+        storage.ensure_schema(con)  # already up to date, so nothing is created twice
+
+    def test_migrations(self):
+        new = sqlite3.connect(':memory:')
+        storage.ensure_schema(new)
+        for version in range(1, storage.SCHEMA_VERSION):
+            with self.subTest(version=version):
+                con = sqlite3.connect(':memory:')
+                with con:
+                    for statement in SCHEMA_V1:
+                        con.execute(statement)
+                    con.executemany("INSERT INTO seasons(guild_id, season_number, month, year, set_names, set_codes) VALUES (?, ?, 'January', 2022, ?, ?)",
+                                    [(GUILD_ID, 0, 'Alpha, Beta', 'AAA, BBB'), (GUILD_ID, 1, 'Gamma', 'CCC')])
+                    con.execute("INSERT INTO leaderboards VALUES (?, 0, 1, '2', 1010, 'bob')", [GUILD_ID])
+                    con.execute("INSERT INTO games(guild_id, season_number, submitter_id, opponent_id, submitter_games_won, opponent_games_won) "
+                                "VALUES (?, 0, '2', '1', 2, 0)", [GUILD_ID])
+                    # brought up to version by the same migrations that ensure_schema runs
+                    for statement in [statement for next_version in range(2, version + 1) for statement in storage.MIGRATIONS[next_version]]:
+                        if callable(statement):
+                            statement(con)
+                        else:
+                            con.execute(statement)
+                    con.execute(f"PRAGMA user_version={version}")
+                with con:
+                    storage.ensure_schema(con)
+                self.assertEqual(con.execute("PRAGMA user_version").fetchone()[0], storage.SCHEMA_VERSION)
+                self.assertEqual(columns(con), columns(new))
+                self.assertEqual(con.execute("SELECT season_number, position, set_code, set_name FROM season_sets ORDER BY season_number, position").fetchall(),
+                                 [(0, 0, 'AAA', 'Alpha'), (0, 1, 'BBB', 'Beta'), (1, 0, 'CCC', 'Gamma')])
+                self.assertEqual(con.execute("SELECT discord_id, matches, match_wins FROM season_standings WHERE season_number=0").fetchall(), [('2', 1, 1)])
+                self.assertEqual(con.execute("SELECT winner FROM seasons WHERE season_number=0").fetchone()[0], '2')
+
+
+class LegacyDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, '')
+        self.legacy_path = storage.legacy_database_path(GUILD_ID, self.db_path)
+        make_legacy_database(self.legacy_path)
+
+    def check_migrated(self, consolidated: bool):
+        path = storage.database_path(GUILD_ID, self.db_path, consolidated)
+        self.assertFalse(storage.is_legacy_database(path))
+        self.assertTrue(os.path.exists(storage.archived_database_path(self.legacy_path)))
+        self.assertFalse(os.path.exists(storage.migrating_database_path(self.legacy_path)))
+        con = sqlite3.connect(path)
+        try:
+            self.assertEqual(con.execute("PRAGMA user_version").fetchone()[0], storage.SCHEMA_VERSION)
+            self.assertEqual(con.execute("SELECT discord_id, rating FROM players WHERE guild_id=? ORDER BY discord_id", [GUILD_ID]).fetchall(),
+                             [('1', 1000), ('2', 1000)])
+            self.assertEqual(con.execute("SELECT set_code FROM season_sets WHERE guild_id=? ORDER BY season_number, position", [GUILD_ID]).fetchall(),
+                             [('AAA',), ('BBB',), ('CCC',)])
+            self.assertEqual(con.execute("SELECT place, discord_id FROM season_standings WHERE guild_id=? AND season_number=0 ORDER BY place",
+                                         [GUILD_ID]).fetchall(), [(1, '2'), (2, '1')])
+            # the imported leaderboard has no games behind it, but its 1st place still won the season
+            self.assertEqual(con.execute("SELECT winner FROM seasons WHERE guild_id=? AND season_number=0", [GUILD_ID]).fetchone()[0], '2')
+            self.assertEqual(con.execute("SELECT COUNT(*) FROM rollovers WHERE guild_id=?", [GUILD_ID]).fetchone()[0], 1)
+        finally:
+            con.close()
+
+    def test_upgrade(self):
+        self.assertEqual(storage.upgrade_legacy_database(GUILD_ID, self.db_path, consolidated=False), 2)
+        self.check_migrated(consolidated=False)
+        # once migrated there's nothing left to do
+        self.assertIsNone(storage.upgrade_legacy_database(GUILD_ID, self.db_path, consolidated=False))
+
+    def test_upgrade_consolidated(self):
+        self.assertEqual(storage.upgrade_legacy_database(GUILD_ID, self.db_path, consolidated=True), 2)
+        self.check_migrated(consolidated=True)
+        self.assertIsNone(storage.upgrade_legacy_database(GUILD_ID, self.db_path, consolidated=True))
+
+    def test_interrupted_before_copying(self):
+        storage.archive_legacy_database(self.legacy_path)
+        self.assertEqual(storage.upgrade_legacy_database(GUILD_ID, self.db_path), 2)
+        self.check_migrated(consolidated=False)
+
+    def test_interrupted_after_copying(self):
+        migrating_path = storage.archive_legacy_database(self.legacy_path)
+        storage.migrate_legacy_database(migrating_path, storage.database_path(GUILD_ID, self.db_path, False), GUILD_ID)
+        # the rows are already there, so running it again only archives the legacy file
+        self.assertEqual(storage.upgrade_legacy_database(GUILD_ID, self.db_path), 0)
+        self.check_migrated(consolidated=False)
+
+    def test_concurrent_upgrades(self):
+        # as on the first start with a consolidated database, when every guild is migrated into the new Randard.db at once
+        guild_ids = range(GUILD_ID, GUILD_ID + 10)
+        for guild_id in guild_ids[1:]:
+            make_legacy_database(storage.legacy_database_path(guild_id, self.db_path))
+        with ThreadPoolExecutor(len(guild_ids)) as executor:
+            players = list(executor.map(lambda guild_id: storage.upgrade_legacy_database(guild_id, self.db_path, consolidated=True), guild_ids))
+        self.assertEqual(players, [2] * len(guild_ids))
+        self.check_migrated(consolidated=True)
+        con = sqlite3.connect(storage.database_path(GUILD_ID, self.db_path, consolidated=True))
+        try:
+            self.assertEqual(con.execute("SELECT COUNT(DISTINCT guild_id) FROM seasons").fetchone()[0], len(guild_ids))
+        finally:
+            con.close()
+
+
+if __name__ == '__main__':
+    unittest.main()